@@ -0,0 +1,103 @@
+"""
+Benchmark: micro-batched inference vs. the one-request-per-predict path.
+
+Simulates N concurrent add_comment threads, each classifying M comments, and
+reports throughput plus the batcher's batch-size / queue-wait metrics.
+
+Run from backend/:
+    python -m benchmarks.bench_batching                 # synthetic model
+    python -m benchmarks.bench_batching --keras         # untrained Bi-LSTM (needs TF)
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from myapp.ml.batching import InferenceBatcher, pad_batch, scores_from_prediction
+
+MAXLEN = 100
+
+
+def synthetic_predict(overhead_ms: float, per_row_us: float):
+    """Model stand-in with a fixed per-call cost plus a per-row cost."""
+    def predict(padded):
+        time.sleep(overhead_ms / 1000.0 + per_row_us * len(padded) / 1e6)
+        return np.full((len(padded), 1), 0.25, dtype=np.float32)
+    return predict
+
+
+def keras_predict():
+    import tensorflow as tf
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(MAXLEN,)),
+        tf.keras.layers.Embedding(2000, 64),
+        tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(64)),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+    model.predict(np.zeros((1, MAXLEN), dtype=np.int32), verbose=0)
+    return lambda padded: model.predict(padded, verbose=0)
+
+
+def make_sequences(n: int):
+    rng = random.Random(0)
+    return [[rng.randrange(1, 2000) for _ in range(rng.randint(3, 15))] for _ in range(n)]
+
+
+def run_clients(classify, sequences, threads: int) -> float:
+    chunks = [sequences[i::threads] for i in range(threads)]
+
+    def client(chunk):
+        for seq in chunk:
+            classify(seq)
+
+    workers = [threading.Thread(target=client, args=(c,)) for c in chunks]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--overhead-ms', type=float, default=2.0, help='synthetic per-call cost')
+    parser.add_argument('--per-row-us', type=float, default=20.0, help='synthetic per-row cost')
+    parser.add_argument('--keras', action='store_true', help='use a real (untrained) Keras Bi-LSTM')
+    args = parser.parse_args()
+
+    predict = keras_predict() if args.keras else synthetic_predict(args.overhead_ms, args.per_row_us)
+    sequences = make_sequences(args.requests)
+
+    # The pre-batching path serialises model calls behind the GIL / model lock.
+    lock = threading.Lock()
+
+    def one_at_a_time(seq):
+        with lock:
+            return float(scores_from_prediction(predict(pad_batch([seq], MAXLEN)), 1)[0])
+
+    elapsed = run_clients(one_at_a_time, sequences, args.threads)
+    print(f"one-at-a-time : {args.requests / elapsed:10.1f} req/s  ({elapsed:.2f}s)")
+
+    batcher = InferenceBatcher(predict, max_batch_size=args.max_batch_size,
+                               max_wait_ms=args.max_wait_ms, maxlen=MAXLEN)
+    elapsed = run_clients(batcher.score, sequences, args.threads)
+    batcher.close()
+    print(f"micro-batched : {args.requests / elapsed:10.1f} req/s  ({elapsed:.2f}s)")
+
+    stats = batcher.stats.snapshot()
+    print(f"  batches={stats['batches']} mean_batch_size={stats['mean_batch_size']:.1f} "
+          f"mean_queue_wait_ms={stats['mean_queue_wait_ms']:.2f} max_queue_wait_ms={stats['max_queue_wait_ms']:.2f}")
+    print(f"  queue wait histogram (ms): {stats['queue_wait_buckets_ms']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: length-bucketed dynamic padding vs. fixed padding to 100 tokens.
+
+Comment lengths are drawn from a log-normal distribution (median ~7 tokens,
+long tail up to 100), which is what chat comments look like. For each batch
+size the script checks that both paths give the same scores and reports
+per-batch latency and throughput.
+
+Run from backend/:
+    python -m benchmarks.bench_bucketing              # NumPy engine
+    python -m benchmarks.bench_bucketing --keras      # also time the Keras model (needs TensorFlow)
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from myapp.ml.bucketing import DEFAULT_BUCKETS, predict_bucketed
+from myapp.ml.numpy_engine import NumpyBiLSTM
+from myapp.ml.preprocessing import pad_post
+
+MAXLEN = 100
+
+
+def realistic_sequences(n: int, rng):
+    lengths = np.clip(rng.lognormal(mean=2.0, sigma=0.7, size=n).astype(int), 1, MAXLEN)
+    return [list(rng.integers(1, 2000, size=int(length))) for length in lengths]
+
+
+def build_models(rng, keras: bool):
+    """A masked random Bi-LSTM for the NumPy engine, plus the Keras original with --keras."""
+    models = {}
+    if keras:
+        import tensorflow as tf
+        from myapp.ml.numpy_engine import export_weights
+        keras_model = tf.keras.Sequential([
+            tf.keras.Input(shape=(None,)),
+            tf.keras.layers.Embedding(2000, 64, mask_zero=True),
+            tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(64)),
+            tf.keras.layers.Dense(64, activation='relu'),
+            tf.keras.layers.Dense(1, activation='sigmoid'),
+        ])
+        path = os.path.join(tempfile.mkdtemp(), 'model.npz')
+        export_weights(keras_model, path)
+        models['keras'] = lambda padded: keras_model(padded, training=False).numpy()
+        numpy_model = NumpyBiLSTM.load(path)
+    else:
+        arrays = {'embedding': rng.normal(size=(2000, 64)).astype('float32')}
+        for d in ('fw', 'bw'):
+            arrays[f'lstm_{d}_kernel'] = rng.normal(scale=0.1, size=(64, 256)).astype('float32')
+            arrays[f'lstm_{d}_recurrent_kernel'] = rng.normal(scale=0.1, size=(64, 256)).astype('float32')
+            arrays[f'lstm_{d}_bias'] = np.zeros(256, dtype='float32')
+        arrays['dense_0_kernel'] = rng.normal(scale=0.1, size=(128, 1)).astype('float32')
+        arrays['dense_0_bias'] = np.zeros(1, dtype='float32')
+        numpy_model = NumpyBiLSTM(arrays, {'format_version': 1, 'mask_zero': True,
+                                           'dense_activations': ['sigmoid']})
+    models['numpy'] = numpy_model.predict
+    return models
+
+
+def time_batches(fn, batches, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for batch in batches:
+            fn(batch)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=4096)
+    parser.add_argument('--batch-sizes', default='1,32,256')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--keras', action='store_true', help="also benchmark the Keras model")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sequences = realistic_sequences(args.comments, rng)
+    lengths = [len(s) for s in sequences]
+    print(f"{args.comments} comments, length p50={int(np.median(lengths))} "
+          f"p90={int(np.percentile(lengths, 90))} max={max(lengths)}; buckets={DEFAULT_BUCKETS}")
+
+    for name, predict in build_models(rng, args.keras).items():
+        def fixed(batch, predict=predict):
+            return np.asarray(predict(pad_post(batch, MAXLEN))).reshape(len(batch), -1)[:, 0]
+
+        def bucketed(batch, predict=predict):
+            return predict_bucketed(batch, predict, DEFAULT_BUCKETS, MAXLEN)
+
+        for bs in (int(b) for b in args.batch_sizes.split(',')):
+            batches = [sequences[i:i + bs] for i in range(0, len(sequences), bs)]
+            if bs == 1:
+                batches = batches[:64 if name == 'keras' else 256]
+            diff = max(float(np.abs(fixed(b) - bucketed(b)).max()) for b in batches[:8])
+            fixed_s = time_batches(fixed, batches, args.repeat)
+            bucket_s = time_batches(bucketed, batches, args.repeat)
+            rows = sum(len(b) for b in batches)
+            print(f"{name:5s} bs={bs:<4d} fixed-100: {fixed_s / len(batches) * 1000:8.2f} ms/batch "
+                  f"{rows / fixed_s:9.0f} rows/s | bucketed: {bucket_s / len(batches) * 1000:8.2f} ms/batch "
+                  f"{rows / bucket_s:9.0f} rows/s | speedup {fixed_s / bucket_s:5.2f}x | max |diff| {diff:.1e}")
+
+
+if __name__ == '__main__':
+    main()
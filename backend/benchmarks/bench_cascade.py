@@ -0,0 +1,102 @@
+"""
+Benchmark: lexicon cascade vs. running every comment through the model.
+
+Reports the share of traffic the lexicon decides on its own, how often those
+decisions agree with the full model, and the end-to-end time of both paths.
+
+Run from backend/:
+    python -m benchmarks.bench_cascade --data static/cyberbullying_tweets.csv
+    python -m benchmarks.bench_cascade --random-model     # smoke test without trained artifacts
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from myapp.ml.cascade import CascadeClassifier
+from myapp.ml.preprocessing import TextVectorizer
+from myapp.ml.registry import ModelRegistry
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_texts(args):
+    if args.data:
+        import pandas as pd
+        return pd.read_csv(args.data)[args.column].astype(str).tolist()[:args.limit]
+    # Synthetic traffic built from the vocabulary and the lexicon itself
+    rng = random.Random(0)
+    vocab = list(TextVectorizer.from_file(os.path.join(BACKEND_DIR, 'myapp', 'tokenizer.json')).word_index)
+    vocab += ["lol", "great", "game", "today", "weekend", "love", "this", "so", "much"]
+    return [' '.join(rng.choices(vocab, k=rng.randint(2, 12))) for _ in range(args.limit)]
+
+
+def random_model_dir():
+    """Random-weights NumPy artifact with the committed tokenizer (smoke testing only)."""
+    import json
+    import shutil
+    tmp = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    arrays = {'embedding': rng.normal(size=(2000, 64)).astype('float32')}
+    for d in ('fw', 'bw'):
+        arrays[f'lstm_{d}_kernel'] = rng.normal(scale=0.1, size=(64, 256)).astype('float32')
+        arrays[f'lstm_{d}_recurrent_kernel'] = rng.normal(scale=0.1, size=(64, 256)).astype('float32')
+        arrays[f'lstm_{d}_bias'] = np.zeros(256, dtype='float32')
+    arrays['dense_0_kernel'] = rng.normal(scale=0.1, size=(128, 1)).astype('float32')
+    arrays['dense_0_bias'] = np.zeros(1, dtype='float32')
+    meta = {'format_version': 1, 'mask_zero': True, 'dense_activations': ['sigmoid']}
+    np.savez(os.path.join(tmp, 'cyberbullying_model.npz'), meta=np.array(json.dumps(meta)), **arrays)
+    shutil.copy(os.path.join(BACKEND_DIR, 'myapp', 'tokenizer.json'), tmp)
+    return tmp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', help="CSV with comments (default: synthetic)")
+    parser.add_argument('--column', default='tweet_text')
+    parser.add_argument('--limit', type=int, default=20000)
+    parser.add_argument('--model-dir', default=os.path.join(BACKEND_DIR, 'myapp', 'models'))
+    parser.add_argument('--random-model', action='store_true')
+    parser.add_argument('--lexicon', default=os.path.join(BACKEND_DIR, 'myapp', 'lexicon.json'))
+    parser.add_argument('--block-threshold', type=float, default=0.9)
+    args = parser.parse_args()
+
+    model_dir = random_model_dir() if args.random_model else args.model_dir
+    cascade = CascadeClassifier.from_file(args.lexicon, block_threshold=args.block_threshold)
+    full = ModelRegistry(model_dir, batching=False)
+    cascaded = ModelRegistry(model_dir, batching=False, cascade=cascade)
+    for registry in (full, cascaded):
+        registry.load()
+        if not registry.ready:
+            raise SystemExit(f"Model not available ({registry.error}); pass --random-model for a smoke run")
+
+    texts = load_texts(args)
+
+    started = time.perf_counter()
+    reference = full.classify_texts(texts)
+    full_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    decisions = cascaded.classify_texts(texts)
+    cascade_s = time.perf_counter() - started
+
+    lexicon = [(d, r) for d, r in zip(decisions, reference) if d.stage == 'lexicon']
+    bullying = sum(1 for d, _ in lexicon if d.label == "Bullying Words")
+    agree = sum(1 for d, r in lexicon if d.label == r.label)
+    total_agree = sum(1 for d, r in zip(decisions, reference) if d.label == r.label)
+
+    n = len(texts)
+    print(f"comments               : {n}")
+    print(f"short-circuited        : {len(lexicon) / n:6.1%}  ({bullying} bullying, {len(lexicon) - bullying} clean)")
+    print(f"lexicon/model agreement: {agree / len(lexicon) if lexicon else 1.0:6.1%}  on short-circuited comments")
+    print(f"overall agreement      : {total_agree / n:6.1%}")
+    print(f"model only             : {full_s:7.3f}s  ({n / full_s:10.0f} comments/s)")
+    print(f"cascade + model        : {cascade_s:7.3f}s  ({n / cascade_s:10.0f} comments/s)")
+
+
+if __name__ == '__main__':
+    main()
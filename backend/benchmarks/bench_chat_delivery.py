@@ -0,0 +1,135 @@
+"""
+Load test: chat delivery by fixed-interval polling vs. long-polling.
+
+N clients each have a conversation open. One sender thread posts messages to
+random clients through chat_send at a fixed rate. In ``poll`` mode every client
+calls chat_view_and with its since_id every --interval seconds, as the Flutter
+chat screen does. In ``longpoll`` mode every client keeps one chat_poll request
+open. The views are called in-process (RequestFactory) against a throwaway
+SQLite database, so the numbers are server-side work only: the database query
+rate and the send-to-receive latency.
+
+Run from backend/:
+    python -m benchmarks.bench_chat_delivery --clients 200 --seconds 10
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cyber.settings')
+
+
+def setup_database():
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run(mode: str, args, logins, counter):
+    import json
+    from django.db import connection
+    from django.test import RequestFactory
+    from myapp import views
+    from myapp.models import Chat
+
+    factory = RequestFactory()
+    stop = threading.Event()
+    latencies = []
+    lock = threading.Lock()
+
+    # only messages sent during this run count
+    start_id = Chat.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def client(me, partner):
+        since = start_id
+        with connection.execute_wrapper(counter):
+            while not stop.is_set():
+                params = {'from_id': me, 'to_id': partner, 'since_id': since}
+                if mode == 'poll':
+                    body = json.loads(views.chat_view_and(factory.post('/', params)).content)
+                else:
+                    params['timeout'] = args.timeout
+                    body = json.loads(views.chat_poll(factory.post('/', params)).content)
+                now = time.perf_counter()
+                with lock:
+                    latencies.extend(now - float(m['msg']) for m in body['data'] if m['to'] == me)
+                since = body['last_id']
+                if mode == 'poll':
+                    stop.wait(args.interval)
+        connection.close()
+
+    def sender():
+        rng = random.Random(0)
+        with connection.execute_wrapper(counter):
+            while not stop.is_set():
+                me, partner = rng.choice(logins)
+                views.chat_send(factory.post('/', {'from_id': partner, 'to_id': me,
+                                                   'message': repr(time.perf_counter())}))
+                stop.wait(1.0 / args.rate)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=pair, daemon=True) for pair in logins]
+    threads.append(threading.Thread(target=sender, daemon=True))
+    counter.count = 0
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    queries = counter.count
+    stop.set()
+    for t in threads:
+        t.join(timeout=0.1)   # parked long-polls are daemon threads; no need to wait them out
+
+    lat = np.array(latencies) * 1000
+    print(f"{mode:8s} clients={len(logins):<4d} queries/s {queries / args.seconds:8.1f}  "
+          f"delivered {len(lat):5d}  latency p50 {np.percentile(lat, 50) if len(lat) else 0:7.1f} ms  "
+          f"p95 {np.percentile(lat, 95) if len(lat) else 0:7.1f} ms  max {lat.max() if len(lat) else 0:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=1.0, help="polling interval of the poll mode")
+    parser.add_argument('--rate', type=float, default=20, help="messages sent per second")
+    parser.add_argument('--timeout', type=float, default=25, help="long-poll timeout")
+    parser.add_argument('--modes', default='poll,longpoll')
+    args = parser.parse_args()
+
+    setup_database()
+    from myapp.models import Login
+    Login.objects.bulk_create(
+        [Login(username=f"user{i}@example.com", password="x") for i in range(2 * args.clients)])
+    ids = [u.id for u in Login.objects.order_by('id')]
+    logins = list(zip(ids[::2], ids[1::2]))
+
+    counter = QueryCounter()
+    for mode in args.modes.split(','):
+        run(mode, args, logins, counter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark: materialized home feeds (myapp/feed.py) vs. building the feed at
+read time.
+
+Builds a throwaway SQLite database with --users profiles and a power-law
+friendship graph: most users have a handful of friends, a few have thousands.
+A fraction of the users (--active) have their feed cached. Then, for each
+fan-out limit:
+
+- write: --posts new posts by random authors are fanned out. The script
+  reports feed writes per post (write amplification) and fan-out latency.
+- read: first pages for a sample of active users, served from the
+  materialized feed. This is compared with the read-time query (friend lookup
+  plus a page of the friends' posts) and with a cold rebuild.
+
+Run from backend/:
+    python -m benchmarks.bench_feed --users 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cyber.settings')
+
+
+def setup_database():
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    settings.CACHES['bench_feeds'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                      'LOCATION': 'bench_feeds', 'OPTIONS': {'MAX_ENTRIES': 10 ** 7}}
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+
+def populate(args, rng):
+    from myapp.models import FriendRequest, Login, Post, UserProfile
+    Login.objects.bulk_create([Login(username=f"u{i}@example.com", password="x") for i in range(args.users)],
+                              batch_size=5000)
+    logins = list(Login.objects.order_by('id').values_list('id', flat=True))
+    UserProfile.objects.bulk_create([UserProfile(login_id=lid, name=f"user {i}", email=f"u{i}@example.com")
+                                     for i, lid in enumerate(logins)], batch_size=5000)
+    profiles = np.array(UserProfile.objects.order_by('id').values_list('id', flat=True))
+
+    # preferential targets: popularity is Pareto-distributed, so friend counts are heavy-tailed
+    popularity = rng.pareto(1.1, size=len(profiles)) + 1
+    n_edges = len(profiles) * args.avg_friends // 2
+    src = rng.integers(0, len(profiles), size=n_edges)
+    dst = rng.choice(len(profiles), size=n_edges, p=popularity / popularity.sum())
+    pairs = {(min(a, b), max(a, b)) for a, b in zip(src.tolist(), dst.tolist()) if a != b}
+    FriendRequest.objects.bulk_create(
+        [FriendRequest(from_user_id=profiles[a], to_user_id=profiles[b], status='accepted') for a, b in pairs],
+        batch_size=5000)
+
+    authors = rng.choice(profiles, size=args.history)
+    Post.objects.bulk_create([Post(user_id=a, desc="old post") for a in authors.tolist()], batch_size=5000)
+
+    degree = np.bincount([i for pair in pairs for i in pair], minlength=len(profiles))
+    print(f"{len(profiles)} users, {len(pairs)} friendships (median {np.median(degree):.0f} friends, "
+          f"p99 {np.percentile(degree, 99):.0f}, max {degree.max()}), {args.history} existing posts")
+    return profiles
+
+
+def percentiles(times):
+    return np.percentile(np.array(times) * 1000, [50, 95])
+
+
+def read_time_page(store, profile_id, page_size):
+    """The feed without materialization: friend lookup plus one page query."""
+    from myapp.models import Post
+    authors = list(store.friends(profile_id) | {profile_id})
+    return list(Post.objects.filter(user_id__in=authors).order_by('-id').values_list('id', flat=True)[:page_size])
+
+
+def run(limit, args, profiles, rng):
+    from django.core.cache import caches
+    from myapp.feed import FeedStore
+    from myapp.models import Post
+
+    cache = caches['bench_feeds']
+    cache.clear()
+    store = FeedStore(cache, max_length=args.max_length, fanout_limit=limit)
+    active = rng.choice(profiles, size=int(len(profiles) * args.active), replace=False).tolist()
+
+    started = time.perf_counter()
+    build_times = []
+    for pid in active:
+        t = time.perf_counter()
+        store.build(pid)
+        build_times.append(time.perf_counter() - t)
+    warm = time.perf_counter() - started
+
+    authors = rng.choice(profiles, size=args.posts).tolist()
+    posts = Post.objects.bulk_create([Post(user_id=a, desc="new post") for a in authors])
+    fan_times = []
+    for post in posts:
+        t = time.perf_counter()
+        store.fan_out(post.id, post.user_id)
+        fan_times.append(time.perf_counter() - t)
+
+    sample = active[:args.sample]
+    cached_times, pull_times = [], []
+    for pid in sample:
+        t = time.perf_counter()
+        store.page(pid, page_size=args.page_size)
+        cached_times.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        read_time_page(store, pid, args.page_size)
+        pull_times.append(time.perf_counter() - t)
+
+    s = store.stats
+    print(f"fan-out limit {limit}:")
+    print(f"  warm {len(active)} feeds in {warm:.1f}s, cold build p50 {percentiles(build_times)[0]:.2f} ms "
+          f"p95 {percentiles(build_times)[1]:.2f} ms")
+    print(f"  write: {s['fanout_targets'] / args.posts:6.1f} targets/post, "
+          f"{s['feed_writes'] / args.posts:6.1f} feed writes/post (cached feeds only), "
+          f"fan-out p50 {percentiles(fan_times)[0]:.2f} ms p95 {percentiles(fan_times)[1]:.2f} ms, "
+          f"max {max(fan_times) * 1000:.1f} ms")
+    print(f"  read:  materialized p50 {percentiles(cached_times)[0]:.3f} ms p95 {percentiles(cached_times)[1]:.3f} ms"
+          f"  |  read-time query p50 {percentiles(pull_times)[0]:.3f} ms p95 {percentiles(pull_times)[1]:.3f} ms"
+          f"  ({s['db_pages']} of {len(sample)} pages also queried pull authors)")
+    Post.objects.filter(id__in=[p.id for p in posts]).delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--avg-friends', type=int, default=10)
+    parser.add_argument('--history', type=int, default=200000, help="posts created before the run")
+    parser.add_argument('--active', type=float, default=0.1, help="fraction of users with a cached feed")
+    parser.add_argument('--posts', type=int, default=2000, help="new posts fanned out per run")
+    parser.add_argument('--sample', type=int, default=2000, help="feed reads timed per run")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--max-length', type=int, default=500)
+    parser.add_argument('--fanout-limits', default='1000000,1000,100')
+    args = parser.parse_args()
+
+    setup_database()
+    rng = np.random.default_rng(0)
+    profiles = populate(args, rng)
+    for limit in (int(x) for x in args.fanout_limits.split(',')):
+        run(limit, args, profiles, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: user_viewprofile requests/sec with and without the profile JSON
+cache (myapp/profiles.py).
+
+Creates --users profiles in a throwaway SQLite database and replays
+--requests profile reads. Callers are drawn from a Zipf distribution, so a
+few active users account for most reads, as in the app. Requests carry
+bearer tokens and are built up front, so the timings cover the view only:
+token check, cache or database, serialization. The same workload runs with
+the cache disabled, then with it enabled (starting cold).
+
+Run from backend/:
+    python -m benchmarks.bench_profile_cache --users 10000 --requests 50000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cyber.settings')
+
+
+def setup_database():
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def run(label, args, callers, tokens_by_login):
+    from django.db import connection
+    from django.test import RequestFactory
+    from myapp.views import user_viewprofile
+
+    factory = RequestFactory()
+    requests = [factory.post('/myapp/user_viewprofile/', {},
+                             headers={'Authorization': f'Bearer {tokens_by_login[lid]}'}) for lid in callers]
+
+    def work(chunk):
+        for request in chunk:
+            user_viewprofile(request)
+        connection.close()
+
+    chunks = [requests[i::args.threads] for i in range(args.threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(work, chunks))
+    elapsed = time.perf_counter() - started
+    print(f"{label:18s} threads={args.threads}  {len(requests) / elapsed:9.0f} req/s  "
+          f"({elapsed * 1e6 / len(requests):6.1f} us/request)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--zipf', type=float, default=1.2, help="skew of the caller distribution")
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_database()
+    from django.conf import settings
+    from myapp.models import Login, UserProfile
+    from myapp.profiles import get_json_cache
+    from myapp.tokens import issue_token
+
+    Login.objects.bulk_create([Login(username=f"u{i}@example.com", password="x", type='user')
+                               for i in range(args.users)], batch_size=5000)
+    UserProfile.objects.bulk_create(
+        [UserProfile(login_id=lid, name=f"user {lid}", email=f"u{lid}@example.com", place="Kochi",
+                     district="Ernakulam", state="Kerala", pin="682001")
+         for lid in Login.objects.values_list('id', flat=True)], batch_size=5000)
+    tokens_by_login = {lid: issue_token(lid, pid, 'user')
+                       for pid, lid in UserProfile.objects.values_list('id', 'login_id')}
+    logins = sorted(tokens_by_login)
+    ranks = np.random.default_rng(0).zipf(args.zipf, size=args.requests) % len(logins)
+    callers = [logins[r] for r in ranks]
+    print(f"{args.users} users, {args.requests} reads by {len(set(callers))} distinct callers")
+
+    settings.PROFILE_JSON_CACHE_ENABLED = False
+    run("no cache", args, callers, tokens_by_login)
+    settings.PROFILE_JSON_CACHE_ENABLED = True
+    run("json cache (cold)", args, callers, tokens_by_login)
+    run("json cache (warm)", args, callers, tokens_by_login)
+    print(get_json_cache().stats())
+
+
+if __name__ == '__main__':
+    main()
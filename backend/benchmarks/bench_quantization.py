@@ -0,0 +1,91 @@
+"""
+Benchmark: float32 vs. float16 / int8 variants of the NumPy Bi-LSTM on CPU.
+
+For batch sizes 1, 32 and 256 the script reports per-batch latency (p50 / p95)
+and throughput. It also reports three memory figures: runtime weight memory,
+the peak extra memory one predict call allocates (tracemalloc), and the size
+of the archive on disk. Inputs are comment-length sequences (median ~7
+tokens) padded to 100.
+
+Run from backend/:
+    python -m benchmarks.bench_quantization --model myapp/models/cyberbullying_model.npz
+    python -m benchmarks.bench_quantization          # random weights, production shapes
+"""
+
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from myapp.ml.numpy_engine import NumpyBiLSTM
+from myapp.ml.preprocessing import pad_post
+from myapp.ml.quantize import VARIANTS, load_archive, quantize_arrays
+
+MAXLEN = 100
+
+
+def random_archive(rng, vocab=2000, dim=64, units=64):
+    arrays = {'embedding': rng.normal(scale=0.5, size=(vocab, dim)).astype('float32')}
+    for d in ('fw', 'bw'):
+        arrays[f'lstm_{d}_kernel'] = rng.normal(scale=0.1, size=(dim, 4 * units)).astype('float32')
+        arrays[f'lstm_{d}_recurrent_kernel'] = rng.normal(scale=0.1, size=(units, 4 * units)).astype('float32')
+        arrays[f'lstm_{d}_bias'] = np.zeros(4 * units, dtype='float32')
+    arrays['dense_0_kernel'] = rng.normal(scale=0.1, size=(2 * units, 64)).astype('float32')
+    arrays['dense_0_bias'] = np.zeros(64, dtype='float32')
+    arrays['dense_1_kernel'] = rng.normal(scale=0.1, size=(64, 1)).astype('float32')
+    arrays['dense_1_bias'] = np.zeros(1, dtype='float32')
+    return arrays, {'format_version': 1, 'mask_zero': True, 'dense_activations': ['relu', 'sigmoid']}
+
+
+def archive_bytes(arrays, meta) -> int:
+    buf = io.BytesIO()
+    np.savez(buf, meta=np.array(json.dumps(meta)), **arrays)
+    return buf.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help="float32 .npz (default: random weights)")
+    parser.add_argument('--batch-sizes', default='1,32,256')
+    parser.add_argument('--batches', type=int, default=50, help="timed batches per batch size")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    arrays, meta = load_archive(args.model) if args.model else random_archive(rng)
+    vocab = arrays['embedding'].shape[0]
+    variants = {'float32': (arrays, meta)}
+    variants.update({v: quantize_arrays(arrays, meta, v) for v in VARIANTS})
+    models = {name: NumpyBiLSTM(*archive) for name, archive in variants.items()}
+
+    print(f"{'variant':8s} {'weights':>9s} {'on disk':>9s}")
+    for name, archive in variants.items():
+        print(f"{name:8s} {models[name].weight_bytes / 1e6:7.2f}MB {archive_bytes(*archive) / 1e6:7.2f}MB")
+    print()
+
+    for bs in (int(b) for b in args.batch_sizes.split(',')):
+        lengths = np.clip(rng.lognormal(2.0, 0.7, size=(args.batches, bs)).astype(int), 1, MAXLEN)
+        batches = [pad_post([list(rng.integers(1, vocab, size=n)) for n in row], MAXLEN) for row in lengths]
+        reference = np.concatenate([models['float32'].predict(b) for b in batches])
+        for name, model in models.items():
+            model.predict(batches[0])
+            times = []
+            for batch in batches:
+                started = time.perf_counter()
+                model.predict(batch)
+                times.append(time.perf_counter() - started)
+            tracemalloc.start()
+            scores = np.concatenate([model.predict(b) for b in batches[:5]])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            diff = float(np.abs(scores - reference[:len(scores)]).max())
+            p50, p95 = np.percentile(times, [50, 95]) * 1000
+            print(f"bs={bs:<4d} {name:8s} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  "
+                  f"{bs / np.median(times):9.0f} rows/s  peak alloc {peak / 1e6:6.2f} MB  "
+                  f"max |diff| vs float32 {diff:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Microbenchmark: TextVectorizer.to_matrix vs. Keras texts_to_sequences + pad_sequences.
+
+Both paths get the same clean_text-normalised input, and the script checks that
+they produce identical id matrices before reporting timings.
+
+Run from backend/:
+    python -m benchmarks.bench_tokenizer --comments 100000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from myapp.ml.preprocessing import TextVectorizer, clean_text
+
+MAXLEN = 100
+
+
+def make_comments(n: int, vocab: int = 5000, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"w{i}" if i % 7 else f"W{i}!" for i in range(vocab)]
+    # Zipf-ish word frequencies and 3-40 word comments, like real chat text
+    weights = [1.0 / (i + 1) for i in range(vocab)]
+    return [' '.join(rng.choices(words, weights, k=rng.randint(3, 40))) for _ in range(n)]
+
+
+def fit_tokenizer_json(texts):
+    from tensorflow.keras.preprocessing.text import Tokenizer
+    tokenizer = Tokenizer(num_words=2000, oov_token="<OOV>")
+    tokenizer.fit_on_texts(texts)
+    return tokenizer, tokenizer.to_json()
+
+
+def best_of(fn, repeat: int):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    comments = make_comments(args.comments)
+    cleaned = [clean_text(c) for c in comments]
+
+    try:
+        from tensorflow.keras.preprocessing.sequence import pad_sequences
+        tokenizer, tok_json = fit_tokenizer_json(cleaned[:20000])
+    except ImportError:
+        tokenizer = None
+        word_index = {f"w{i}": i + 2 for i in range(5000)}
+        word_index["<OOV>"] = 1
+        tok_json = {'config': {'word_index': word_index, 'num_words': 2000, 'oov_token': "<OOV>"}}
+
+    vectorizer = TextVectorizer.from_json(tok_json)
+    ours_s, ours = best_of(lambda: vectorizer.to_matrix(comments, MAXLEN), args.repeat)
+    print(f"TextVectorizer (incl. clean_text): {ours_s:7.3f}s  {args.comments / ours_s:12.0f} comments/s")
+
+    if tokenizer is None:
+        print("TensorFlow not installed; skipping the Keras comparison")
+        return
+
+    def keras_path():
+        seqs = tokenizer.texts_to_sequences([clean_text(c) for c in comments])
+        return pad_sequences(seqs, maxlen=MAXLEN, padding='post', truncating='post')
+
+    keras_s, keras = best_of(keras_path, args.repeat)
+    print(f"Keras (incl. clean_text)         : {keras_s:7.3f}s  {args.comments / keras_s:12.0f} comments/s")
+    print(f"speedup: {keras_s / ours_s:.2f}x  identical ids: {np.array_equal(ours, keras)}")
+
+
+if __name__ == '__main__':
+    main()
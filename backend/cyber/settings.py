@@ -22,11 +22,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.MetricsMiddleware',        # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'myapp.middleware.TokenAuthMiddleware',
 ]
 
 ROOT_URLCONF = 'cyber.urls'
@@ -57,6 +59,22 @@ DATABASES = {
     }
 }
 
+# DJANGO_DB_PROFILE=production: persistent connections (CONN_MAX_AGE, checked
+# before reuse) and SQLite tuned for concurrent readers and writers. The
+# PRAGMAs are applied to every new connection by myapp/db.py.
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {}
+if DB_PROFILE == 'production':
+    DATABASES['default']['CONN_MAX_AGE'] = 300
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,       # ms
+        'cache_size': -20000,       # KiB of page cache per connection
+        'temp_store': 'MEMORY',
+    }
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -73,3 +91,176 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ML model loading: artifacts are read from ML_MODEL_DIR by the model registry.
+# wsgi.py warms the model in a background thread (ML_WARMUP_ON_START); until it
+# is ready, requests wait at most ML_LOAD_WAIT_SECONDS and then fall back to
+# ML_FALLBACK_STATUS. /myapp/ready/ returns 503 until the model is warm.
+ML_MODEL_DIR = os.path.join(BASE_DIR, 'myapp', 'models')
+ML_MAX_SEQ_LEN = 100
+ML_WARMUP_ON_START = True
+ML_LOAD_WAIT_SECONDS = 0
+ML_FALLBACK_STATUS = "Not Bullying"
+# 'float32', or a quantized variant written by `python -m myapp.ml.quantize`
+# ('float16', 'int8'); falls back to float32 if the variant file is missing.
+ML_MODEL_VARIANT = 'float32'
+# Versioned artifacts: `python manage.py publish_model` copies a model into
+# ML_MODEL_DIR/versions/<name> and points ML_MODEL_DIR/CURRENT at it. Every
+# ML_RELOAD_POLL_SECONDS (0 = never) each worker re-reads CURRENT and swaps in
+# a changed model once it is loaded and warm. A model published with
+# --candidate (CANDIDATE file) scores ML_SHADOW_SAMPLE_RATE of live traffic in
+# the background; agreement, score drift and latency show at
+# /myapp/model_status/.
+ML_RELOAD_POLL_SECONDS = 30
+ML_SHADOW_SAMPLE_RATE = 0.05
+ML_SHADOW_QUEUE_SIZE = 1000
+
+# ML inference: concurrent comment classifications are grouped into one model
+# call of at most ML_BATCH_MAX_SIZE rows, waiting at most ML_BATCH_MAX_WAIT_MS
+# for the batch to fill. Set ML_BATCHING_ENABLED = False to score one at a time.
+# A request whose batch takes over ML_BATCH_TIMEOUT_SECONDS is scored directly.
+ML_BATCHING_ENABLED = True
+ML_BATCH_MAX_SIZE = 32
+ML_BATCH_MAX_WAIT_MS = 5.0
+ML_BATCH_TIMEOUT_SECONDS = 10.0
+# Pad each batch only to its length bucket instead of ML_MAX_SEQ_LEN. Applied
+# only to models trained with mask_zero=True; set to () to always pad to 100.
+ML_LENGTH_BUCKETS = (8, 16, 32, 64, 100)
+
+# ML prediction cache, keyed on the token-id sequence and scoped to the loaded
+# model version. Local LRU per worker by default; set ML_CACHE_ALIAS to a
+# CACHES alias (e.g. a file-based or database cache) to share it between workers.
+ML_CACHE_ENABLED = True
+ML_CACHE_MAX_ENTRIES = 50000
+ML_CACHE_TTL_SECONDS = 6 * 3600
+ML_CACHE_ALIAS = None
+
+# Comment moderation: 'sync' classifies inside add_comment; 'async' stores the
+# comment as "pending" and a background worker pool classifies pending comments
+# in batches (clients poll /myapp/comment_status/). The pool runs inside each
+# web process when MODERATION_WORKER_IN_PROCESS is on; with several web workers
+# turn it off and run `python manage.py moderate_comments` once instead.
+# Failed batches are retried after an exponential backoff of at most
+# MODERATION_MAX_BACKOFF seconds.
+MODERATION_MODE = 'sync'
+MODERATION_WORKER_IN_PROCESS = True
+MODERATION_WORKER_THREADS = 1
+MODERATION_BATCH_SIZE = 256
+MODERATION_POLL_INTERVAL = 0.5
+MODERATION_MAX_BACKOFF = 60.0
+
+# Lexicon cascade: phrases from ML_LEXICON_PATH decide clear-cut comments
+# (slurs and threats with confidence >= ML_CASCADE_BLOCK_THRESHOLD and no
+# negation just before them, or fully benign text) before the model runs;
+# insults, negated or reported phrases and other ambiguous comments still go to
+# the Bi-LSTM.
+ML_CASCADE_ENABLED = True
+ML_LEXICON_PATH = os.path.join(BASE_DIR, 'myapp', 'lexicon.json')
+ML_CASCADE_BLOCK_THRESHOLD = 0.9
+
+# Bulk scoring (/myapp/predict_cyberbullying/): a JSON array or NDJSON body of
+# at most PREDICT_MAX_TEXTS texts and PREDICT_MAX_BYTES bytes. NDJSON responses
+# are streamed, PREDICT_CHUNK_SIZE texts per model call.
+PREDICT_MAX_TEXTS = 5000
+PREDICT_MAX_BYTES = 2 * 1024 * 1024
+PREDICT_CHUNK_SIZE = 256
+
+# Repeat offenders (myapp/offenders.py): bullying verdicts are counted per
+# author in OFFENDER_BUCKET_SECONDS buckets. Rules are (action, bullying
+# comments, window seconds): 'throttle' makes add_comment return 429 for
+# OFFENDER_THROTTLE_SECONDS, other actions are only reported at
+# /myapp/offender_events/ and in the admin. Fired rules are stored
+# (OffenderAction) so every process enforces throttles and sees events; the
+# counts are per process, bounded by OFFENDER_MAX_USERS, and replayed from the
+# database on first use.
+OFFENDER_DETECTION_ENABLED = True
+OFFENDER_RULES = (
+    ('throttle', 3, 10 * 60),
+    ('flag', 10, 24 * 3600),
+)
+OFFENDER_BUCKET_SECONDS = 60
+OFFENDER_THROTTLE_SECONDS = 15 * 60
+OFFENDER_MAX_USERS = 50000
+OFFENDER_MAX_EVENTS = 1000
+
+# Chat delivery: /myapp/chat_poll/ holds a request open for up to
+# CHAT_LONG_POLL_TIMEOUT seconds until chat_send notifies the hub. The local hub
+# only wakes waiters in the same process, so waiters also re-check the database
+# every CHAT_LONG_POLL_RECHECK_SECONDS (messages sent through another worker).
+# Every waiting request holds a server thread, so long-polling needs a threaded
+# or async server (runserver, gunicorn --threads or an ASGI server); a sync
+# worker per request would be tied up for the whole timeout. At most
+# CHAT_LONG_POLL_MAX_WAITERS requests per process wait at once; further polls
+# get the current (usually empty) page immediately and simply poll again.
+CHAT_HUB_BACKEND = 'myapp.chat_hub.LocalChatHub'
+CHAT_LONG_POLL_TIMEOUT = 25
+CHAT_LONG_POLL_RECHECK_SECONDS = 5
+CHAT_LONG_POLL_MAX_WAITERS = 100
+
+# Feed (/myapp/viewpostothers/): keyset pagination on post id.
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+
+# Home feed (/myapp/home_feed/): friends' posts materialized per user at write
+# time (myapp/feed.py). Each feed keeps the newest FEED_MAX_LENGTH post ids and
+# expires FEED_TTL_SECONDS after its last read. Authors with more than
+# FEED_FANOUT_LIMIT friends are merged in at read time instead of being fanned
+# out. Feeds are only materialized in a cache all workers share (Redis,
+# Memcached): with the per-process local-memory cache below FEED_MATERIALIZE
+# (None = decide from the FEED_CACHE_ALIAS backend) turns it off and every read
+# is computed from the database.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+FEED_CACHE_ALIAS = 'default'
+FEED_MATERIALIZE = None
+FEED_MAX_LENGTH = 500
+FEED_TTL_SECONDS = 7 * 86400
+FEED_FANOUT_LIMIT = 1000
+
+# Image uploads (myapp/media.py): multipart files are streamed to disk and
+# hashed as they arrive; photos are stored once under a content-addressed name
+# and re-encoded without EXIF/GPS metadata by MEDIA_WORKER_THREADS threads.
+# Uploaded files over MEDIA_MAX_UPLOAD_BYTES are refused with 400.
+FILE_UPLOAD_HANDLERS = ['myapp.media.HashingUploadHandler']
+MEDIA_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MEDIA_WORKER_THREADS = 2
+MEDIA_MAX_PIXELS = 40_000_000
+# Resized copies written next to each upload and by `manage.py
+# generate_variants`; responses expose them as photo_<variant> URLs.
+MEDIA_VARIANTS = {
+    'thumb': {'size': 200, 'crop': True},      # square list-tile thumbnail
+    'medium': {'size': 800},                   # longest edge
+}
+MEDIA_VARIANT_FORMAT = 'WEBP'                  # or 'JPEG'
+
+# API authentication (myapp/tokens.py): userlogin/signup return a signed token
+# that clients send as "Authorization: Bearer <token>". It is checked against
+# the profile cache, so changing the password or deleting the profile revokes
+# it (in other workers within PROFILE_CACHE_TTL_SECONDS). Raw `lid` form fields
+# from older app builds are still accepted while AUTH_ALLOW_LEGACY_LID is on.
+AUTH_TOKEN_MAX_AGE = 7 * 86400
+AUTH_ALLOW_LEGACY_LID = True
+PROFILE_CACHE_MAX_ENTRIES = 10000
+PROFILE_CACHE_TTL_SECONDS = 60
+
+# user_viewprofile response bodies cached per login (myapp/profiles.py):
+# per-process LRU by default; set PROFILE_JSON_CACHE_ALIAS to a shared CACHES
+# alias so edits invalidate every worker at once.
+PROFILE_JSON_CACHE_ENABLED = True
+PROFILE_JSON_CACHE_ALIAS = None
+PROFILE_JSON_CACHE_MAX_ENTRIES = 20000
+PROFILE_JSON_CACHE_TTL_SECONDS = 300
+
+# Metrics (myapp/metrics.py): per-view latency, query and response-size
+# histograms plus model tokenize/pad/predict timings, served in Prometheus
+# text format at /metrics to METRICS_ALLOWED_IPS. The same addresses, or a
+# staff session, may also read /myapp/model_status/, cache_stats,
+# moderation_stats and offender_events. Under a multi-process server set
+# METRICS_MULTIPROC_DIR (emptied on each server start) so every worker's
+# numbers are merged; each worker writes its file at most every
+# METRICS_FLUSH_SECONDS.
+METRICS_ENABLED = os.environ.get('DJANGO_METRICS', '') == '1'
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_MULTIPROC_DIR = os.environ.get('DJANGO_METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 5.0
@@ -15,4 +15,23 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cyber.settings')
 
 # Create the WSGI application instance
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Load and warm the ML model in the background so the worker can start serving
+# immediately; /myapp/ready/ reports 200 once the model is warm.
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'ML_WARMUP_ON_START', True):
+    from myapp.ml.registry import get_registry  # noqa: E402
+    get_registry().start_warmup()
+
+# Pick up models published to ML_MODEL_DIR/CURRENT without a restart.
+if getattr(settings, 'ML_RELOAD_POLL_SECONDS', 0):
+    from myapp.ml.registry import get_registry  # noqa: E402
+    get_registry().start_watching(settings.ML_RELOAD_POLL_SECONDS)
+
+# Async moderation: classify pending comments in this process's worker pool.
+if (getattr(settings, 'MODERATION_MODE', 'sync') == 'async'
+        and getattr(settings, 'MODERATION_WORKER_IN_PROCESS', True)):
+    from myapp.moderation import start_background_moderation  # noqa: E402
+    start_background_moderation()
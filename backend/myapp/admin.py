@@ -1,10 +1,60 @@
 from django.contrib import admin
-from .models import Login, UserProfile, FriendRequest, Post, Complaint, Comment, Chat
+from django.utils import timezone
+from django.utils.html import format_html
+
+from . import media
+from .models import Login, UserProfile, FriendRequest, Post, Complaint, Comment, Chat, ModerationCounter
+from .models import OffenderAction
+
+
+def _thumbnail(obj):
+    if not obj.photo:
+        return ''
+    return format_html('<img src="{}" width="48" height="48" loading="lazy">',
+                       media.variant_urls(obj.photo.name).get('photo_thumb') or obj.photo.url)
+
+
+_thumbnail.short_description = 'photo'
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', _thumbnail, 'name', 'email')
+
+
+@admin.register(Post)
+class PostAdmin(admin.ModelAdmin):
+    list_display = ('id', _thumbnail, 'user', 'desc', 'date')
+
+
+@admin.register(ModerationCounter)
+class ModerationCounterAdmin(admin.ModelAdmin):
+    # maintained by myapp/stats.py; fix drift with reconcile_moderation_stats
+    list_display = ('scope', 'key', 'bullying', 'clean', 'pending', 'open_complaints')
+    list_filter = ('scope',)
+    ordering = ('scope', '-bullying')
+    readonly_fields = list_display
+
+
+@admin.register(OffenderAction)
+class OffenderActionAdmin(admin.ModelAdmin):
+    # written by myapp/offenders.py when a repeat-offender rule fires
+    list_display = ('id', 'profile', 'action', 'count', 'window', 'at', 'throttled_until')
+    list_filter = ('action',)
+    ordering = ('-id',)
+    readonly_fields = list_display
+    actions = ['lift_throttle']
+
+    @admin.action(description="Lift throttle")
+    def lift_throttle(self, request, queryset):
+        # add_comment reads throttled_until (offenders.retry_after), so this applies in every process
+        now = timezone.now()
+        lifted = queryset.filter(throttled_until__gt=now).update(throttled_until=now)
+        self.message_user(request, f"Lifted {lifted} throttle(s).")
+
 
 admin.site.register(Login)
-admin.site.register(UserProfile)
 admin.site.register(FriendRequest)
-admin.site.register(Post)
 admin.site.register(Complaint)
 admin.site.register(Comment)
 admin.site.register(Chat)
@@ -19,4 +19,18 @@ class MyappConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
-    verbose_name = 'Cybercrime Prevention on Social Media'
\ No newline at end of file
+    verbose_name = 'Cybercrime Prevention on Social Media'
+
+    def ready(self):
+        # tune new database connections; keep materialized home feeds,
+        # cached profiles, moderation counters and photo references in step
+        # with the database
+        from django.conf import settings
+        from . import db, feed, media, metrics, profiles, stats, tokens
+        metrics.configure(settings)
+        db.connect_signals()
+        feed.connect_signals()
+        media.connect_signals()
+        profiles.connect_signals()
+        stats.connect_signals()
+        tokens.connect_signals()
@@ -0,0 +1,113 @@
+"""
+Wake-ups for long-polling chat clients.
+
+``chat_poll`` parks a request until a message for that user arrives instead of
+re-querying Chat on a timer. ``chat_send`` calls ``notify(to_login_id)`` after
+its transaction commits, and the waiting requests wake up and run a single
+``since_id`` query.
+
+The hub only signals "something new for this login"; messages are always read
+from the database. Waiters take a ``version`` token before they query and pass
+it to ``wait``, so a message committed in between is never missed.
+
+The backend is chosen with CHAT_HUB_BACKEND. ``LocalChatHub`` wakes waiters in
+the current process only. With several worker processes, a message sent
+through another worker is picked up by the periodic re-check in ``chat_poll``
+(CHAT_LONG_POLL_RECHECK_SECONDS). A shared backend (e.g. Redis pub/sub) can be
+plugged in by implementing the same three methods.
+
+Every parked request holds a server thread (or an async task) for up to
+CHAT_LONG_POLL_TIMEOUT seconds, so ``chat_poll`` needs a threaded or async
+server and takes one of CHAT_LONG_POLL_MAX_WAITERS slots from ``poll_slot``;
+when they are all in use it answers right away instead of waiting.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_hub = None
+_hub_lock = threading.Lock()
+_polls = 0
+_polls_lock = threading.Lock()
+
+
+class LocalChatHub:
+    """
+    In-process hub: one condition per login, all sharing a single lock.
+
+    Versions come from one process-wide counter, so a login evicted from the
+    bounded ``_versions`` map (least recently notified first) reads as 0 and at
+    worst wakes its waiter for one extra query; it can never repeat a version a
+    waiter has already seen.
+    """
+
+    def __init__(self, max_logins: int = 10000):
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._versions = OrderedDict()   # login id -> version of its last notify, oldest first
+        self._waiting = {}               # login id -> [Condition, number of waiters]
+        self.max_logins = max_logins
+
+    def version(self, login_id) -> int:
+        with self._lock:
+            return self._versions.get(login_id, 0)
+
+    def notify(self, login_id):
+        with self._lock:
+            self._versions[login_id] = next(self._counter)
+            self._versions.move_to_end(login_id)
+            while len(self._versions) > self.max_logins:
+                self._versions.popitem(last=False)
+            entry = self._waiting.get(login_id)
+            if entry is not None:
+                entry[0].notify_all()
+
+    def wait(self, login_id, seen_version: int, timeout: float) -> bool:
+        """Block until ``login_id`` is notified past ``seen_version``; False on timeout."""
+        with self._lock:
+            entry = self._waiting.get(login_id)
+            if entry is None:
+                entry = self._waiting[login_id] = [threading.Condition(self._lock), 0]
+            entry[1] += 1
+            try:
+                return entry[0].wait_for(lambda: self._versions.get(login_id, 0) != seen_version, timeout)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._waiting[login_id]
+
+    def waiters(self) -> int:
+        with self._lock:
+            return sum(count for _, count in self._waiting.values())
+
+
+@contextmanager
+def poll_slot():
+    """Reserve a long-poll slot; yields False when CHAT_LONG_POLL_MAX_WAITERS are already waiting."""
+    global _polls
+    from django.conf import settings
+    limit = getattr(settings, 'CHAT_LONG_POLL_MAX_WAITERS', 100)
+    with _polls_lock:
+        granted = _polls < limit
+        if granted:
+            _polls += 1
+    try:
+        yield granted
+    finally:
+        if granted:
+            with _polls_lock:
+                _polls -= 1
+
+
+def get_hub():
+    """Process-wide hub built from settings.CHAT_HUB_BACKEND."""
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                from django.conf import settings
+                from django.utils.module_loading import import_string
+                _hub = import_string(getattr(settings, 'CHAT_HUB_BACKEND', 'myapp.chat_hub.LocalChatHub'))()
+    return _hub
@@ -0,0 +1,32 @@
+"""
+Per-connection database tuning.
+
+Django has no setting for SQLite PRAGMAs, so ``configure_connection`` runs
+on ``connection_created`` and applies SQLITE_PRAGMAS to every new SQLite
+connection. The production profile (DJANGO_DB_PROFILE=production) sets:
+
+- journal_mode=WAL: readers no longer block the writer (add_comment,
+  chat_send), and writers no longer block readers.
+- synchronous=NORMAL: fsync at checkpoints rather than on every commit. It
+  is safe with WAL; a power loss can drop the last transactions but cannot
+  corrupt the file.
+- busy_timeout: a writer waits for the lock instead of failing at once
+  with "database is locked".
+"""
+
+
+def configure_connection(sender, connection, **kwargs):
+    from django.conf import settings
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+
+
+def connect_signals():
+    from django.db.backends.signals import connection_created
+    connection_created.connect(configure_connection, dispatch_uid='myapp_sqlite_pragmas')
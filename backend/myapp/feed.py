@@ -0,0 +1,301 @@
+"""
+Materialized home feeds: the user's own posts and their friends' posts
+(accepted FriendRequest edges, in either direction), newest first.
+
+Each active user has a bounded list of recent post ids in the Django cache
+(FEED_CACHE_ALIAS), so a feed read is one cache get plus one query that
+hydrates a page of ids. Feeds are only materialized when that cache is shared
+by every web worker (FEED_MATERIALIZE, on by default for any backend but the
+per-process local-memory and dummy caches); otherwise each read is computed
+from the database, so no worker serves a feed another one has changed.
+
+- Write time: a new post is pushed onto the cached feeds of the author's
+  friends (``fan_out``). Feeds that are not cached (inactive users) are
+  skipped and rebuilt from the database on their next read.
+- Authors with more than FEED_FANOUT_LIMIT friends are not fanned out. Their
+  friends' feeds remember them as "pull" authors, and their recent posts are
+  merged in at read time.
+- Eviction: entries expire FEED_TTL_SECONDS after the last read, so
+  inactive users stop costing fan-out writes; the cache's own culling
+  (MAX_ENTRIES) applies on top.
+- Deleted posts are removed from the cached feeds of their author and the
+  author's friends.
+- Friendship changes drop both users' feeds; ``rebuild_feeds`` rebuilds
+  feeds in bulk. When a change takes an author over FEED_FANOUT_LIMIT, the
+  feeds of all their friends are dropped too: those feeds list the author as
+  "push", and fan-out no longer writes to them.
+
+The cache has no compare-and-set, so updates of one feed take a short
+``cache.add`` lock. An update that cannot get the lock drops the feed and
+marks it dirty, so a concurrent rebuild that read the database before the post
+was committed (or deleted) throws its result away instead of caching a stale
+feed.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import FriendRequest, Post
+
+_store = None
+_store_lock = threading.Lock()
+
+# caches private to one process (or not caching at all)
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def _key(profile_id) -> str:
+    return f'feed:v1:{profile_id}'
+
+
+def _degree_key(profile_id) -> str:
+    return f'feed:v1:friends:{profile_id}'
+
+
+class FeedStore:
+    """Cached per-user feeds over one Django cache alias."""
+
+    def __init__(self, cache, max_length: int = 500, ttl: int = 7 * 86400, fanout_limit: int = 1000,
+                 lock_timeout: float = 5.0, materialize: bool = True):
+        self.cache = cache
+        self.materialize = materialize
+        self.max_length = max_length
+        self.ttl = ttl
+        self.fanout_limit = fanout_limit
+        self.lock_timeout = lock_timeout
+        self.stats = Counter()
+
+    @classmethod
+    def from_settings(cls) -> 'FeedStore':
+        alias = getattr(settings, 'FEED_CACHE_ALIAS', 'default')
+        materialize = getattr(settings, 'FEED_MATERIALIZE', None)
+        if materialize is None:
+            materialize = settings.CACHES[alias]['BACKEND'] not in LOCAL_BACKENDS
+        return cls(
+            caches[alias],
+            max_length=getattr(settings, 'FEED_MAX_LENGTH', 500),
+            ttl=getattr(settings, 'FEED_TTL_SECONDS', 7 * 86400),
+            fanout_limit=getattr(settings, 'FEED_FANOUT_LIMIT', 1000),
+            materialize=materialize,
+        )
+
+    # -- social graph -------------------------------------------------------
+
+    @staticmethod
+    def friends(profile_id) -> set:
+        edges = (FriendRequest.objects.filter(status='accepted')
+                 .filter(Q(from_user_id=profile_id) | Q(to_user_id=profile_id))
+                 .values_list('from_user_id', 'to_user_id'))
+        return {b if a == profile_id else a for a, b in edges}
+
+    def friend_counts(self, profile_ids) -> dict:
+        """Friend count per profile; cached, since popular authors are everybody's friends."""
+        cached = self.cache.get_many([_degree_key(p) for p in profile_ids])
+        counts = {p: cached[_degree_key(p)] for p in profile_ids if _degree_key(p) in cached}
+        missing = [p for p in profile_ids if p not in counts]
+        if missing:
+            fresh = Counter(dict.fromkeys(missing, 0))
+            accepted = FriendRequest.objects.filter(status='accepted')
+            for field in ('from_user_id', 'to_user_id'):
+                rows = (accepted.filter(**{f'{field}__in': missing})
+                        .values(field).annotate(n=Count('id')).values_list(field, 'n'))
+                fresh.update(dict(rows))
+            self.cache.set_many({_degree_key(p): n for p, n in fresh.items()}, self.ttl)
+            counts.update(fresh)
+        return counts
+
+    # -- locking --------------------------------------------------------------
+
+    def _lock(self, profile_id) -> bool:
+        deadline = time.monotonic() + 0.05
+        while not self.cache.add(f'{_key(profile_id)}:lock', 1, self.lock_timeout):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _unlock(self, profile_id):
+        self.cache.delete(f'{_key(profile_id)}:lock')
+
+    def _store_entry(self, profile_id, entry):
+        self.cache.set(_key(profile_id), entry, max(int(entry['expires'] - time.time()), 1))
+
+    # -- reads ----------------------------------------------------------------
+
+    def build(self, profile_id) -> dict:
+        """Recompute one feed from the database and cache it (when materializing)."""
+        friends = self.friends(profile_id)
+        counts = self.friend_counts(sorted(friends)) if friends else {}
+        pull = sorted(f for f in friends if counts.get(f, 0) > self.fanout_limit)
+        push = sorted((friends - set(pull)) | {profile_id})
+        ids = list(Post.objects.filter(user_id__in=push).order_by('-id')
+                   .values_list('id', flat=True)[:self.max_length])
+        entry = {'ids': ids, 'push': push, 'pull': pull, 'expires': time.time() + self.ttl}
+        self.stats['builds'] += 1
+        if not self.materialize or not self._lock(profile_id):
+            return entry                    # somebody else is updating it; serve uncached
+        try:
+            self.cache.delete(f'{_key(profile_id)}:dirty')
+            self._store_entry(profile_id, entry)
+        finally:
+            self._unlock(profile_id)
+        if self.cache.get(f'{_key(profile_id)}:dirty'):
+            self.cache.delete(_key(profile_id))
+        return entry
+
+    def get(self, profile_id) -> dict:
+        if not self.materialize:
+            return self.build(profile_id)
+        entry = self.cache.get(_key(profile_id))
+        if entry is None:
+            return self.build(profile_id)
+        self.stats['hits'] += 1
+        # sliding expiry for active users, refreshed at most once per half TTL
+        if entry['expires'] - time.time() < self.ttl / 2 and self._lock(profile_id):
+            try:
+                current = self.cache.get(_key(profile_id))
+                if current is not None:
+                    current['expires'] = time.time() + self.ttl
+                    self._store_entry(profile_id, current)
+                    entry = current
+            finally:
+                self._unlock(profile_id)
+        return entry
+
+    def page(self, profile_id, cursor: int = 0, page_size: int = 20) -> list:
+        """Post ids of one feed page, newest first, older than ``cursor`` if given."""
+        entry = self.get(profile_id)
+        ids = entry['ids']
+        # ids are sorted descending; skip to the first id below the cursor
+        start = len(ids) - bisect.bisect_left(ids[::-1], cursor) if cursor else 0
+        page = ids[start:start + page_size]
+        sources = []
+        if len(page) < page_size and len(ids) >= self.max_length:
+            sources.append(entry['push'])   # scrolled past the cached window
+            page = []
+        if entry['pull']:
+            sources.append(entry['pull'])
+        if sources:
+            self.stats['db_pages'] += 1
+            qs = Post.objects.filter(user_id__in=[a for s in sources for a in s])
+            if cursor:
+                qs = qs.filter(id__lt=cursor)
+            page = sorted(set(page) | set(qs.order_by('-id').values_list('id', flat=True)[:page_size]),
+                          reverse=True)[:page_size]
+        return page
+
+    # -- writes ---------------------------------------------------------------
+
+    def _update(self, targets, change) -> int:
+        """
+        Apply ``change(ids) -> bool`` to the cached feeds of ``targets`` and
+        store those it changed; returns how many were written.
+        """
+        cached = self.cache.get_many([_key(t) for t in targets])
+        written = 0
+        for target in targets:
+            if _key(target) not in cached:
+                continue                    # not materialized: built on next read
+            if not self._lock(target):
+                self.cache.set(f'{_key(target)}:dirty', 1, self.lock_timeout * 2)
+                self.cache.delete(_key(target))
+                self.stats['dropped'] += 1
+                continue
+            try:
+                entry = self.cache.get(_key(target))
+                if entry is not None and change(entry['ids']):
+                    self._store_entry(target, entry)
+                    written += 1
+            finally:
+                self._unlock(target)
+        self.stats['feed_writes'] += written
+        return written
+
+    def fan_out(self, post_id: int, author_id: int) -> int:
+        """Push a new post onto the cached feeds that should show it; returns feeds written."""
+        if not self.materialize:
+            return 0
+        friends = self.friends(author_id)
+        targets = [author_id] + (sorted(friends) if len(friends) <= self.fanout_limit else [])
+        self.stats['posts'] += 1
+        self.stats['fanout_targets'] += len(targets)
+
+        def insert(ids):
+            if post_id in ids:
+                return False
+            # usually a prepend; bisect keeps order if posts commit out of order
+            ids.insert(len(ids) - bisect.bisect_left(ids[::-1], post_id), post_id)
+            del ids[self.max_length:]
+            return True
+
+        return self._update(targets, insert)
+
+    def remove(self, post_id: int, author_id: int) -> int:
+        """Take a deleted post out of the cached feeds that show it; returns feeds written."""
+        if not self.materialize:
+            return 0
+
+        def discard(ids):
+            if post_id not in ids:
+                return False
+            ids.remove(post_id)
+            return True
+
+        return self._update([author_id] + sorted(self.friends(author_id)), discard)
+
+    def invalidate(self, *profile_ids):
+        self.cache.delete_many([k for p in profile_ids for k in (_key(p), _degree_key(p))])
+
+    def friendship_changed(self, *profile_ids):
+        """
+        Drop the feeds of users whose friendships changed. A user who just went
+        over the fan-out limit (one edge at a time, so exactly limit + 1) also
+        drops their friends' feeds, which would otherwise keep expecting pushes.
+        """
+        self.invalidate(*profile_ids)
+        accepted = FriendRequest.objects.filter(status='accepted')
+        for profile_id in profile_ids:
+            edges = accepted.filter(Q(from_user_id=profile_id) | Q(to_user_id=profile_id))
+            if edges.count() == self.fanout_limit + 1:
+                self.stats['fanout_switches'] += 1
+                self.cache.delete_many([_key(f) for f in self.friends(profile_id)])
+
+
+def get_store() -> FeedStore:
+    """Process-wide store built from settings."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeedStore.from_settings()
+    return _store
+
+
+def on_post_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: get_store().fan_out(instance.id, instance.user_id))
+
+
+def on_post_deleted(sender, instance, **kwargs):
+    # the pk is cleared once the delete finishes, before on_commit runs
+    post_id, author_id = instance.id, instance.user_id
+    transaction.on_commit(lambda: get_store().remove(post_id, author_id))
+
+
+def on_friendship_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_store().friendship_changed(instance.from_user_id, instance.to_user_id))
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+    post_save.connect(on_post_saved, sender=Post, dispatch_uid='feed_fan_out')
+    post_delete.connect(on_post_deleted, sender=Post, dispatch_uid='feed_post_deleted')
+    post_save.connect(on_friendship_changed, sender=FriendRequest, dispatch_uid='feed_friend_saved')
+    post_delete.connect(on_friendship_changed, sender=FriendRequest, dispatch_uid='feed_friend_deleted')
@@ -0,0 +1,61 @@
+"""
+Backfill resized variants (MEDIA_VARIANTS) for existing post and profile photos.
+
+    python manage.py generate_variants
+    python manage.py generate_variants --workers 8 --processes
+    python manage.py generate_variants --force        # re-render after changing MEDIA_VARIANTS
+
+New uploads get their variants from the upload worker (myapp/media.py); this
+command covers media stored before that. Photos whose variants all exist are
+skipped, so an interrupted run can simply be started again.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from myapp import media
+from myapp.models import Post, UserProfile
+
+
+def _generate(name, force):
+    try:
+        return name, media.generate_variants(name, force=force), None
+    except Exception as e:
+        return name, 0, f"{type(e).__name__}: {e}"
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnail/medium variants for stored photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="parallel resizes")
+        parser.add_argument('--processes', action='store_true',
+                            help="use a process pool instead of threads")
+        parser.add_argument('--force', action='store_true', help="re-render variants that already exist")
+
+    def handle(self, *args, **opts):
+        names = set()
+        for model in (Post, UserProfile):
+            names.update(model.objects.exclude(photo='').exclude(photo__isnull=True)
+                         .values_list('photo', flat=True).distinct())
+        names = sorted(names)
+        self.stdout.write(f"{len(names)} photos")
+
+        pool_cls = ProcessPoolExecutor if opts['processes'] else ThreadPoolExecutor
+        started = time.perf_counter()
+        written = failed = 0
+        with pool_cls(max_workers=opts['workers']) as pool:
+            for i, (name, count, error) in enumerate(
+                    pool.map(_generate, names, [opts['force']] * len(names), chunksize=16), 1):
+                written += count
+                if error:
+                    failed += 1
+                    self.stderr.write(f"  {name}: {error}")
+                if i % 1000 == 0:
+                    self.stdout.write(f"  {i}/{len(names)} photos, {written} variants written")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {written} variants for {len(names)} photos in {elapsed:.1f}s ({failed} failed)"))
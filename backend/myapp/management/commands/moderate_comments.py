@@ -0,0 +1,58 @@
+"""
+Run the asynchronous moderation worker pool in its own process.
+
+    python manage.py moderate_comments --threads 2
+    python manage.py moderate_comments --once     # drain the pending queue and exit
+
+Use this instead of MODERATION_WORKER_IN_PROCESS when the web server runs
+several worker processes, so exactly one pool classifies pending comments.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import moderation
+from myapp.ml.registry import get_registry
+
+
+class Command(BaseCommand):
+    help = "Classify pending comments in the background (MODERATION_MODE = 'async')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None, help="worker threads (default: settings)")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--once', action='store_true', help="process everything pending, then exit")
+
+    def handle(self, *args, **opts):
+        overrides = {}
+        if opts['threads']:
+            overrides['threads'] = opts['threads']
+        if opts['batch_size']:
+            overrides['batch_size'] = opts['batch_size']
+        pool = moderation.pool_from_settings(**overrides)
+
+        if opts['once']:
+            # load the model up front: run_once only waits poll_interval for it
+            registry = get_registry()
+            registry.load()
+            if not registry.wait_ready(timeout=300):
+                raise CommandError(f"ML model not ready: {registry.error or registry.state}")
+            total = 0
+            for worker in pool.workers:
+                while True:
+                    handled = worker.run_once()
+                    total += worker.processed
+                    worker.processed = 0
+                    if not handled:
+                        break
+            self.stdout.write(self.style.SUCCESS(f"Moderated {total} pending comments"))
+            return
+
+        pool.start()
+        self.stdout.write(f"Moderation pool running with {len(pool.workers)} thread(s); Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pool.stop(timeout=10)
@@ -0,0 +1,85 @@
+"""
+Publish model artifacts as a new version under ML_MODEL_DIR.
+
+    python manage.py publish_model path/to/artifacts                 # live once workers poll
+    python manage.py publish_model path/to/artifacts --candidate     # shadow-score it first
+    python manage.py publish_model --activate 20240101-abcdef12      # promote / roll back
+    python manage.py publish_model --clear-candidate
+
+The artifacts (cyberbullying_model.npz and/or cyberbullying_model, plus
+tokenizer.json if the model does not embed one) are loaded and warmed once
+here, so a broken model is refused before any worker sees it. They are copied
+to ``versions/<name>`` under a temporary name and renamed into place, then the
+CURRENT (or CANDIDATE) pointer is replaced atomically. Workers pick the change
+up within ML_RELOAD_POLL_SECONDS. Old versions are kept for rollback.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ml.registry import LoadedModel, ModelRegistry
+
+
+def _write_pointer(model_dir: str, name: str, version: str):
+    fd, tmp = tempfile.mkstemp(dir=model_dir, prefix=f'.{name}.')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(model_dir, name))
+
+
+class Command(BaseCommand):
+    help = "Copy model artifacts into ML_MODEL_DIR/versions and point CURRENT or CANDIDATE at them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help="directory holding the model artifacts")
+        parser.add_argument('--name', help="version name (default: the model's version)")
+        parser.add_argument('--candidate', action='store_true',
+                            help="publish as the shadow candidate instead of the live model")
+        parser.add_argument('--activate', metavar='NAME', help="point CURRENT at an already published version")
+        parser.add_argument('--clear-candidate', action='store_true', help="stop shadow scoring")
+
+    def handle(self, *args, **opts):
+        model_dir = settings.ML_MODEL_DIR
+        versions = os.path.join(model_dir, 'versions')
+        pointer = ModelRegistry.CANDIDATE if opts['candidate'] else ModelRegistry.CURRENT
+
+        if opts['clear_candidate']:
+            try:
+                os.remove(os.path.join(model_dir, ModelRegistry.CANDIDATE))
+            except FileNotFoundError:
+                pass
+            self.stdout.write(self.style.SUCCESS("Cleared the shadow candidate"))
+            return
+        if opts['activate']:
+            if not os.path.isdir(os.path.join(versions, opts['activate'])):
+                raise CommandError(f"No published version {opts['activate']!r} in {versions}")
+            _write_pointer(model_dir, pointer, opts['activate'])
+            self.stdout.write(self.style.SUCCESS(f"{pointer} -> {opts['activate']}"))
+            return
+        if not opts['source']:
+            raise CommandError("Give an artifact directory, --activate NAME or --clear-candidate")
+
+        try:
+            loaded = LoadedModel(opts['source'], maxlen=getattr(settings, 'ML_MAX_SEQ_LEN', 100)).load()
+        except Exception as exc:
+            raise CommandError(f"Refusing to publish {opts['source']}: {exc}")
+        name = opts['name'] or loaded.version
+        target = os.path.join(versions, name)
+        if os.path.exists(target):
+            raise CommandError(f"Version {name!r} already exists; use --activate {name} or another --name")
+
+        os.makedirs(versions, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=versions, prefix=f'.{name}.')
+        try:
+            shutil.copytree(opts['source'], staging, dirs_exist_ok=True)
+            os.replace(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        _write_pointer(model_dir, pointer, name)
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {type(loaded.model).__name__} version {loaded.version} as {name}; {pointer} -> {name}"))
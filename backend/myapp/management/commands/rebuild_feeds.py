@@ -0,0 +1,55 @@
+"""
+Rebuild or drop materialized home feeds (see myapp/feed.py).
+
+    python manage.py rebuild_feeds --user 12 --user 40
+    python manage.py rebuild_feeds --all
+    python manage.py rebuild_feeds --all --clear     # drop only; rebuilt lazily on read
+
+Use it after bulk changes that bypass model signals (raw SQL, ``update()`` on
+FriendRequest or Post), or to warm a shared feed cache after a flush. Feeds
+live in the FEED_CACHE_ALIAS cache, so this only reaches the web workers when
+that alias is a shared cache; a local-memory cache is private to this process.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.feed import get_store
+from myapp.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or drop with --clear) materialized home feeds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', default=[],
+                            help="UserProfile id to rebuild (repeatable)")
+        parser.add_argument('--all', action='store_true', help="every user profile")
+        parser.add_argument('--clear', action='store_true', help="drop the feeds instead of rebuilding them")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="profile ids fetched per query")
+
+    def handle(self, *args, **opts):
+        if not opts['user'] and not opts['all']:
+            raise CommandError("Pass --user ID (repeatable) or --all")
+        store = get_store()
+        if opts['all']:
+            profile_ids = UserProfile.objects.order_by('id').values_list('id', flat=True).iterator(
+                chunk_size=opts['chunk_size'])
+        else:
+            profile_ids = opts['user']
+
+        started = time.perf_counter()
+        done = 0
+        for profile_id in profile_ids:
+            if opts['clear']:
+                store.invalidate(profile_id)
+            else:
+                store.build(profile_id)
+            done += 1
+            if done % 10000 == 0:
+                self.stdout.write(f"  {done} feeds, {done / (time.perf_counter() - started):.0f}/s")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dropped' if opts['clear'] else 'Rebuilt'} {done} feeds in {elapsed:.1f}s"))
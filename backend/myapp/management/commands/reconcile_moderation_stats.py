@@ -0,0 +1,50 @@
+"""
+Rebuild the moderation counters (see myapp/stats.py) from scratch.
+
+    python manage.py reconcile_moderation_stats
+    python manage.py reconcile_moderation_stats --check     # report drift, write nothing
+
+Run it once after migrating an existing database, and after bulk changes that
+bypass model signals (raw SQL, ``update()`` on Comment or Complaint). The
+rebuild deletes the counters before it aggregates, inside one transaction, so
+on SQLite it holds the write lock throughout and no concurrent change is lost;
+on other backends run it while moderation is quiet.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp import stats
+from myapp.models import ModerationCounter
+
+
+def _snapshot() -> dict:
+    return {(row[0], row[1]): row[2:] for row in
+            ModerationCounter.objects.values_list('scope', 'key', *stats.FIELDS)}
+
+
+class Command(BaseCommand):
+    help = "Rebuild the moderation counters from the Comment and Complaint tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="only report counters that differ from the tables")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        with transaction.atomic():
+            before = _snapshot()
+            written = stats.rebuild()
+            after = _snapshot()
+            if opts['check']:
+                transaction.set_rollback(True)
+        zero = (0,) * len(stats.FIELDS)
+        drifted = [key for key in before.keys() | after.keys() if before.get(key, zero) != after.get(key, zero)]
+        for scope, key in sorted(drifted)[:20]:
+            self.stdout.write(f"  {scope}:{key} {before.get((scope, key), zero)} -> {after.get((scope, key), zero)}")
+        elapsed = time.perf_counter() - started
+        verb = "Checked" if opts['check'] else "Rebuilt"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {written} counters in {elapsed:.1f}s, {len(drifted)} had drifted"))
@@ -0,0 +1,149 @@
+"""
+Re-run the cyberbullying classifier over existing comments.
+
+    python manage.py rescore_comments
+    python manage.py rescore_comments --workers 4 --checkpoint /tmp/rescore.ckpt
+
+Comments are streamed in id order with ``.iterator(chunk_size=...)`` and scored
+in large batches, optionally split across a process pool. Changed labels are
+written back with ``bulk_update``, together with the matching change to the
+moderation counters (myapp/stats.py). After every batch the last processed id goes
+to the checkpoint file, so an interrupted run resumes where it stopped.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp import stats
+from myapp.ml.registry import BULLYING, ModelRegistry, cascade_from_settings
+from myapp.models import Comment
+
+_worker_registry = None
+
+
+def _build_registry() -> ModelRegistry:
+    return ModelRegistry(
+        getattr(settings, 'ML_MODEL_DIR', os.path.join(settings.BASE_DIR, 'myapp', 'models')),
+        maxlen=getattr(settings, 'ML_MAX_SEQ_LEN', 100),
+        batching=False,
+        cascade=cascade_from_settings(settings),
+        buckets=getattr(settings, 'ML_LENGTH_BUCKETS', None),
+        variant=getattr(settings, 'ML_MODEL_VARIANT', 'float32'),
+    )
+
+
+def _init_worker():
+    global _worker_registry
+    _worker_registry = _build_registry()
+    _worker_registry.load()
+
+
+def _classify_in_worker(texts):
+    return [d.label for d in _worker_registry.classify_texts(texts)]
+
+
+class Command(BaseCommand):
+    help = "Rescore Comment.status with the current model (streaming, batched, resumable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="rows fetched per database round trip")
+        parser.add_argument('--batch-size', type=int, default=4096,
+                            help="comments scored and written back per batch")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="score batches in this many processes (0 = in-process)")
+        parser.add_argument('--checkpoint', help="file holding the last processed comment id")
+        parser.add_argument('--start-id', type=int, default=0,
+                            help="only rescore comments with id > START_ID (ignored if the checkpoint exists)")
+        parser.add_argument('--dry-run', action='store_true', help="score and report, but do not write")
+
+    def handle(self, *args, **opts):
+        registry = _build_registry()
+        registry.load()
+        if not registry.ready:
+            raise CommandError(f"Model not available: {registry.error}")
+
+        start_id = self._read_checkpoint(opts['checkpoint'], opts['start_id'])
+        pool = None
+        if opts['workers'] > 0:
+            pool = ProcessPoolExecutor(max_workers=opts['workers'], initializer=_init_worker)
+
+        self.totals = {'rows': 0, 'flipped': 0, 'to_bullying': 0, 'to_clean': 0}
+        self.started = time.perf_counter()
+        self.stdout.write(f"Rescoring comments with id > {start_id} using model {registry.version}")
+        try:
+            qs = (Comment.objects.filter(id__gt=start_id).order_by('id')
+                  .only('id', 'comments', 'status', 'user', 'post', 'date'))
+            batch = []
+            for comment in qs.iterator(chunk_size=opts['chunk_size']):
+                batch.append(comment)
+                if len(batch) >= opts['batch_size']:
+                    self._flush(batch, registry, pool, opts)
+                    batch = []
+            if batch:
+                self._flush(batch, registry, pool, opts)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - self.started
+        t = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {t['rows']} comments in {elapsed:.1f}s ({t['rows'] / elapsed if elapsed else 0:.0f} rows/s), "
+            f"{t['flipped']} labels flipped ({t['to_bullying']} -> bullying, {t['to_clean']} -> clean)"
+        ))
+
+    def _classify(self, texts, registry, pool, workers):
+        if pool is None:
+            return [d.label for d in registry.classify_texts(texts)]
+        step = -(-len(texts) // workers)
+        parts = pool.map(_classify_in_worker, [texts[i:i + step] for i in range(0, len(texts), step)])
+        return [label for part in parts for label in part]
+
+    def _flush(self, batch, registry, pool, opts):
+        labels = self._classify([c.comments for c in batch], registry, pool, opts['workers'])
+        changed = []
+        delta = stats.Delta()
+        for comment, label in zip(batch, labels):
+            if comment.status != label:
+                delta.comment(comment.user_id, comment.post_id, comment.date,
+                              old_status=comment.status, new_status=label)
+                comment.status = label
+                changed.append(comment)
+                self.totals['to_bullying' if label == BULLYING else 'to_clean'] += 1
+
+        if changed and not opts['dry_run']:
+            with transaction.atomic():
+                Comment.objects.bulk_update(changed, ['status'], batch_size=500)
+                delta.apply()
+        if not opts['dry_run']:
+            self._write_checkpoint(opts['checkpoint'], batch[-1].id)
+
+        self.totals['rows'] += len(batch)
+        self.totals['flipped'] += len(changed)
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"  up to id {batch[-1].id}: {self.totals['rows']} rows, "
+            f"{self.totals['rows'] / elapsed if elapsed else 0:.0f} rows/s, {self.totals['flipped']} flipped"
+        )
+
+    @staticmethod
+    def _read_checkpoint(path, default: int) -> int:
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or default)
+        return default
+
+    @staticmethod
+    def _write_checkpoint(path, last_id: int):
+        if not path:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(last_id))
+        os.replace(tmp, path)
@@ -0,0 +1,372 @@
+"""
+Image uploads: streamed, content-addressed, sanitized off the request thread.
+
+Photos arrive as a multipart file field or, for older clients, as a base64
+form field. Either way the bytes are spooled to a temp file in chunks and
+hashed with SHA-256 on the way (``HashingUploadHandler`` for multipart,
+``spool_base64`` for base64). No full copy of the image is kept in memory.
+Multipart files over MEDIA_MAX_UPLOAD_BYTES stop the upload as soon as they
+cross the limit (base64 fields are capped by DATA_UPLOAD_MAX_MEMORY_SIZE).
+
+``store_image`` runs on the request thread and only reads the image header
+with Pillow. It rejects files that are not JPEG/PNG/WebP/GIF or that are
+larger than MEDIA_MAX_PIXELS, then returns the content-addressed name
+``<subdir>/<sha[:2]>/<sha>.<ext>``. The same image is stored once, however
+often it is uploaded. A worker pool (MEDIA_WORKER_THREADS) then decodes the
+image fully, applies its EXIF orientation and re-encodes it without metadata
+(EXIF, GPS, XMP) before saving it to default_storage. Images that fail to
+decode (e.g. truncated after a valid header) are logged and not stored, and
+Post / UserProfile rows pointing at their name are reset to no photo, whether
+they were saved before or after the failure.
+
+The same worker also writes the resized variants in MEDIA_VARIANTS (a
+square-cropped thumbnail and a medium image by default) as
+``variants/<variant>/<name>.<webp|jpg>``. Variant URLs are derived from the
+original's name, so responses never need to check whether a variant exists.
+``serve_media`` falls back to the original until the variant is written.
+``manage.py generate_variants`` backfills media uploaded before variants
+existed. Content-addressed files never change, so they are served with a
+one-year immutable Cache-Control.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Pillow format -> stored extension
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+DEFAULT_VARIANTS = {'thumb': {'size': 200, 'crop': True}, 'medium': {'size': 800}}
+VARIANT_FORMATS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_VARIANT_PATH = re.compile(r'^variants/(?P<variant>\w+)/(?P<source>.+)\.(?:webp|jpg)$')
+_CONTENT_ADDRESSED = re.compile(r'(^|/)[0-9a-f]{64}\.\w+$')
+
+_BASE64_CHUNK = 4 * 64 * 1024    # multiple of 4: every slice decodes on its own
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}                    # name -> Future, in this process
+_pending_lock = threading.Lock()
+_failed = OrderedDict()          # names whose decode failed, most recent last
+_MAX_FAILED = 1000
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image we accept."""
+
+
+class SpooledImage(UploadedFile):
+    """An upload spooled to a temp file, with the SHA-256 of its bytes.
+
+    The temp file is removed on close unless ``detach`` handed it over.
+    """
+
+    def __init__(self, path, sha256, size, name='upload', content_type=None):
+        super().__init__(open(path, 'rb'), name, content_type, size)
+        self.path = path
+        self.sha256 = sha256
+
+    def detach(self) -> str:
+        path, self.path = self.path, None
+        self.file.close()
+        return path
+
+    def close(self):
+        super().close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+def _temp_file():
+    fd, path = tempfile.mkstemp(prefix='upload-', dir=getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None))
+    return os.fdopen(fd, 'wb'), path
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Streams every uploaded file to disk and hashes it chunk by chunk."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.out, self.path = _temp_file()
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > getattr(settings, 'MEDIA_MAX_UPLOAD_BYTES', 10 * 1024 * 1024):
+            # the parser does not call upload_interrupted for StopUpload
+            self.upload_interrupted()
+            self.path = None
+            self.request.media_upload_error = "image too large"
+            raise StopUpload(connection_reset=True)
+        self.digest.update(raw_data)
+        self.out.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.out.close()
+        return SpooledImage(self.path, self.digest.hexdigest(), file_size, self.file_name, self.content_type)
+
+    def upload_interrupted(self):
+        if getattr(self, 'path', None):
+            self.out.close()
+            os.remove(self.path)
+
+
+def spool_base64(data: str) -> SpooledImage:
+    """Decode a base64 (or data: URI) string to a temp file, hashing as it goes."""
+    if data.startswith('data:') and ',' in data:
+        data = data.split(',', 1)[1]
+    if any(c in data for c in ' \r\n\t'):
+        data = ''.join(data.split())
+    data += '=' * (-len(data) % 4)
+    out, path = _temp_file()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with out:
+            for i in range(0, len(data), _BASE64_CHUNK):
+                chunk = base64.b64decode(data[i:i + _BASE64_CHUNK], validate=True)
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except ValueError:
+        os.remove(path)
+        raise InvalidImage("invalid base64 image data")
+    return SpooledImage(path, digest.hexdigest(), size)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'MEDIA_WORKER_THREADS', 2),
+                                               thread_name_prefix='media')
+    return _executor
+
+
+def _variants() -> dict:
+    return getattr(settings, 'MEDIA_VARIANTS', DEFAULT_VARIANTS)
+
+
+def variant_name(name: str, variant: str) -> str:
+    ext = VARIANT_FORMATS[getattr(settings, 'MEDIA_VARIANT_FORMAT', 'WEBP')]
+    return f"variants/{variant}/{name}.{ext}"
+
+
+def variant_source(path: str):
+    """Original name a variant path was derived from, or None for non-variants."""
+    match = _VARIANT_PATH.match(path)
+    return match.group('source') if match and match.group('variant') in _variants() else None
+
+
+def variant_urls(name, prefix: str = 'photo') -> dict:
+    """``{'<prefix>_<variant>': url}`` for every configured variant ('' without a photo)."""
+    return {f'{prefix}_{v}': default_storage.url(variant_name(name, v)) if name else '' for v in _variants()}
+
+
+def cache_control(path: str) -> str:
+    """Cache-Control for a media path: content-addressed files and their variants never change."""
+    source = variant_source(path) or path
+    if _CONTENT_ADDRESSED.search(source):
+        return 'public, max-age=31536000, immutable'
+    return 'public, max-age=86400'
+
+
+def render_variant(im, size: int, crop: bool = False):
+    """``im`` cropped to a size x size square, or shrunk to fit in one (never enlarged)."""
+    if im.mode not in ('RGB', 'RGBA', 'L'):
+        im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+    if crop:
+        side = min(size, *im.size)
+        return ImageOps.fit(im, (side, side), Image.LANCZOS)
+    im = im.copy()
+    im.thumbnail((size, size), Image.LANCZOS)
+    return im
+
+
+def generate_variants(name: str, image=None, force: bool = False) -> int:
+    """Write the missing variants of a stored image; returns how many were written."""
+    fmt = getattr(settings, 'MEDIA_VARIANT_FORMAT', 'WEBP')
+    todo = {v: spec for v, spec in _variants().items()
+            if force or not default_storage.exists(variant_name(name, v))}
+    if not todo:
+        return 0
+    if image is None:
+        with default_storage.open(name) as f, Image.open(f) as im:
+            im.load()
+            return generate_variants(name, ImageOps.exif_transpose(im), force)
+    for variant, spec in todo.items():
+        im = render_variant(image, spec['size'], spec.get('crop', False))
+        if fmt == 'JPEG' and im.mode != 'RGB':
+            im = im.convert('RGB')
+        out, tmp = _temp_file()
+        try:
+            with out:
+                im.save(out, fmt, quality=spec.get('quality', 80))
+            target = variant_name(name, variant)
+            if force and default_storage.exists(target):
+                default_storage.delete(target)
+            with open(tmp, 'rb') as f:
+                saved = default_storage.save(target, File(f))
+            if saved != target:
+                default_storage.delete(saved)
+        finally:
+            os.remove(tmp)
+    return len(todo)
+
+
+def _sanitize(path: str, name: str, fmt: str):
+    """Decode, orient and re-encode without metadata, then store as ``name``."""
+    try:
+        with Image.open(path) as im:
+            im.load()
+            if fmt == 'GIF':
+                clean = im                        # no EXIF; keep animation frames
+                options = {'save_all': getattr(im, 'is_animated', False)}
+            else:
+                clean = ImageOps.exif_transpose(im)
+                if fmt == 'JPEG' and clean.mode not in ('RGB', 'L'):
+                    clean = clean.convert('RGB')
+                options = {'JPEG': {'quality': 90, 'optimize': True}, 'PNG': {'optimize': True},
+                           'WEBP': {'quality': 90}}[fmt]
+            out, tmp = _temp_file()
+            try:
+                with out:
+                    clean.save(out, fmt, **options)
+                with open(tmp, 'rb') as f:
+                    saved = default_storage.save(name, File(f))
+                if saved != name:                 # another process stored it first
+                    default_storage.delete(saved)
+            finally:
+                os.remove(tmp)
+            generate_variants(name, clean)
+    except Exception:
+        logger.exception("Could not process uploaded image %s", name)
+        with _pending_lock:
+            _failed[name] = True
+            while len(_failed) > _MAX_FAILED:
+                _failed.popitem(last=False)
+        _clear_references(name)
+    finally:
+        os.remove(path)
+        with _pending_lock:
+            _pending.pop(name, None)
+
+
+def _sanitize_job(path: str, name: str, fmt: str):
+    """``_sanitize`` on a worker thread, which must not keep the connection _clear_references opened."""
+    try:
+        _sanitize(path, name, fmt)
+    finally:
+        close_old_connections()
+
+
+def _clear_references(name: str):
+    """Point rows that use ``name`` (never written) back to no photo."""
+    from .models import Post, UserProfile
+    try:
+        Post.objects.filter(photo=name).update(photo=None)
+        for profile in UserProfile.objects.filter(photo=name):
+            profile.photo = None
+            profile.save(update_fields=['photo'])      # signals drop the cached profile JSON
+    except Exception:
+        logger.exception("Could not clear references to %s", name)
+
+
+def store_image(upload: SpooledImage, subdir: str) -> str:
+    """
+    Validate the header of a spooled upload and return its content-addressed
+    name; the sanitized file is written in the background. Raises InvalidImage.
+    """
+    try:
+        with Image.open(upload.path) as im:
+            fmt, (width, height) = im.format, im.size
+    except (OSError, Image.DecompressionBombError):
+        upload.close()
+        raise InvalidImage("not an image")
+    if fmt not in FORMATS:
+        upload.close()
+        raise InvalidImage(f"unsupported image format {fmt}")
+    if width * height > getattr(settings, 'MEDIA_MAX_PIXELS', 40_000_000):
+        upload.close()
+        raise InvalidImage("image too large")
+
+    sha = upload.sha256
+    name = f"{subdir}/{sha[:2]}/{sha}.{FORMATS[fmt]}"
+    with _pending_lock:
+        _failed.pop(name, None)                    # try again; it may have been a transient error
+        if name in _pending or default_storage.exists(name):
+            upload.close()
+            return name
+        _pending[name] = None
+    path = upload.detach()
+    try:
+        future = _get_executor().submit(_sanitize_job, path, name, fmt)
+    except RuntimeError:                           # executor shut down (interpreter exit)
+        _sanitize(path, name, fmt)
+        return name
+    with _pending_lock:
+        if name in _pending:
+            _pending[name] = future
+    return name
+
+
+def save_upload(request, field: str, subdir: str):
+    """
+    Store the image in ``field`` (multipart file, or base64 form value) and
+    return its storage name, or None if the field is empty. Raises InvalidImage.
+    """
+    upload = request.FILES.get(field)
+    if upload is None:
+        error = getattr(request, 'media_upload_error', None)
+        if error:                                  # set by HashingUploadHandler
+            raise InvalidImage(error)
+        data = request.POST.get(field, '')
+        if len(data) <= 10:                        # clients send '' or placeholders for "no photo"
+            return None
+        upload = spool_base64(data)
+    elif not isinstance(upload, SpooledImage):
+        raise InvalidImage("upload was not spooled; check FILE_UPLOAD_HANDLERS")
+    return store_image(upload, subdir)
+
+
+def on_photo_saved(sender, instance, **kwargs):
+    # the upload's decode may fail before the row referencing it is saved
+    name = instance.photo.name if instance.photo else None
+    if name and name in _failed:
+        sender.objects.filter(pk=instance.pk).update(photo=None)
+        instance.photo = None
+
+
+def connect_signals():
+    from django.db.models.signals import post_save
+    from .models import Post, UserProfile
+    post_save.connect(on_photo_saved, sender=Post, dispatch_uid='media_post_saved')
+    post_save.connect(on_photo_saved, sender=UserProfile, dispatch_uid='media_profile_saved')
+
+
+def flush(timeout=None):
+    """Wait for images still being processed in this process (tests, shutdown)."""
+    with _pending_lock:
+        futures = [f for f in _pending.values() if f is not None]
+    wait(futures, timeout)
@@ -0,0 +1,233 @@
+"""
+Request and inference metrics in the Prometheus text format.
+
+MetricsMiddleware records, per URL name: a latency histogram, the number and
+time of database queries, the response size and a request counter by method
+and status. The model path records tokenize / pad / predict time through
+``stage``. Everything is kept in one in-process Registry and rendered at
+/metrics (clients from METRICS_ALLOWED_IPS only).
+
+With METRICS_ENABLED off the middleware removes itself (MiddlewareNotUsed)
+and ``stage`` returns a shared no-op context manager, so the cost is a flag
+check per model call.
+
+Multi-process servers: with METRICS_MULTIPROC_DIR set, every worker writes its
+registry to ``<dir>/metrics-<pid>.json`` at most every METRICS_FLUSH_SECONDS,
+and /metrics merges all files, so whichever worker answers the scrape reports
+the whole server. Files of exited workers are kept, so counters do not go
+backwards when a worker is replaced; clear the directory when the server
+restarts.
+
+This module does not import Django at load time, so the ml package can use it
+outside a Django process (where it stays disabled).
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'myapp_http_requests_total': ('counter', "Requests by URL name, method and status.", None),
+    'myapp_http_request_duration_seconds': ('histogram', "Time until the view returned a response.",
+                                            LATENCY_BUCKETS),
+    'myapp_http_response_size_bytes': ('histogram', "Response body size (non-streaming responses).",
+                                       SIZE_BUCKETS),
+    'myapp_db_queries_per_request': ('histogram', "Database queries run by one request.", QUERY_BUCKETS),
+    'myapp_db_query_seconds_total': ('counter', "Time spent in database queries.", None),
+    'myapp_ml_stage_seconds': ('histogram', "Model path time by stage (tokenize, pad, predict).",
+                               STAGE_BUCKETS),
+}
+
+enabled = False
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class Registry:
+    """Counters and histograms keyed by (metric name, label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}     # key -> [bucket counts..., +Inf count, sum]
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(buckets)] += 1
+            counts[-1] += value
+
+    def snapshot(self) -> dict:
+        """JSON-serializable copy of every series."""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(counts)]
+                               for (name, labels), counts in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict):
+        for name, labels, value in snapshot.get('counters', ()):
+            if name in METRICS:
+                self.inc(name, tuple(map(tuple, labels)), value)
+        for name, labels, counts in snapshot.get('histograms', ()):
+            if name not in METRICS:
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            with self._lock:
+                mine = self.histograms.setdefault(key, [0] * len(counts))
+                for i, n in enumerate(counts):
+                    mine[i] += n
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs) -> str:
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+
+def render(registry: Registry) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    snapshot = registry.snapshot()
+    counters, histograms = {}, {}
+    for name, labels, value in snapshot['counters']:
+        counters.setdefault(name, []).append((labels, value))
+    for name, labels, counts in snapshot['histograms']:
+        histograms.setdefault(name, []).append((labels, counts))
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = counters.get(name) if kind == 'counter' else histograms.get(name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels + [["le", bound]])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def get_registry() -> Registry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry()
+    return _registry
+
+
+@contextmanager
+def _timed(name: str, labels: tuple):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_registry().observe(name, time.perf_counter() - started, labels)
+
+
+_noop = nullcontext()
+
+
+def stage(name: str):
+    """``with stage('predict'):`` records the block's time under myapp_ml_stage_seconds."""
+    if not enabled:
+        return _noop
+    return _timed('myapp_ml_stage_seconds', (('stage', name),))
+
+
+class MultiprocessWriter:
+    """Writes this worker's registry to METRICS_MULTIPROC_DIR, at most every ``interval`` seconds."""
+
+    def __init__(self, directory: str, interval: float = 5.0):
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def maybe_flush(self):
+        if time.monotonic() >= self._next:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._next = time.monotonic() + self.interval
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(get_registry().snapshot(), f)
+            os.replace(tmp, self.path)
+
+    def collect(self) -> Registry:
+        """A registry holding the sum of every worker's last flush (this one's is fresh)."""
+        self.flush()
+        merged = Registry()
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    merged.merge(json.load(f))
+            except (OSError, ValueError):
+                continue        # a worker replaced it mid-read; it is complete on the next scrape
+        return merged
+
+
+_writer = None
+
+
+def configure(settings):
+    """Called from MyappConfig.ready(): turn collection on from settings."""
+    global enabled, _writer
+    enabled = getattr(settings, 'METRICS_ENABLED', False)
+    directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+    if enabled and directory:
+        os.makedirs(directory, exist_ok=True)
+        _writer = MultiprocessWriter(directory, getattr(settings, 'METRICS_FLUSH_SECONDS', 5.0))
+    else:
+        _writer = None
+
+
+def get_writer():
+    return _writer
+
+
+def exposition() -> str:
+    """The /metrics body: this process, or every worker with METRICS_MULTIPROC_DIR."""
+    writer = get_writer()
+    return render(writer.collect() if writer is not None else get_registry())
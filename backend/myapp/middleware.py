@@ -0,0 +1,83 @@
+"""
+Request middleware for the myapp JSON API.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import metrics
+from .tokens import bearer_token, verify_token
+
+
+class TokenAuthMiddleware:
+    """
+    Sets ``request.identity`` from an ``Authorization: Bearer`` token: an
+    Identity(login_id, profile_id, type), or None when the token is missing,
+    forged, expired or revoked. The revocation check reads the profile cache
+    (tokens.ProfileCache), so it queries only on a cache miss. Views read it
+    through ``tokens.get_identity``, which also handles legacy ``lid`` clients.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = bearer_token(request)
+        request.identity = verify_token(token) if token else None
+        return self.get_response(request)
+
+
+class _QueryTimer:
+    """connection.execute_wrapper that counts and times the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database queries and response size per URL name (see
+    myapp/metrics.py). Not installed at all unless METRICS_ENABLED is on.
+    Latency is measured until the view returns, so for streamed responses it
+    excludes producing the body, and their size is not recorded.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        labels = (('view', view),)
+        registry = metrics.get_registry()
+        registry.inc('myapp_http_requests_total',
+                     labels + (('method', request.method), ('status', str(response.status_code))))
+        registry.observe('myapp_http_request_duration_seconds', elapsed, labels)
+        registry.observe('myapp_db_queries_per_request', queries.count, labels)
+        registry.inc('myapp_db_query_seconds_total', labels, queries.seconds)
+        if not response.streaming:
+            registry.observe('myapp_http_response_size_bytes', len(response.content), labels)
+        writer = metrics.get_writer()
+        if writer is not None:
+            writer.maybe_flush()
+        return response
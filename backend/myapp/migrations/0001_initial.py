@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Login',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('password', models.CharField(max_length=128)),
+                ('type', models.CharField(choices=[('admin', 'Admin'), ('user', 'User')], default='user', max_length=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('dob', models.DateField(blank=True, null=True)),
+                ('gender', models.CharField(blank=True, max_length=20)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('place', models.CharField(blank=True, max_length=200)),
+                ('post', models.CharField(blank=True, max_length=200)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('pin', models.CharField(blank=True, max_length=20)),
+                ('district', models.CharField(blank=True, max_length=100)),
+                ('photo', models.ImageField(blank=True, null=True, upload_to='profile_photos/')),
+                ('login', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='myapp.login')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Post',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desc', models.CharField(blank=True, max_length=500)),
+                ('photo', models.ImageField(blank=True, null=True, upload_to='post_photos/')),
+                ('date', models.DateField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FriendRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_requests', to='myapp.userprofile')),
+                ('to_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_requests', to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Complaint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint', models.TextField()),
+                ('reply', models.TextField(default='pending')),
+                ('status', models.CharField(default='pending', max_length=50)),
+                ('date', models.DateField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='complaints', to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comments', models.TextField()),
+                ('status', models.CharField(default='Not Bullying', max_length=100)),
+                ('date', models.DateField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='myapp.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Chat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('message', models.TextField()),
+                ('from_login', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chats_from', to='myapp.login')),
+                ('to_login', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chats_to', to='myapp.login')),
+            ],
+        ),
+    ]
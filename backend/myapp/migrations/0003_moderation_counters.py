@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('total', 'Total'), ('user', 'User'), ('post', 'Post'), ('day', 'Day')], max_length=8)),
+                ('key', models.CharField(blank=True, max_length=32)),
+                ('bullying', models.IntegerField(default=0)),
+                ('clean', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('open_complaints', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='moderation_counter_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_comment_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OffenderAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=20)),
+                ('count', models.IntegerField()),
+                ('window', models.IntegerField()),
+                ('at', models.DateTimeField()),
+                ('throttled_until', models.DateTimeField(blank=True, null=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offender_actions', to='myapp.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'throttled_until'], name='offender_throttle_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,7 @@
+# myapp/ml/__init__.py
+"""
+Inference stack for the cyberbullying classifier.
+
+Nothing in this package imports TensorFlow at import time, so it is safe to
+import from views, management commands and tests on machines without TF.
+"""
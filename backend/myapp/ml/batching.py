@@ -0,0 +1,210 @@
+"""
+Micro-batching scheduler for model inference.
+
+Every comment used to run ``model.predict`` on a batch of one, paying the
+framework's per-call overhead each time. ``InferenceBatcher`` owns a single
+worker thread that collects concurrent requests for up to ``max_wait_ms``
+(or until ``max_batch_size`` requests are queued), runs one padded batch
+through the model and hands each caller its own score.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+from ..metrics import stage
+from .bucketing import predict_bucketed
+from .preprocessing import pad_post
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the queue-wait histogram buckets; the last bucket is open.
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100)
+
+
+def pad_batch(sequences, maxlen: int) -> np.ndarray:
+    """
+    Pad/truncate token-id sequences to ``maxlen`` the way the model was trained
+    (padding='post', truncating='post') and return an int32 matrix.
+    """
+    return pad_post(sequences, maxlen)
+
+
+def scores_from_prediction(pred, n: int) -> np.ndarray:
+    """Flatten a sigmoid model output of shape (n,) or (n, 1) to a float vector."""
+    return np.asarray(pred, dtype=np.float32).reshape(n, -1)[:, 0]
+
+
+class BatcherStats:
+    """Thread-safe counters for batch sizes and time spent waiting in the queue."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.errors = 0
+        self.batch_sizes = Counter()
+        self.queue_wait_ms_total = 0.0
+        self.queue_wait_ms_max = 0.0
+        self.queue_wait_buckets = [0] * (len(QUEUE_WAIT_BUCKETS_MS) + 1)
+        self.predict_ms_total = 0.0
+
+    def record_batch(self, waits_ms, predict_ms: float, failed: bool = False):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(waits_ms)
+            self.batch_sizes[len(waits_ms)] += 1
+            self.predict_ms_total += predict_ms
+            if failed:
+                self.errors += 1
+            for wait in waits_ms:
+                self.queue_wait_ms_total += wait
+                self.queue_wait_ms_max = max(self.queue_wait_ms_max, wait)
+                for idx, bound in enumerate(QUEUE_WAIT_BUCKETS_MS):
+                    if wait <= bound:
+                        self.queue_wait_buckets[idx] += 1
+                        break
+                else:
+                    self.queue_wait_buckets[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'errors': self.errors,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'mean_queue_wait_ms': self.queue_wait_ms_total / self.requests if self.requests else 0.0,
+                'max_queue_wait_ms': self.queue_wait_ms_max,
+                'queue_wait_buckets_ms': dict(zip(
+                    [str(b) for b in QUEUE_WAIT_BUCKETS_MS] + ['+Inf'], self.queue_wait_buckets)),
+                'mean_predict_ms': self.predict_ms_total / self.batches if self.batches else 0.0,
+            }
+
+
+class _Request:
+    __slots__ = ('sequence', 'future', 'enqueued')
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class InferenceBatcher:
+    """
+    Shared, in-process inference scheduler.
+
+    ``predict_fn`` receives an int32 matrix of shape (batch, maxlen) and must
+    return one sigmoid score per row. With ``buckets`` set, each batch is split
+    by length bucket and padded only to the bucket bound (masked models only).
+    The worker thread is started lazily on the first ``submit`` and is a
+    daemon, so it never blocks interpreter exit.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0, maxlen: int = 100,
+                 buckets=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.maxlen = maxlen
+        self.buckets = buckets
+        self.stats = BatcherStats()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, sequence) -> Future:
+        """Queue one token-id sequence; the returned future resolves to its score."""
+        req = _Request(sequence)
+        # under the lock, so nothing is queued behind close()'s stop marker
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("InferenceBatcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                self._thread.start()
+            self._queue.put(req)
+        return req.future
+
+    def score(self, sequence, timeout: float = None) -> float:
+        """Blocking convenience wrapper around ``submit``."""
+        return self.submit(sequence).result(timeout=timeout)
+
+    def close(self):
+        """Stop the worker after it drains the requests already queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        # anything still queued would never be scored: fail it rather than leave callers waiting
+        while True:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is not None:
+                req.future.set_exception(RuntimeError("InferenceBatcher is closed"))
+
+    def _collect(self, first):
+        """Gather up to max_batch_size requests, waiting at most max_wait after the first one."""
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # Drain whatever piled up while the previous batch was running.
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._process(self._collect(first))
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        waits_ms = [(started - req.enqueued) * 1000.0 for req in batch]
+        try:
+            sequences = [req.sequence for req in batch]
+            if self.buckets:
+                scores = predict_bucketed(sequences, self.predict_fn, self.buckets, self.maxlen)
+            else:
+                with stage('pad'):
+                    padded = pad_batch(sequences, self.maxlen)
+                scores = scores_from_prediction(self.predict_fn(padded), len(batch))
+        except Exception as exc:
+            logger.exception("Batched inference failed for %d requests", len(batch))
+            self.stats.record_batch(waits_ms, (time.perf_counter() - started) * 1000.0, failed=True)
+            for req in batch:
+                req.future.set_exception(exc)
+            return
+        self.stats.record_batch(waits_ms, (time.perf_counter() - started) * 1000.0)
+        for req, score in zip(batch, scores):
+            req.future.set_result(float(score))
@@ -0,0 +1,152 @@
+"""
+Bounded cache of classifier scores keyed on the token-id sequence.
+
+Harassment is repetitive, and strings that differ only in case, punctuation or
+out-of-vocabulary words tokenize to the same ids, so keying on the ids lets
+those variants share one entry. Entries are scoped to the model version (a
+fingerprint of the loaded artifacts); loading a different artifact clears the
+local cache and changes every shared key, so stale scores are never served.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def sequence_key(sequence, maxlen: int) -> bytes:
+    """Compact, hashable key for a token-id sequence as the model sees it."""
+    return np.asarray(sequence[:maxlen], dtype=np.int32).tobytes()
+
+
+class LocalBackend:
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 50000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            score, expires = item
+            if expires < now:
+                del self._data[key]
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return score
+
+    def set(self, key, score: float):
+        with self._lock:
+            self._store(key, score)
+
+    def add(self, key, value) -> bool:
+        """Set ``key`` only if it holds no live entry; True if stored."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] >= time.monotonic():
+                return False
+            self._store(key, value)
+            return True
+
+    def _store(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """
+    Shared backend on top of a Django CACHES alias (e.g. a file-based or
+    database cache) so every worker benefits from each other's predictions.
+    Keys carry the model version, so ``clear`` has nothing to do.
+    """
+
+    def __init__(self, alias: str, ttl: float = 3600):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.evictions = 0
+        self.version = ''
+
+    def _key(self, key: bytes) -> str:
+        return f"mlpred:{self.version}:{hashlib.blake2b(key, digest_size=16).hexdigest()}"
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, score: float):
+        self.cache.set(self._key(key), score, timeout=self.ttl)
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class PredictionCache:
+    """Version-scoped score cache with hit/miss counters."""
+
+    def __init__(self, backend, maxlen: int = 100):
+        self.backend = backend
+        self.maxlen = maxlen
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def set_version(self, version: str):
+        """Called whenever the registry loads an artifact; drops stale entries."""
+        if version != self.version:
+            self.backend.clear()
+            self.version = version
+            if hasattr(self.backend, 'version'):
+                self.backend.version = version
+
+    def get(self, sequence):
+        score = self.backend.get(sequence_key(sequence, self.maxlen))
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def set(self, sequence, score: float, version: str = None):
+        """Store a score; ignored when ``version`` is given and no longer current (a reload won)."""
+        if version is not None and version != self.version:
+            return
+        self.backend.set(sequence_key(sequence, self.maxlen), score)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'version': self.version,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions,
+        }
@@ -0,0 +1,127 @@
+"""
+Lexicon fast path in front of the Bi-LSTM.
+
+Many comments are either obviously clean ("nice photo") or contain an
+unambiguous slur or threat ("kill yourself"). ``CascadeClassifier`` matches
+every lexicon phrase in a single pass over the comment's words (Aho-Corasick
+over word tokens) and decides those cases on the spot. Only ambiguous comments
+go on to the model.
+
+The lexicon (myapp/lexicon.json, see ML_LEXICON_PATH) has four sections:
+- ``abusive``: phrase -> confidence; a match at or above the block threshold
+  decides "Bullying Words". Only slurs and threats sit that high; insults
+  ("idiot", "hate you") are common in banter and quotes, so they only keep a
+  comment from being decided clean and leave the verdict to the model;
+- ``benign``: phrases that are evidence of a clean comment;
+- ``neutral``: filler words that neither help nor hurt;
+- ``qualifiers``: negations and reporting verbs ("not", "never", "said").
+  An abusive match with one of them in the ``window`` words before it ("you
+  are not worthless", "he called me a loser") never decides on its own.
+A comment is decided clean only if nothing abusive matched, at least one benign
+phrase matched and every word is covered by a benign or neutral entry.
+"""
+
+import json
+from collections import deque
+
+from .labels import BULLYING, NOT_BULLYING, Decision
+from .preprocessing import clean_text
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton whose alphabet is words rather than characters."""
+
+    def __init__(self, phrases):
+        # parallel per-node lists: transitions, failure link, outputs as (phrase, length)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase in phrases:
+            words = tuple(phrase.split())
+            if not words:
+                continue
+            node = 0
+            for word in words:
+                nxt = self._goto[node].get(word)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][word] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((phrase, len(words)))
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, words):
+        """Yield (phrase, start, end) for every phrase occurrence in ``words``."""
+        node = 0
+        for end, word in enumerate(words, 1):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            for phrase, length in self._out[node]:
+                yield phrase, end - length, end
+
+
+class CascadeClassifier:
+    """Confidence-gated lexicon stage; ``decide`` returns None for ambiguous text."""
+
+    def __init__(self, abusive: dict, benign: dict = None, neutral=(), block_threshold: float = 0.9,
+                 qualifiers=(), window: int = 5):
+        self.abusive = {' '.join(p.lower().split()): float(w) for p, w in abusive.items()}
+        self.benign = {' '.join(p.lower().split()): float(w) for p, w in (benign or {}).items()}
+        self.neutral = frozenset(w.lower() for w in neutral)
+        self.qualifiers = frozenset(w.lower() for w in qualifiers)
+        self.window = window
+        self.block_threshold = block_threshold
+        self.matcher = PhraseMatcher(list(self.abusive) + list(self.benign))
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'CascadeClassifier':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('abusive', {}), data.get('benign', {}), data.get('neutral', ()),
+                   qualifiers=data.get('qualifiers', ()), **kwargs)
+
+    def _qualified(self, words, start: int) -> bool:
+        """Whether a negation or reporting verb precedes the phrase starting at ``start``."""
+        return any(w in self.qualifiers for w in words[max(start - self.window, 0):start])
+
+    def decide(self, words):
+        """Decide from a comment's (cleaned, lowercased) words, or return None."""
+        if not words:
+            return Decision(NOT_BULLYING, 0.0, 'lexicon')
+        covered = [False] * len(words)
+        worst = 0.0         # any abusive match keeps the comment from being decided clean
+        block = 0.0         # unqualified matches at or above the block threshold
+        benign_hit = False
+        for phrase, start, end in self.matcher.find(words):
+            if phrase in self.abusive:
+                weight = self.abusive[phrase]
+                worst = max(worst, weight)
+                if weight >= self.block_threshold and not self._qualified(words, start):
+                    block = max(block, weight)
+            else:
+                benign_hit = True
+                covered[start:end] = [True] * (end - start)
+        if block:
+            return Decision(BULLYING, block, 'lexicon')
+        if worst == 0.0 and benign_hit and all(c or w in self.neutral for c, w in zip(covered, words)):
+            return Decision(NOT_BULLYING, 0.0, 'lexicon')
+        return None
+
+    def decide_text(self, text: str):
+        return self.decide(clean_text(text).split())
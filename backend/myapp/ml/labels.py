@@ -0,0 +1,15 @@
+"""Comment.status labels produced by the classifier and its helper stages."""
+
+from collections import namedtuple
+
+BULLYING = "Bullying Words"
+NOT_BULLYING = "Not Bullying"
+THRESHOLD = 0.5
+
+# stage: 'lexicon', 'cache', 'model' or 'fallback' -- whichever decided the label
+Decision = namedtuple('Decision', 'label score stage')
+
+
+def label_for(score: float) -> str:
+    """Comment.status value for a sigmoid score."""
+    return BULLYING if score >= THRESHOLD else NOT_BULLYING
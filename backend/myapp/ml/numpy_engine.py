@@ -0,0 +1,243 @@
+"""
+Pure-NumPy inference for the Bi-LSTM classifier built in train_model.py.
+
+The model is Embedding -> Bidirectional(LSTM) -> Dense... -> Dense(1, sigmoid).
+``export_weights`` dumps a trained Keras model to a ``.npz`` archive and
+``NumpyBiLSTM`` runs the same forward pass without importing TensorFlow:
+
+    python -m myapp.ml.numpy_engine path/to/cyberbullying_model out.npz
+
+Two things make it cheap on CPU:
+- the embedding and the LSTM input projection are folded into one lookup
+  table per direction, so the input matmul becomes a gather;
+- when the Embedding was trained with ``mask_zero=True``, rows are processed
+  longest-first and each timestep only updates the rows that still have
+  tokens, so post-padding timesteps are skipped entirely.
+
+float16 / int8 variants of an archive are produced by ``myapp.ml.quantize``.
+"""
+
+import json
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _relu(x):
+    return np.maximum(x, 0.0)
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'relu': _relu,
+    'linear': _linear,
+}
+
+
+def _activation_name(fn) -> str:
+    name = getattr(fn, '__name__', str(fn))
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation for NumPy inference: {name}")
+    return name
+
+
+def export_weights(model, path: str, extra_meta: dict = None) -> dict:
+    """
+    Write the weights of a trained Keras Bi-LSTM model to ``path`` (.npz).
+    Dropout/Input layers are skipped; any other layer type is rejected.
+    Returns the metadata stored in the archive.
+    """
+    arrays = {}
+    meta = {'format_version': FORMAT_VERSION, 'dense_activations': []}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ('Dropout', 'InputLayer', 'SpatialDropout1D'):
+            continue
+        if kind == 'Embedding':
+            arrays['embedding'] = layer.get_weights()[0]
+            meta['mask_zero'] = bool(getattr(layer, 'mask_zero', False))
+        elif kind == 'Bidirectional':
+            if getattr(layer, 'merge_mode', 'concat') != 'concat':
+                raise ValueError("Only merge_mode='concat' is supported")
+            for prefix, lstm in (('fw', layer.forward_layer), ('bw', layer.backward_layer)):
+                if type(lstm).__name__ != 'LSTM' or lstm.return_sequences:
+                    raise ValueError("Expected an LSTM with return_sequences=False")
+                kernel, recurrent, bias = lstm.get_weights()
+                arrays[f'lstm_{prefix}_kernel'] = kernel
+                arrays[f'lstm_{prefix}_recurrent_kernel'] = recurrent
+                arrays[f'lstm_{prefix}_bias'] = bias
+                meta['lstm_activation'] = _activation_name(lstm.activation)
+                meta['lstm_recurrent_activation'] = _activation_name(lstm.recurrent_activation)
+        elif kind == 'Dense':
+            idx = len(meta['dense_activations'])
+            kernel, bias = layer.get_weights()
+            arrays[f'dense_{idx}_kernel'] = kernel
+            arrays[f'dense_{idx}_bias'] = bias
+            meta['dense_activations'].append(_activation_name(layer.activation))
+        else:
+            raise ValueError(f"Layer {layer.name!r} ({kind}) is not supported by the NumPy engine")
+
+    if 'embedding' not in arrays or 'lstm_fw_kernel' not in arrays or not meta['dense_activations']:
+        raise ValueError("Model must contain Embedding, Bidirectional(LSTM) and Dense layers")
+    if extra_meta:
+        meta.update(extra_meta)
+    arrays = {k: np.asarray(v, dtype=np.float32) for k, v in arrays.items()}
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+    return meta
+
+
+def quantize_int8(matrix, axis: int = 0):
+    """Symmetric int8 plus float32 scales, the absolute max taken over ``axis``."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scale = np.abs(matrix).max(axis=axis, keepdims=True) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(matrix / scale).astype(np.int8), scale.astype(np.float32)
+
+
+def dequantize(arrays, name: str) -> np.ndarray:
+    """``arrays[name]`` as float32, applying its ``<name>_scale`` if it was stored as int8."""
+    values = arrays[name]
+    scale = arrays.get(f'{name}_scale')
+    if scale is not None:
+        return values.astype(np.float32) * scale
+    return values.astype(np.float32, copy=False)
+
+
+class NumpyBiLSTM:
+    """Vectorized forward pass over a weights archive written by ``export_weights``."""
+
+    def __init__(self, arrays, meta: dict):
+        self.meta = meta
+        self.mask_zero = bool(meta.get('mask_zero', False))
+        self.act = ACTIVATIONS[meta.get('lstm_activation', 'tanh')]
+        self.recurrent_act = ACTIVATIONS[meta.get('lstm_recurrent_activation', 'sigmoid')]
+        self.quantization = meta.get('quantization', 'float32')
+        embedding = dequantize(arrays, 'embedding')
+        self.directions = []
+        for prefix in ('fw', 'bw'):
+            # Embedding lookup followed by the input projection == lookup in (E @ W + b).
+            projection = embedding @ dequantize(arrays, f'lstm_{prefix}_kernel')
+            bias = arrays[f'lstm_{prefix}_bias'].astype(np.float32)
+            scale = None
+            # Quantized variants keep this table (the largest array) in low precision.
+            # int8 rows are scaled per word, so the bias, which would dominate
+            # every row's range, is added back in float32 instead.
+            if self.quantization == 'int8':
+                table, scale = quantize_int8(projection, axis=1)
+            else:
+                table = (projection + bias).astype(np.float16 if self.quantization == 'float16' else np.float32)
+                bias = None
+            self.directions.append((table, scale, bias, dequantize(arrays, f'lstm_{prefix}_recurrent_kernel')))
+        self.vocab_size = self.directions[0][0].shape[0]
+        self.units = self.directions[0][-1].shape[0]
+        self.dense = [
+            (dequantize(arrays, f'dense_{i}_kernel'), arrays[f'dense_{i}_bias'], ACTIVATIONS[name])
+            for i, name in enumerate(meta['dense_activations'])
+        ]
+
+    @classmethod
+    def load(cls, path: str) -> 'NumpyBiLSTM':
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(str(archive['meta']))
+            arrays = {k: archive[k] for k in archive.files if k != 'meta'}
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported weights archive version: {meta.get('format_version')}")
+        return cls(arrays, meta)
+
+    @property
+    def supports_masking(self) -> bool:
+        """True when padding timesteps do not influence the output (mask_zero)."""
+        return self.mask_zero
+
+    @property
+    def weight_bytes(self) -> int:
+        """Memory held by the weights used at inference time."""
+        arrays = [a for direction in self.directions for a in direction if a is not None]
+        arrays += [a for kernel, bias, _ in self.dense for a in (kernel, bias)]
+        return sum(a.nbytes for a in arrays)
+
+    def _run_direction(self, ids, active, table, scale, bias, recurrent, reverse: bool):
+        n, steps = ids.shape
+        u = self.units
+        h = np.zeros((n, u), dtype=np.float32)
+        c = np.zeros((n, u), dtype=np.float32)
+        order = range(steps - 1, -1, -1) if reverse else range(steps)
+        for t in order:
+            k = active[t]
+            if k == 0:
+                continue
+            rows = ids[:k, t]
+            # float16 tables upcast in the addition; int8 rows are rescaled per token
+            x = table[rows] if scale is None else table[rows] * scale[rows] + bias
+            z = x + h[:k] @ recurrent
+            i = self.recurrent_act(z[:, :u])
+            f = self.recurrent_act(z[:, u:2 * u])
+            g = self.act(z[:, 2 * u:3 * u])
+            o = self.recurrent_act(z[:, 3 * u:])
+            c[:k] = f * c[:k] + i * g
+            h[:k] = o * self.act(c[:k])
+        return h
+
+    def predict(self, padded) -> np.ndarray:
+        """Return one sigmoid score per row of an int matrix of token ids."""
+        ids = np.asarray(padded)
+        if ids.ndim == 1:
+            ids = ids[None, :]
+        ids = ids.astype(np.intp, copy=False)
+        n, steps = ids.shape
+        if n == 0:
+            return np.zeros((0,), dtype=np.float32)
+
+        if self.mask_zero:
+            # Post-padded input: a row's length is the index after its last token.
+            nonzero = ids != 0
+            lengths = np.where(nonzero.any(axis=1), steps - np.argmax(nonzero[:, ::-1], axis=1), 0)
+            order = np.argsort(-lengths, kind='stable')
+            ids = ids[order, :max(int(lengths.max()), 1)]
+            lengths = lengths[order]
+            # active[t] = number of rows (a prefix, since sorted) with a token at t
+            active = (lengths[None, :] > np.arange(ids.shape[1])[:, None]).sum(axis=1)
+        else:
+            order = None
+            active = np.full(steps, n)
+
+        outputs = [
+            self._run_direction(ids, active, *direction, reverse)
+            for direction, reverse in zip(self.directions, (False, True))
+        ]
+        x = np.concatenate(outputs, axis=1)
+        for kernel, bias, act in self.dense:
+            x = act(x @ kernel + bias)
+        scores = x[:, 0]
+        if order is not None:
+            unsorted = np.empty_like(scores)
+            unsorted[order] = scores
+            scores = unsorted
+        return scores.astype(np.float32, copy=False)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Export a trained Keras Bi-LSTM to a NumPy weights archive.")
+    parser.add_argument('model', help="Keras model path (SavedModel dir, .keras or .h5)")
+    parser.add_argument('out', help="output .npz path")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    model = tf.keras.models.load_model(args.model)
+    meta = export_weights(model, args.out)
+    print(f"Exported {args.model} -> {args.out} ({meta})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Text preprocessing shared by training (train_model.py) and serving.
+
+``clean_text`` is the exact normalisation applied before the tokenizer was
+fitted, and ``TextVectorizer`` reproduces Keras ``Tokenizer.texts_to_sequences``
++ ``pad_sequences(padding='post', truncating='post')`` from ``tokenizer.json``
+without importing TensorFlow. The vocabulary lookup is built once, and a batch
+of texts goes straight into a preallocated int32 matrix.
+"""
+
+import json
+import re
+from itertools import chain
+
+import numpy as np
+
+CLEAN_RE = re.compile(r'[^a-zA-Z\s]')
+
+# str.translate equivalent of CLEAN_RE for pure-ASCII text (the common case),
+# which is several times faster than re.sub.
+_ASCII_CLEAN_TABLE = {i: None for i in range(128) if CLEAN_RE.match(chr(i))}
+
+KERAS_DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+def clean_text(text) -> str:
+    """Lowercase and drop everything that is not an ASCII letter or whitespace."""
+    text = str(text).lower()
+    if text.isascii():
+        return text.translate(_ASCII_CLEAN_TABLE)
+    return CLEAN_RE.sub('', text)
+
+
+def _maybe_json(value):
+    """tokenizer.to_json() nests several fields as JSON strings; accept both forms."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+class TextVectorizer:
+    """
+    Keras-compatible tokenizer over a fixed vocabulary.
+
+    Ids are identical to ``Tokenizer.texts_to_sequences`` for the same
+    config: ``num_words`` cuts the vocabulary and out-of-vocabulary words
+    either map to ``oov_token`` or are dropped.
+    """
+
+    def __init__(self, word_index: dict, num_words: int = None, oov_token: str = None,
+                 lower: bool = True, filters: str = KERAS_DEFAULT_FILTERS, split: str = ' '):
+        self.word_index = dict(word_index)
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.lower = lower
+        self.filters = filters
+        self.split = split
+        self._table = str.maketrans({c: split for c in filters})
+        # clean_text + Keras filtering fused into one pass for ASCII input
+        self._clean_table = {
+            i: (None if i in _ASCII_CLEAN_TABLE else self._table.get(i, chr(i))) for i in range(128)
+        }
+        self.oov_index = self.word_index.get(oov_token) if oov_token is not None else None
+        # Final id per word with the num_words cut already applied, so the hot
+        # loop is a single dict lookup.
+        self._ids = {}
+        for word, idx in self.word_index.items():
+            if num_words and idx >= num_words:
+                if self.oov_index is not None:
+                    self._ids[word] = self.oov_index
+            else:
+                self._ids[word] = idx
+
+    @classmethod
+    def from_json(cls, data) -> 'TextVectorizer':
+        """Build from the contents of tokenizer.json (``Tokenizer.to_json()`` output)."""
+        data = _maybe_json(data)
+        # train_model.py historically json.dump()-ed the to_json() string, double-encoding it
+        data = _maybe_json(data)
+        config = data.get('config', data)
+        if config.get('char_level'):
+            raise ValueError("char_level tokenizers are not supported")
+        word_index = _maybe_json(config['word_index'])
+        return cls(
+            {w: int(i) for w, i in word_index.items()},
+            num_words=config.get('num_words'),
+            oov_token=config.get('oov_token'),
+            lower=config.get('lower', True),
+            filters=config.get('filters', KERAS_DEFAULT_FILTERS),
+            split=config.get('split', ' '),
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> 'TextVectorizer':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(f.read())
+
+    @classmethod
+    def from_counts(cls, word_counts: dict, num_words: int = None, oov_token: str = None,
+                    **kwargs) -> 'TextVectorizer':
+        """
+        Vocabulary as ``Tokenizer.fit_on_texts`` builds it: words by descending
+        count, ties in first-seen order (``word_counts`` must keep that order),
+        with the OOV token first.
+        """
+        ranked = sorted(word_counts.items(), key=lambda item: item[1], reverse=True)
+        vocab = ([oov_token] if oov_token is not None else []) + [w for w, _ in ranked]
+        return cls(dict(zip(vocab, range(1, len(vocab) + 1))), num_words=num_words,
+                   oov_token=oov_token, **kwargs)
+
+    def to_json(self, word_counts: dict = None, word_docs: dict = None, document_count: int = 0) -> str:
+        """Serialize in the ``Tokenizer.to_json()`` layout (``tokenizer_from_json`` can read it)."""
+        word_counts = word_counts or {}
+        word_docs = word_docs or {}
+        config = {
+            'num_words': self.num_words,
+            'filters': self.filters,
+            'lower': self.lower,
+            'split': self.split,
+            'char_level': False,
+            'oov_token': self.oov_token,
+            'document_count': document_count,
+            'word_counts': json.dumps(word_counts),
+            'word_docs': json.dumps(word_docs),
+            'index_docs': json.dumps({str(self.word_index[w]): c for w, c in word_docs.items()
+                                      if w in self.word_index}),
+            'index_word': json.dumps({str(i): w for w, i in self.word_index.items()}),
+            'word_index': json.dumps(self.word_index),
+        }
+        return json.dumps({'class_name': 'Tokenizer', 'config': config})
+
+    def words(self, text: str, clean: bool = True):
+        """The word tokens ``text_to_sequence`` looks up, before the vocabulary."""
+        if clean:
+            text = str(text).lower()
+            if text.isascii() and self.lower:
+                return [w for w in text.translate(self._clean_table).split(self.split) if w]
+            text = clean_text(text)
+        if self.lower:
+            text = text.lower()
+        return [w for w in text.translate(self._table).split(self.split) if w]
+
+    def text_to_sequence(self, text: str, clean: bool = True):
+        """Ids for one text; ``clean`` applies clean_text first, as in training."""
+        lookup = self._ids.get
+        words = self.words(text, clean)
+        if self.oov_index is not None:
+            return [lookup(w, self.oov_index) for w in words]
+        return [i for i in map(lookup, words) if i is not None]
+
+    def texts_to_sequences(self, texts, clean: bool = True):
+        return [self.text_to_sequence(t, clean=clean) for t in texts]
+
+    def to_matrix(self, texts, maxlen: int, clean: bool = True) -> np.ndarray:
+        """Tokenize, post-truncate and post-pad ``texts`` into an (n, maxlen) int32 matrix."""
+        return pad_post(self.texts_to_sequences(texts, clean=clean), maxlen)
+
+
+def pad_post(sequences, maxlen: int) -> np.ndarray:
+    """Vectorized pad_sequences(padding='post', truncating='post') into int32."""
+    n = len(sequences)
+    out = np.zeros((n, maxlen), dtype=np.int32)
+    if not n:
+        return out
+    lengths = np.minimum(np.fromiter(map(len, sequences), dtype=np.intp, count=n), maxlen)
+    total = int(lengths.sum())
+    if not total:
+        return out
+    flat = np.fromiter(chain.from_iterable(s[:maxlen] for s in sequences), dtype=np.int32, count=total)
+    rows = np.repeat(np.arange(n), lengths)
+    starts = np.cumsum(lengths) - lengths
+    cols = np.arange(total) - np.repeat(starts, lengths)
+    out[rows, cols] = flat
+    return out
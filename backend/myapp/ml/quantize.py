@@ -0,0 +1,146 @@
+"""
+Post-training quantization of the NumPy Bi-LSTM artifact.
+
+    python -m myapp.ml.quantize myapp/models/cyberbullying_model.npz
+    python -m myapp.ml.quantize model.npz --variants int8 --shard-dir .train_cache/<key>
+
+Writes ``cyberbullying_model.<variant>.npz`` next to the float model. The
+server loads the variant named by ML_MODEL_VARIANT.
+
+- ``float16``: weights are stored in half precision.
+- ``int8``: dynamic-range quantization. Weight matrices are stored as symmetric
+  int8 with one float32 scale per output channel (per row for the embedding).
+
+The largest runtime array is the table that folds the embedding and the LSTM
+input projection together, with one row per vocabulary word. Both variants
+keep it in their low precision in memory, and only the rows for the tokens
+being scored are expanded. NumPy has no int8 GEMM, so the small recurrent and
+Dense kernels are dequantized once at load and multiplied in float32.
+
+Before a variant is written, it is scored against the float model on the
+held-out split of the training shards (the same split ``train_model.py``
+validated on). Variants whose accuracy drops by more than
+``--max-accuracy-drop`` are not written.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .numpy_engine import FORMAT_VERSION, NumpyBiLSTM, quantize_int8
+
+VARIANTS = ('float16', 'int8')
+
+
+def variant_path(path: str, variant: str) -> str:
+    """cyberbullying_model.npz -> cyberbullying_model.int8.npz ('float32' is the original)."""
+    if not variant or variant == 'float32':
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{variant}{ext}"
+
+
+def load_archive(path: str):
+    with np.load(path, allow_pickle=False) as archive:
+        meta = json.loads(str(archive['meta']))
+        arrays = {k: archive[k] for k in archive.files if k != 'meta'}
+    return arrays, meta
+
+
+def quantize_arrays(arrays: dict, meta: dict, variant: str):
+    """(arrays, meta) of a quantized archive built from a float32 one."""
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant {variant!r}; expected one of {VARIANTS}")
+    if meta.get('quantization', 'float32') != 'float32':
+        raise ValueError("Quantize the float32 model, not an already quantized variant")
+    out = {}
+    for name, values in arrays.items():
+        if values.ndim < 2:
+            out[name] = values                      # biases stay float32
+        elif variant == 'float16':
+            out[name] = values.astype(np.float16)
+        else:
+            # per output column for kernels, per vocabulary row for the embedding
+            out[name], out[f'{name}_scale'] = quantize_int8(values, axis=1 if name == 'embedding' else 0)
+
+    meta = dict(meta, format_version=FORMAT_VERSION, quantization=variant)
+    if meta.get('version'):
+        meta['version'] = f"{meta['version']}+{variant}"
+    return out, meta
+
+
+def save(arrays, meta, path: str):
+    tmp = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+
+
+def held_out_split(shard_dir: str, val_split: float, seed: int):
+    """(X, y) of the validation rows train_model.py held out for this shard cache."""
+    from myapp.train_model import load_shards, split_masks
+    _, shards = load_shards(shard_dir)
+    masks = split_masks(shards, val_split, seed)
+    X = np.concatenate([np.asarray(x)[m] for (x, _), m in zip(shards, masks)])
+    y = np.concatenate([y[m] for (_, y), m in zip(shards, masks)])
+    return X, y
+
+
+def compare(reference: NumpyBiLSTM, candidate: NumpyBiLSTM, X, y, batch_size: int = 256) -> dict:
+    """Accuracy of both models on (X, y) plus how far the candidate's scores moved."""
+    ref = np.concatenate([reference.predict(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+    new = np.concatenate([candidate.predict(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+    return {
+        'rows': len(X),
+        'float32_accuracy': float(((ref > 0.5) == y).mean()),
+        'accuracy': float(((new > 0.5) == y).mean()),
+        'label_agreement': float(((ref > 0.5) == (new > 0.5)).mean()),
+        'max_abs_score_diff': float(np.abs(ref - new).max()) if len(X) else 0.0,
+    }
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help="float32 .npz written by train_model.py / export_weights")
+    parser.add_argument('--variants', default=','.join(VARIANTS))
+    parser.add_argument('--shard-dir', help="train_model.py shard cache to take the held-out split from "
+                                            "(default: the one recorded in the artifact, if present)")
+    parser.add_argument('--cache-dir', default=os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.train_cache'))
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    args = parser.parse_args()
+
+    arrays, meta = load_archive(args.model)
+    model = NumpyBiLSTM(arrays, meta)
+    shard_dir = args.shard_dir
+    if shard_dir is None and model.meta.get('cache_key'):
+        shard_dir = os.path.join(args.cache_dir, model.meta['cache_key'])
+    held_out = None
+    if shard_dir and os.path.exists(os.path.join(shard_dir, 'manifest.json')):
+        held_out = held_out_split(shard_dir, model.meta.get('val_split', 0.2), model.meta.get('seed', 42))
+    else:
+        print("No held-out split available (pass --shard-dir); skipping the accuracy check")
+
+    for variant in args.variants.split(','):
+        q_arrays, q_meta = quantize_arrays(arrays, meta, variant)
+        candidate = NumpyBiLSTM(q_arrays, q_meta)
+        line = (f"{variant:8s} runtime weights {model.weight_bytes / 1e6:6.2f} MB -> "
+                f"{candidate.weight_bytes / 1e6:6.2f} MB")
+        if held_out is not None:
+            report = compare(model, candidate, *held_out)
+            q_meta['quantization_report'] = report
+            drop = report['float32_accuracy'] - report['accuracy']
+            line += (f" | accuracy {report['float32_accuracy']:.4f} -> {report['accuracy']:.4f} "
+                     f"(agreement {report['label_agreement']:.2%}, max |diff| {report['max_abs_score_diff']:.1e}, "
+                     f"{report['rows']} held-out rows)")
+            if drop > args.max_accuracy_drop:
+                print(f"{line}\n  NOT written: accuracy dropped by {drop:.4f} > {args.max_accuracy_drop}")
+                continue
+        out = variant_path(args.model, variant)
+        save(q_arrays, q_meta, out)
+        print(f"{line}\n  -> {out}")
+
+
+if __name__ == '__main__':
+    main()
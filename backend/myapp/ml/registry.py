@@ -0,0 +1,530 @@
+"""
+Model registry: owns the classifier, its tokenizer and the inference batcher.
+
+Importing views used to import TensorFlow and load the model synchronously, so
+every worker boot, manage.py command and test run paid several seconds before
+doing anything. The registry loads lazily instead: either in a background
+warm-up thread (started from wsgi.py) or on first use. Callers ask
+``wait_ready(timeout)`` and apply the fallback policy from settings while the
+model is still loading.
+
+Artifacts can be versioned (``versions/<name>`` plus a CURRENT pointer, see
+``manage.py publish_model``); the registry then swaps in a newly published
+model without a restart and can shadow-score a candidate (myapp/ml/shadow.py).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from ..metrics import stage
+from .batching import InferenceBatcher, pad_batch, scores_from_prediction
+from .bucketing import benefits_from_bucketing, bucket_bounds, predict_bucketed
+from .cache import DjangoCacheBackend, LocalBackend, PredictionCache
+from .cascade import CascadeClassifier
+from .labels import BULLYING, NOT_BULLYING, THRESHOLD, Decision, label_for  # noqa: F401 (re-exported)
+from .numpy_engine import NumpyBiLSTM
+from .preprocessing import TextVectorizer
+from .quantize import variant_path
+from .shadow import ShadowScorer
+
+logger = logging.getLogger(__name__)
+
+IDLE = 'idle'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def artifact_fingerprint(paths) -> str:
+    """Content hash of the given files/directories (missing paths are skipped)."""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        elif os.path.exists(path):
+            files = [path]
+        else:
+            continue
+        for name in files:
+            digest.update(os.path.relpath(name, os.path.dirname(path)).encode())
+            with open(name, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class LoadedModel:
+    """
+    One model + tokenizer pair loaded from one artifact directory, with its
+    own batcher. The registry swaps whole LoadedModels, so a request always
+    tokenizes and scores with a matching pair.
+
+    Artifacts: ``cyberbullying_model.npz`` (NumPy engine, preferred;
+    ``cyberbullying_model.<variant>.npz`` for a quantized ``variant``) or
+    ``cyberbullying_model`` (Keras), plus ``tokenizer.json`` unless the .npz
+    written by train_model.py carries its own.
+    """
+
+    def __init__(self, model_dir: str, variant: str = 'float32', maxlen: int = 100, length_buckets=()):
+        self.model_dir = model_dir
+        self.variant = variant or 'float32'
+        self.maxlen = maxlen
+        self.length_buckets = tuple(length_buckets or ())
+        self.model = None
+        self.tokenizer = None
+        self.buckets = None
+        self.batcher = None
+        self.batch_timeout = None
+        self.version = None
+
+    @property
+    def model_path(self) -> str:
+        return os.path.join(self.model_dir, 'cyberbullying_model')
+
+    @property
+    def numpy_model_path(self) -> str:
+        path = os.path.join(self.model_dir, 'cyberbullying_model.npz')
+        quantized = variant_path(path, self.variant)
+        return quantized if os.path.exists(quantized) else path
+
+    @property
+    def tokenizer_path(self) -> str:
+        return os.path.join(self.model_dir, 'tokenizer.json')
+
+    def load(self, batching: bool = False, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+             batch_timeout: float = 10.0):
+        """Load artifacts and warm the model; raises if they are missing or broken."""
+        self.model = self._load_model()
+        self.tokenizer = self._load_tokenizer()
+        if self.model is None or self.tokenizer is None:
+            raise FileNotFoundError(f"No model/tokenizer artifacts in {self.model_dir}")
+        self.version = self._embedded_meta().get('version') or artifact_fingerprint(
+            [self.numpy_model_path if isinstance(self.model, NumpyBiLSTM) else self.model_path,
+             self.tokenizer_path])
+        # Dynamic padding is only exact when padding is masked out, and only pays
+        # off for models that would otherwise run every padded timestep.
+        self.buckets = self.length_buckets if self.length_buckets and benefits_from_bucketing(self.model) else None
+        # Warm-up: first call builds graphs / touches every weight page.
+        for length in bucket_bounds(self.buckets, self.maxlen) if self.buckets else [self.maxlen]:
+            self.predict(np.zeros((1, length), dtype=np.int32))
+        if batching:
+            self.batcher = InferenceBatcher(self.predict, max_batch_size=max_batch_size,
+                                            max_wait_ms=max_wait_ms, maxlen=self.maxlen, buckets=self.buckets)
+            self.batch_timeout = batch_timeout
+        return self
+
+    def _load_model(self):
+        if self.variant != 'float32' and not self.numpy_model_path.endswith(f'.{self.variant}.npz'):
+            logger.warning("Model variant %s not found in %s; using the float32 model", self.variant, self.model_dir)
+        if os.path.exists(self.numpy_model_path):
+            try:
+                return NumpyBiLSTM.load(self.numpy_model_path)
+            except Exception as exc:
+                logger.warning("Could not load NumPy weights from %s: %s", self.numpy_model_path, exc)
+        if os.path.exists(self.model_path):
+            from tensorflow.keras.models import load_model
+            return load_model(self.model_path)
+        return None
+
+    def _embedded_meta(self) -> dict:
+        """Metadata of a single-file artifact from train_model.py (tokenizer, version)."""
+        return getattr(self.model, 'meta', None) or {}
+
+    def _load_tokenizer(self):
+        embedded = self._embedded_meta().get('tokenizer')
+        if embedded:
+            return TextVectorizer.from_json(embedded)
+        if not os.path.exists(self.tokenizer_path):
+            return None
+        return TextVectorizer.from_file(self.tokenizer_path)
+
+    def predict(self, padded) -> np.ndarray:
+        with stage('predict'):
+            if isinstance(self.model, NumpyBiLSTM):
+                return self.model.predict(padded)
+            return scores_from_prediction(self.model.predict(padded, verbose=0), len(padded))
+
+    def texts_to_sequences(self, texts):
+        with stage('tokenize'):
+            return self.tokenizer.texts_to_sequences(texts)
+
+    def score_sequences(self, sequences) -> np.ndarray:
+        if self.buckets:
+            return predict_bucketed(sequences, self.predict, self.buckets, self.maxlen)
+        with stage('pad'):
+            padded = pad_batch(sequences, self.maxlen)
+        return self.predict(padded)
+
+    def score_texts(self, texts) -> np.ndarray:
+        return self.score_sequences(self.texts_to_sequences(texts))
+
+    def score(self, sequence) -> float:
+        """
+        One sequence through the batcher when there is one (and it is still
+        open), waiting at most ``batch_timeout`` seconds for its batch.
+        """
+        if self.batcher is not None:
+            try:
+                return self.batcher.score(sequence, timeout=self.batch_timeout)
+            except RuntimeError:
+                pass        # closed by a reload while this request held the old model
+            except FutureTimeoutError:
+                logger.warning("Batched inference took over %ss; scoring directly", self.batch_timeout)
+        return float(self.score_sequences([sequence])[0])
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, hot-swappable LoadedModel.
+
+    ``model_dir`` either holds the artifacts itself, or is a versioned store:
+    ``versions/<name>/`` directories plus a ``CURRENT`` file naming the live
+    version and optionally a ``CANDIDATE`` file naming a model to shadow
+    (see ``manage.py publish_model``). ``refresh`` (called by the watcher
+    thread from ``start_watching``) re-reads the pointers; a changed CURRENT
+    is loaded and warmed off the request path and then swapped in with one
+    reference assignment, so in-flight requests finish on the model they
+    started with. A failed reload keeps the running model.
+
+    The model counts as ready once a pair is loaded and a dummy batch has
+    gone through it.
+    """
+
+    CURRENT = 'CURRENT'
+    CANDIDATE = 'CANDIDATE'
+
+    def __init__(self, model_dir: str, maxlen: int = 100, batching: bool = True,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, cache: PredictionCache = None,
+                 cascade: CascadeClassifier = None, buckets=None, variant: str = 'float32',
+                 shadow_sample_rate: float = 0.0, shadow_queue_size: int = 1000, retire_after: float = 30.0,
+                 batch_timeout: float = 10.0):
+        self.model_dir = model_dir
+        self.variant = variant or 'float32'
+        self.maxlen = maxlen
+        self.batching = batching
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batch_timeout = batch_timeout
+        self.cache = cache
+        self.cascade = cascade
+        self.length_buckets = tuple(buckets or ())
+        self.shadow_sample_rate = shadow_sample_rate
+        self.shadow_queue_size = shadow_queue_size
+        self.retire_after = retire_after
+        self.active = None
+        self.shadow = None
+        self.stage_counts = Counter()
+        self.state = IDLE
+        self.error = None
+        self.load_seconds = None
+        self.reloads = 0
+        self.reload_error = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    # the live pair's attributes, for status pages and older callers
+    model = property(lambda self: self.active.model if self.active else None)
+    tokenizer = property(lambda self: self.active.tokenizer if self.active else None)
+    buckets = property(lambda self: self.active.buckets if self.active else None)
+    batcher = property(lambda self: self.active.batcher if self.active else None)
+    version = property(lambda self: self.active.version if self.active else None)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def _pointer(self, name: str):
+        """Artifact directory a pointer file names, or None without one."""
+        try:
+            with open(os.path.join(self.model_dir, name), encoding='utf-8') as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.model_dir, 'versions', version) if version else None
+
+    def current_dir(self) -> str:
+        return self._pointer(self.CURRENT) or self.model_dir
+
+    def _build(self, model_dir: str, batching: bool) -> LoadedModel:
+        return LoadedModel(model_dir, self.variant, self.maxlen, self.length_buckets).load(
+            batching=batching, max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms,
+            batch_timeout=self.batch_timeout)
+
+    def start_warmup(self):
+        """Load and warm the model in a daemon thread; returns immediately."""
+        with self._lock:
+            if self.state != IDLE or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.load, name='model-warmup', daemon=True)
+            self._thread.start()
+
+    def wait_ready(self, timeout: float = 0) -> bool:
+        """
+        Kick off loading if nobody has yet, wait up to ``timeout`` seconds for it
+        to finish and report whether the model can serve predictions.
+        """
+        if self.state == READY:
+            return True
+        self.start_warmup()
+        if timeout:
+            self._done.wait(timeout)
+        return self.state == READY
+
+    def load(self):
+        """Load artifacts and warm the model synchronously (idempotent)."""
+        with self._lock:
+            if self.state in (LOADING, READY, FAILED):
+                return
+            self.state = LOADING
+        started = time.perf_counter()
+        try:
+            self._swap(self._build(self.current_dir(), self.batching))
+        except Exception as exc:
+            self.error = str(exc)
+            self.state = FAILED
+            logger.warning("ML model unavailable: %s", exc)
+        else:
+            self.state = READY
+            logger.info("ML model ready (%s, version %s)", type(self.model).__name__, self.version)
+        finally:
+            self.load_seconds = time.perf_counter() - started
+            self._done.set()
+        self._sync_shadow()
+
+    def _swap(self, loaded: LoadedModel):
+        old, self.active = self.active, loaded
+        if self.cache is not None:
+            self.cache.set_version(loaded.version)
+        if old is not None:
+            # requests that picked up the old pair may still be queued on its
+            # batcher; close it once they are surely done
+            timer = threading.Timer(self.retire_after, old.close)
+            timer.daemon = True
+            timer.start()
+
+    def refresh(self) -> bool:
+        """
+        Re-read the CURRENT / CANDIDATE pointers and load whatever changed.
+        Returns True if a new live model was swapped in.
+        """
+        with self._reload_lock:
+            swapped = False
+            target = self.current_dir()
+            if self.active is None or os.path.normpath(target) != os.path.normpath(self.active.model_dir):
+                started = time.perf_counter()
+                try:
+                    loaded = self._build(target, self.batching)
+                except Exception as exc:
+                    self.reload_error = f"{target}: {exc}"
+                    logger.warning("Model reload from %s failed, keeping version %s: %s", target, self.version, exc)
+                else:
+                    previous = self.version
+                    self._swap(loaded)
+                    self.reloads += 1
+                    self.reload_error = self.error = None
+                    self.load_seconds = time.perf_counter() - started
+                    self.state = READY
+                    self._done.set()
+                    swapped = True
+                    logger.info("ML model reloaded: %s -> %s", previous, self.version)
+            self._sync_shadow()
+            return swapped
+
+    def _sync_shadow(self):
+        """Start, replace or stop the shadow candidate to match the CANDIDATE pointer."""
+        target = self._pointer(self.CANDIDATE) if self.shadow_sample_rate > 0 else None
+        if self.active is not None and target is not None and \
+                os.path.normpath(target) == os.path.normpath(self.active.model_dir):
+            target = None       # the candidate has been promoted
+        current = self.shadow
+        if current is not None and target is not None and \
+                os.path.normpath(target) == os.path.normpath(current.candidate.model_dir):
+            return
+        if target is not None:
+            try:
+                candidate = self._build(target, batching=False)
+            except Exception as exc:
+                self.reload_error = f"{target}: {exc}"
+                logger.warning("Shadow model %s unavailable: %s", target, exc)
+                return
+            self.shadow = ShadowScorer(candidate, self.shadow_sample_rate, max_queue=self.shadow_queue_size)
+            logger.info("Shadow scoring %s of traffic with version %s", self.shadow_sample_rate, candidate.version)
+        else:
+            self.shadow = None
+        if current is not None:
+            threading.Thread(target=current.close, name='model-shadow-close', daemon=True).start()
+
+    def start_watching(self, interval: float):
+        """Call ``refresh`` every ``interval`` seconds in a daemon thread."""
+        with self._lock:
+            if self._watcher is not None or interval <= 0:
+                return
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name='model-watcher',
+                                             daemon=True)
+            self._watcher.start()
+
+    def _watch(self, interval: float):
+        while not self._stop_watching.wait(interval):
+            if self.state in (READY, FAILED):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Model refresh failed")
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    def texts_to_sequences(self, texts):
+        """Apply the training-time clean_text and map words to vocabulary ids."""
+        return self.active.texts_to_sequences(texts)
+
+    def score_sequences(self, sequences) -> np.ndarray:
+        """Score token-id sequences directly, length-bucketed when the model allows it."""
+        return self.active.score_sequences(sequences)
+
+    def score_texts(self, texts) -> np.ndarray:
+        """Score a whole list of texts as one batch (bulk jobs; bypasses batcher and cache)."""
+        return self.active.score_texts(texts)
+
+    def _score_sequence(self, active: LoadedModel, sequence):
+        """(score, stage) for one token-id sequence: prediction cache, else the model."""
+        if self.cache is not None:
+            cached = self.cache.get(sequence)
+            if cached is not None:
+                return cached, 'cache'
+        score = active.score(sequence)
+        if self.cache is not None:
+            self.cache.set(sequence, score, version=active.version)
+        return score, 'model'
+
+    def score(self, sequence) -> float:
+        """
+        Score one token-id sequence: from the prediction cache when possible,
+        otherwise through the shared batcher (when enabled).
+        """
+        return self._score_sequence(self.active, sequence)[0]
+
+    def classify(self, text: str) -> Decision:
+        """
+        Label one comment. The lexicon cascade decides clear-cut text on its
+        own; everything else goes through the cache and the model.
+        """
+        active = self.active
+        if self.cascade is not None:
+            decision = self.cascade.decide(active.tokenizer.words(text))
+            if decision is not None:
+                self.stage_counts[decision.stage] += 1
+                return decision
+        with stage('tokenize'):
+            sequence = active.tokenizer.text_to_sequence(text)
+        score, decided_by = self._score_sequence(active, sequence)
+        self.stage_counts[decided_by] += 1
+        decision = Decision(label_for(score), score, decided_by)
+        shadow = self.shadow
+        if shadow is not None:
+            shadow.offer(text, decision.label, score)
+        return decision
+
+    def classify_texts(self, texts) -> list:
+        """Batch version of ``classify``: one model call for all ambiguous texts."""
+        active = self.active
+        decisions = [None] * len(texts)
+        ambiguous = []
+        for i, text in enumerate(texts):
+            if self.cascade is not None:
+                decisions[i] = self.cascade.decide(active.tokenizer.words(text))
+            if decisions[i] is None:
+                ambiguous.append(i)
+        if ambiguous:
+            scores = active.score_texts([texts[i] for i in ambiguous])
+            shadow = self.shadow
+            for i, score in zip(ambiguous, scores):
+                decisions[i] = Decision(label_for(float(score)), float(score), 'model')
+                if shadow is not None:
+                    shadow.offer(texts[i], decisions[i].label, decisions[i].score)
+        self.stage_counts.update(d.stage for d in decisions)
+        return decisions
+
+    def status(self) -> dict:
+        shadow = self.shadow
+        return {
+            'state': self.state,
+            'ready': self.ready,
+            'model': type(self.model).__name__ if self.model is not None else None,
+            'variant': getattr(self.model, 'quantization', None),
+            'version': self.version,
+            'artifact_dir': self.active.model_dir if self.active else None,
+            'length_buckets': list(self.buckets) if self.buckets else None,
+            'load_seconds': self.load_seconds,
+            'error': self.error,
+            'reloads': self.reloads,
+            'reload_error': self.reload_error,
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'stages': dict(self.stage_counts),
+            'shadow': shadow.stats() if shadow is not None else None,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Process-wide registry configured from Django settings."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from django.conf import settings
+                _registry = ModelRegistry(
+                    getattr(settings, 'ML_MODEL_DIR', os.path.join(settings.BASE_DIR, 'myapp', 'models')),
+                    maxlen=getattr(settings, 'ML_MAX_SEQ_LEN', 100),
+                    batching=getattr(settings, 'ML_BATCHING_ENABLED', True),
+                    max_batch_size=getattr(settings, 'ML_BATCH_MAX_SIZE', 32),
+                    max_wait_ms=getattr(settings, 'ML_BATCH_MAX_WAIT_MS', 5.0),
+                    batch_timeout=getattr(settings, 'ML_BATCH_TIMEOUT_SECONDS', 10.0),
+                    cache=_cache_from_settings(settings),
+                    cascade=cascade_from_settings(settings),
+                    buckets=getattr(settings, 'ML_LENGTH_BUCKETS', None),
+                    variant=getattr(settings, 'ML_MODEL_VARIANT', 'float32'),
+                    shadow_sample_rate=getattr(settings, 'ML_SHADOW_SAMPLE_RATE', 0.0),
+                    shadow_queue_size=getattr(settings, 'ML_SHADOW_QUEUE_SIZE', 1000),
+                )
+    return _registry
+
+
+def _cache_from_settings(settings):
+    if not getattr(settings, 'ML_CACHE_ENABLED', True):
+        return None
+    ttl = getattr(settings, 'ML_CACHE_TTL_SECONDS', 6 * 3600)
+    alias = getattr(settings, 'ML_CACHE_ALIAS', None)
+    if alias:
+        backend = DjangoCacheBackend(alias, ttl=ttl)
+    else:
+        backend = LocalBackend(getattr(settings, 'ML_CACHE_MAX_ENTRIES', 50000), ttl=ttl)
+    return PredictionCache(backend, maxlen=getattr(settings, 'ML_MAX_SEQ_LEN', 100))
+
+
+def cascade_from_settings(settings):
+    if not getattr(settings, 'ML_CASCADE_ENABLED', True):
+        return None
+    path = getattr(settings, 'ML_LEXICON_PATH', os.path.join(settings.BASE_DIR, 'myapp', 'lexicon.json'))
+    if not os.path.exists(path):
+        logger.warning("Lexicon %s not found; cascade disabled", path)
+        return None
+    return CascadeClassifier.from_file(path, block_threshold=getattr(settings, 'ML_CASCADE_BLOCK_THRESHOLD', 0.9))
@@ -0,0 +1,139 @@
+"""
+Shadow scoring: a candidate model labels a sample of live traffic off the
+request path, and its agreement with the live model is recorded for review.
+
+``offer`` is called by the registry after the live model decided a comment.
+A ``sample_rate`` share of texts is put on a bounded queue (dropped when it is
+full, so live requests never wait) and a daemon thread scores them in small
+batches with the candidate's own tokenizer. The candidate's verdicts are never
+returned to callers, and recent disagreements keep a hash of the text, not the
+text itself.
+"""
+
+import hashlib
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from .labels import label_for
+
+logger = logging.getLogger(__name__)
+
+SHADOW_BATCH = 32
+
+
+def _digest(text: str) -> str:
+    # Disagreements are served to monitoring clients: identify the comment, never echo it.
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class ShadowScorer:
+    """Background comparison of a candidate LoadedModel against live decisions."""
+
+    def __init__(self, candidate, sample_rate: float = 0.05, max_queue: int = 1000,
+                 max_disagreements: int = 50):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.offered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.compared = 0
+        self.agreed = 0
+        self.confusion = Counter()                         # (live label, candidate label) -> n
+        self.drift_sum = 0.0                               # sum of candidate - live score
+        self.drift_abs_sum = 0.0
+        self.drift_abs_max = 0.0
+        self.latencies_ms = deque(maxlen=2000)             # per batch row, most recent
+        self.disagreements = deque(maxlen=max_disagreements)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='model-shadow', daemon=True)
+        self._thread.start()
+
+    @property
+    def version(self):
+        return self.candidate.version
+
+    def offer(self, text: str, live_label: str, live_score: float):
+        """Queue ``text`` for the candidate with probability ``sample_rate``."""
+        if random.random() >= self.sample_rate:
+            return
+        self.offered += 1
+        try:
+            self._queue.put_nowait((text, live_label, live_score))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < SHADOW_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                self._score(batch)
+            except Exception:
+                self.errors += len(batch)
+                logger.exception("Shadow scoring failed for %d texts", len(batch))
+
+    def _score(self, batch):
+        started = time.perf_counter()
+        scores = self.candidate.score_texts([text for text, _, _ in batch])
+        per_row_ms = (time.perf_counter() - started) * 1000.0 / len(batch)
+        with self._lock:
+            for (text, live_label, live_score), score in zip(batch, scores):
+                score = float(score)
+                label = label_for(score)
+                drift = score - live_score
+                self.compared += 1
+                self.agreed += label == live_label
+                self.confusion[live_label, label] += 1
+                self.drift_sum += drift
+                self.drift_abs_sum += abs(drift)
+                self.drift_abs_max = max(self.drift_abs_max, abs(drift))
+                self.latencies_ms.append(per_row_ms)
+                if label != live_label:
+                    self.disagreements.append({'text_sha256': _digest(text), 'live': live_label,
+                                               'live_score': live_score, 'candidate': label,
+                                               'candidate_score': score})
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.compared
+            latencies = np.asarray(self.latencies_ms) if self.latencies_ms else None
+            return {
+                'version': self.version,
+                'sample_rate': self.sample_rate,
+                'offered': self.offered,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'compared': n,
+                'agreement': self.agreed / n if n else None,
+                'confusion': {f'{live} -> {cand}': count for (live, cand), count in self.confusion.items()},
+                'score_drift_mean': self.drift_sum / n if n else None,
+                'score_drift_abs_mean': self.drift_abs_sum / n if n else None,
+                'score_drift_abs_max': self.drift_abs_max,
+                'latency_ms_p50': float(np.percentile(latencies, 50)) if latencies is not None else None,
+                'latency_ms_p95': float(np.percentile(latencies, 95)) if latencies is not None else None,
+                'recent_disagreements': list(self.disagreements),
+            }
+
+    def close(self):
+        """Stop the thread after the texts already queued; blocks until done."""
+        self._queue.put(None)
+        self._thread.join()
+        self.candidate.close()
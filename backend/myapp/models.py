@@ -39,6 +39,15 @@ class Post(models.Model):
     date = models.DateField(auto_now_add=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='posts')
 
+    class Meta:
+        # feed: newest first with the author next to the key, so "not my posts"
+        # is checked in the index before a row is read
+        indexes = [
+            models.Index(fields=['-id', 'user'], name='post_feed_idx'),
+            # one user's posts in id order (view_ownpost, feed rebuilds)
+            models.Index(fields=['user', 'id'], name='post_user_idx'),
+        ]
+
 class Complaint(models.Model):
     complaint = models.TextField()
     reply = models.TextField(default="pending")
@@ -50,11 +59,66 @@ class Comment(models.Model):
     comments = models.TextField()
     status = models.CharField(max_length=100, default="Not Bullying")
     date = models.DateField(auto_now_add=True)
+    # time of day for the repeat-offender windows (myapp/offenders.py); null on
+    # comments written before it existed
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
 
+    class Meta:
+        indexes = [
+            # a post's comments in id order
+            models.Index(fields=['post', 'id'], name='comment_post_idx'),
+            # moderation queue and reports: comments by status, then date
+            models.Index(fields=['status', 'date'], name='comment_status_date_idx'),
+        ]
+
 class Chat(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     message = models.TextField()
     to_login = models.ForeignKey(Login, on_delete=models.CASCADE, related_name='chats_to')
     from_login = models.ForeignKey(Login, on_delete=models.CASCADE, related_name='chats_from')
+
+    class Meta:
+        # one index range scan per direction of a conversation, already in id order
+        indexes = [models.Index(fields=['from_login', 'to_login', 'id'], name='chat_conversation_idx')]
+
+class ModerationCounter(models.Model):
+    """
+    Running moderation counts for one scope: the whole site ('total', key ''),
+    one author ('user', profile id), one post ('post', post id) or one day
+    ('day', ISO date). Maintained incrementally by myapp/stats.py.
+    """
+    SCOPE_CHOICES = (('total', 'Total'), ('user', 'User'), ('post', 'Post'), ('day', 'Day'))
+    scope = models.CharField(max_length=8, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=32, blank=True)
+    bullying = models.IntegerField(default=0)
+    clean = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    open_complaints = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['scope', 'key'], name='moderation_counter_key')]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+class OffenderAction(models.Model):
+    """
+    A repeat-offender rule that fired (myapp/offenders.py). Rows are shared by
+    every process: web workers read active throttles from here when comments
+    are moderated elsewhere, and the id is the cursor of /myapp/offender_events/.
+    """
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='offender_actions')
+    action = models.CharField(max_length=20)
+    count = models.IntegerField()
+    window = models.IntegerField()
+    at = models.DateTimeField()
+    throttled_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # add_comment: the latest throttle of one author
+        indexes = [models.Index(fields=['profile', 'throttled_until'], name='offender_throttle_idx')]
+
+    def __str__(self):
+        return f"{self.profile_id} {self.action}"
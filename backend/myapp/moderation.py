@@ -0,0 +1,204 @@
+"""
+Asynchronous comment moderation.
+
+With ``MODERATION_MODE = 'async'`` add_comment saves the comment as ``pending``
+and returns immediately; a background worker pool classifies pending comments
+in batches and updates ``Comment.status``. The Comment table itself is the
+queue, so no external broker is needed and nothing is lost on restart.
+
+Workers run as daemon threads inside the web process (started from wsgi.py
+when ``MODERATION_WORKER_IN_PROCESS`` is on) or in a separate process via
+``python manage.py moderate_comments``. Updates are conditional on the row
+still being pending, so two workers that race on the same comment produce the
+same result and never overwrite a later change. Each batch updates the
+moderation counters (myapp/stats.py) in the same transaction and feeds its
+verdicts to the repeat-offender detector (myapp/offenders.py).
+
+If the model fails to load, pending comments get ML_FALLBACK_STATUS, as
+add_comment does in sync mode, rather than waiting for a model that is not
+coming. A batch the model cannot classify is retried one comment at a time,
+and a comment that fails on its own is logged and skipped by this worker from
+then on. Other failures (e.g. the database) back off exponentially up to
+MODERATION_MAX_BACKOFF seconds.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from . import offenders, stats
+from .ml.registry import FAILED, Decision, get_registry
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+
+
+def is_async() -> bool:
+    return getattr(settings, 'MODERATION_MODE', 'sync') == 'async'
+
+
+def _fallback_decisions(texts) -> list:
+    """What sync mode answers while the model is unavailable (views._moderate)."""
+    return [Decision(getattr(settings, 'ML_FALLBACK_STATUS', "Not Bullying"), None, 'fallback')] * len(texts)
+
+
+class ModerationWorker:
+    """
+    One worker thread. With ``partitions > 1`` it only takes comments whose
+    id % partitions == partition, so a pool of workers never overlaps.
+    """
+
+    def __init__(self, registry=None, batch_size: int = 256, poll_interval: float = 0.5,
+                 partition: int = 0, partitions: int = 1):
+        self.registry = registry
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.partition = partition
+        self.partitions = partitions
+        self.wakeup = threading.Event()
+        self.processed = 0
+        self.failures = 0           # consecutive failed batches, for the backoff
+        self.skipped = set()        # ids of comments the model failed on
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _pending(self):
+        qs = Comment.objects.filter(status=PENDING)
+        if self.partitions > 1:
+            qs = qs.annotate(_part=F('id') % self.partitions).filter(_part=self.partition)
+        if self.skipped:
+            qs = qs.exclude(id__in=self.skipped)
+        return list(qs.order_by('id').values_list('id', 'comments')[:self.batch_size])
+
+    def _classify(self, classify_texts, rows) -> list:
+        """(row, Decision) pairs; rows that fail on their own are left out and skipped from now on."""
+        try:
+            return list(zip(rows, classify_texts([text for _, text in rows])))
+        except Exception:
+            if len(rows) == 1:
+                logger.exception("Skipping comment %s: it could not be classified", rows[0][0])
+                self.skipped.add(rows[0][0])
+                return []
+            logger.exception("Classifying %d comments failed; retrying them one by one", len(rows))
+        return [pair for row in rows for pair in self._classify(classify_texts, [row])]
+
+    def run_once(self) -> int:
+        """Classify one batch of pending comments; returns the number of rows handled."""
+        registry = self.registry or get_registry()
+        if registry.wait_ready(timeout=self.poll_interval):
+            classify_texts = registry.classify_texts
+        elif registry.state == FAILED:
+            classify_texts = _fallback_decisions
+        else:
+            return 0
+        rows = self._pending()
+        if not rows:
+            return 0
+        by_label = {}
+        for (comment_id, _), decision in self._classify(classify_texts, rows):
+            by_label.setdefault(decision.label, []).append(comment_id)
+        updated = 0
+        delta = stats.Delta()
+        verdicts = []
+        with transaction.atomic():
+            for label, ids in by_label.items():
+                # lock the rows still pending so the counters only see the
+                # transitions this worker made (SQLite serializes writers)
+                claimed = list(Comment.objects.select_for_update().filter(id__in=ids, status=PENDING)
+                               .values_list('id', 'user_id', 'post_id', 'date'))
+                if not claimed:
+                    continue
+                claimed_ids = [row[0] for row in claimed]
+                updated += Comment.objects.filter(id__in=claimed_ids, status=PENDING).update(status=label)
+                for _, user_id, post_id, day in claimed:
+                    delta.comment(user_id, post_id, day, old_status=PENDING, new_status=label)
+                    verdicts.append((user_id, label))
+            delta.apply()
+        offenders.record_verdicts(verdicts)
+        self.processed += updated
+        return len(rows)
+
+    def backoff(self) -> float:
+        """Seconds to wait after ``failures`` consecutive failed batches."""
+        return min(self.poll_interval * 2 ** self.failures, getattr(settings, 'MODERATION_MAX_BACKOFF', 60.0))
+
+    def run(self):
+        while not self._stop.is_set():
+            self.wakeup.clear()
+            try:
+                handled = self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.exception("Moderation batch failed (%d in a row)", self.failures)
+                self._stop.wait(self.backoff())
+                continue
+            finally:
+                close_old_connections()
+            self.failures = 0
+            if handled < self.batch_size:
+                self.wakeup.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f'moderation-{self.partition}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self.wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class ModerationPool:
+    """A fixed set of partitioned ModerationWorker threads."""
+
+    def __init__(self, threads: int = 1, **kwargs):
+        self.workers = [ModerationWorker(partition=i, partitions=threads, **kwargs) for i in range(threads)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def notify(self):
+        """Wake idle workers right away instead of waiting for the next poll."""
+        for worker in self.workers:
+            worker.wakeup.set()
+
+    def stop(self, timeout: float = None):
+        for worker in self.workers:
+            worker.stop(timeout)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_from_settings(**overrides) -> ModerationPool:
+    options = {
+        'threads': getattr(settings, 'MODERATION_WORKER_THREADS', 1),
+        'batch_size': getattr(settings, 'MODERATION_BATCH_SIZE', 256),
+        'poll_interval': getattr(settings, 'MODERATION_POLL_INTERVAL', 0.5),
+    }
+    options.update(overrides)
+    return ModerationPool(**options)
+
+
+def start_background_moderation():
+    """Start the in-process worker pool once (called from wsgi.py)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool_from_settings()
+            _pool.start()
+    return _pool
+
+
+def notify_pending():
+    """Called after a pending comment is saved."""
+    if _pool is not None:
+        _pool.notify()
@@ -0,0 +1,227 @@
+"""
+Repeat-offender detection over a sliding window of Bullying verdicts.
+
+Every comment classified as bullying is recorded against its author (from
+add_comment in sync mode, from the moderation workers in async mode). Per
+author, the detector keeps a short list of time buckets (OFFENDER_BUCKET_SECONDS
+wide) holding counts, covering only the longest rule window, so nothing is
+queried per comment and memory is bounded by OFFENDER_MAX_USERS recently
+active authors (least recently active dropped first).
+
+Each rule in OFFENDER_RULES is (action, threshold, window seconds):
+
+- 'throttle': add_comment refuses new comments from the author with 429 for
+  OFFENDER_THROTTLE_SECONDS.
+- any other action (e.g. 'flag'): only reported.
+
+A rule fires at most once per window per author. Each firing is stored as an
+OffenderAction row, whose id becomes the OffenderEvent id. The rows are the
+admin block flow: /myapp/offender_events/ and the admin list read them (ids
+keep increasing across restarts and are unique across processes), and the
+admin "lift throttle" action ends a throttle early.
+
+``retry_after`` reads the stored throttles, whichever process fired them, so
+every worker enforces a throttle as soon as it is stored (one indexed query
+per add_comment). Counting itself is per process. On first use the detector
+replays the bullying comments of the longest window from the database
+(``Comment.created_at``), so a restart does not fire old events again. With
+several worker processes each one counts only its own share of comments, so a
+rule may fire later than its threshold; the ``flag`` rule over a day still
+catches persistent offenders. In async mode all verdicts are counted by the
+process running the moderation workers (often ``manage.py moderate_comments``).
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .ml.labels import BULLYING
+
+logger = logging.getLogger(__name__)
+
+Rule = namedtuple('Rule', 'action threshold window')
+OffenderEvent = namedtuple('OffenderEvent', 'id profile_id action count window at')
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+class _Offender:
+    __slots__ = ('buckets', 'fired', 'throttled_until')
+
+    def __init__(self):
+        self.buckets = deque()      # [bucket number, bullying comments], oldest first
+        self.fired = {}             # action -> time the rule last fired
+        self.throttled_until = 0.0
+
+
+class OffenderDetector:
+    """Per-author bucketed counters of bullying comments, checked against the rules."""
+
+    def __init__(self, rules, bucket_seconds: int = 60, throttle_seconds: float = 900,
+                 max_users: int = 50000, max_events: int = 1000, persist=None):
+        self.rules = [Rule(*rule) for rule in rules]
+        self.bucket_seconds = bucket_seconds
+        self.throttle_seconds = throttle_seconds
+        self.max_users = max_users
+        self.horizon = max((rule.window for rule in self.rules), default=0)
+        self.events = deque(maxlen=max_events)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.persist = persist      # events -> the same events with stored ids
+
+    def record(self, profile_id, now: float = None, emit: bool = True):
+        """Count one bullying comment by ``profile_id``; returns the events it fired."""
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds)
+        fired = []
+        with self._lock:
+            state = self._users.get(profile_id)
+            if state is None:
+                state = self._users[profile_id] = _Offender()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(profile_id)
+            buckets = state.buckets
+            if buckets and buckets[-1][0] == bucket:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([bucket, 1])
+            oldest = bucket - self.horizon // self.bucket_seconds
+            while buckets[0][0] <= oldest:
+                buckets.popleft()
+
+            for rule in self.rules:
+                first = bucket - rule.window // self.bucket_seconds
+                count = sum(n for b, n in buckets if b > first)
+                if count < rule.threshold or now - state.fired.get(rule.action, float('-inf')) < rule.window:
+                    continue
+                state.fired[rule.action] = now
+                if rule.action == 'throttle':
+                    state.throttled_until = now + self.throttle_seconds
+                fired.append(OffenderEvent(next(self._ids), profile_id, rule.action, count, rule.window, now))
+
+        if emit:
+            if fired and self.persist is not None:
+                fired = self.persist(fired)
+            for event in fired:
+                self.events.append(event)
+                logger.warning("Repeat offender: profile %s %s (%d bullying comments in %ds)",
+                               event.profile_id, event.action, event.count, event.window)
+        return fired
+
+    def throttled(self, profile_id, now: float = None) -> float:
+        """Seconds until ``profile_id`` may comment again (0 when not throttled)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._users.get(profile_id)
+            return max(state.throttled_until - now, 0.0) if state is not None else 0.0
+
+    def recent_events(self, since_id: int = 0) -> list:
+        return [event for event in list(self.events) if event.id > since_id]
+
+    def recover(self, now: float = None) -> int:
+        """
+        Replay bullying comments of the last ``horizon`` seconds from the
+        database, without emitting events. Comments without ``created_at``
+        count from the start of their day. Returns the number replayed.
+        """
+        from .models import Comment
+        now = time.time() if now is None else now
+        cutoff = datetime.fromtimestamp(now - self.horizon, tz=timezone.utc)
+        rows = (Comment.objects.filter(status=BULLYING, date__gte=cutoff.date())
+                .values_list('user_id', 'created_at', 'date'))
+        replay = []
+        for profile_id, created_at, day in rows.iterator():
+            if created_at is None:
+                created_at = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+            if created_at >= cutoff:
+                replay.append((created_at.timestamp(), profile_id))
+        for at, profile_id in sorted(replay):
+            self.record(profile_id, now=at, emit=False)
+        return len(replay)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+        self.events.clear()
+
+    def __len__(self):
+        return len(self._users)
+
+
+def _timestamp(at: float) -> datetime:
+    return datetime.fromtimestamp(at, tz=timezone.utc)
+
+
+def persist_events(events) -> list:
+    """Store fired events as OffenderAction rows; returns them with the row ids."""
+    from .models import OffenderAction
+    stored = []
+    for event in events:
+        throttle = getattr(settings, 'OFFENDER_THROTTLE_SECONDS', 900) if event.action == 'throttle' else None
+        row = OffenderAction.objects.create(
+            profile_id=event.profile_id, action=event.action, count=event.count, window=event.window,
+            at=_timestamp(event.at), throttled_until=_timestamp(event.at + throttle) if throttle else None)
+        stored.append(event._replace(id=row.id))
+    return stored
+
+
+def stored_events(since_id: int = 0, limit: int = 1000) -> list:
+    """OffenderEvents recorded by any process, oldest first, with ids above ``since_id``."""
+    from .models import OffenderAction
+    rows = (OffenderAction.objects.filter(id__gt=since_id).order_by('id')
+            .values_list('id', 'profile_id', 'action', 'count', 'window', 'at')[:limit])
+    return [OffenderEvent(*row[:5], row[5].timestamp()) for row in rows]
+
+
+def retry_after(profile_id) -> float:
+    """
+    Seconds until ``profile_id`` may comment again, from the throttles stored by
+    any process (so a lifted throttle is lifted everywhere).
+    """
+    if get_detector() is None:
+        return 0.0
+    from .models import OffenderAction
+    now = time.time()
+    until = (OffenderAction.objects.filter(profile_id=profile_id, throttled_until__gt=_timestamp(now))
+             .order_by('-throttled_until').values_list('throttled_until', flat=True).first())
+    return until.timestamp() - now if until is not None else 0.0
+
+
+def get_detector():
+    """Process-wide detector built from settings and recovered from the database, or None when disabled."""
+    global _detector
+    if not getattr(settings, 'OFFENDER_DETECTION_ENABLED', True):
+        return None
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                detector = OffenderDetector(
+                    getattr(settings, 'OFFENDER_RULES', (('throttle', 3, 600), ('flag', 10, 86400))),
+                    bucket_seconds=getattr(settings, 'OFFENDER_BUCKET_SECONDS', 60),
+                    throttle_seconds=getattr(settings, 'OFFENDER_THROTTLE_SECONDS', 900),
+                    max_users=getattr(settings, 'OFFENDER_MAX_USERS', 50000),
+                    max_events=getattr(settings, 'OFFENDER_MAX_EVENTS', 1000),
+                    persist=persist_events,
+                )
+                detector.recover()
+                _detector = detector
+    return _detector
+
+
+def record_verdicts(verdicts):
+    """Feed (profile id, Comment.status) pairs to the detector; bullying ones count."""
+    detector = get_detector()
+    if detector is None:
+        return
+    for profile_id, status in verdicts:
+        if status == BULLYING:
+            detector.record(profile_id)
@@ -0,0 +1,150 @@
+"""
+Serialized user_viewprofile responses, cached per login id.
+
+The Flutter app reads the caller's profile far more often than it changes.
+The response body (JSON bytes) is cached, so a hit costs no query and no
+serialization.
+
+- Reads fill the cache with ``add``. user_editprofile writes the new body
+  through with ``set``, so a read that loaded the old row just before an
+  edit cannot overwrite the fresh entry.
+- Any other UserProfile save or delete (admin, photo changes, scripts)
+  invalidates the entry through a model signal.
+
+Backend: a per-process LRU by default (PROFILE_JSON_CACHE_MAX_ENTRIES). With
+several workers, set PROFILE_JSON_CACHE_ALIAS to a shared CACHES alias so an
+edit in one worker invalidates all of them; otherwise other workers may serve
+the old profile for up to PROFILE_JSON_CACHE_TTL_SECONDS. Hit and miss
+counters are exposed at /myapp/cache_stats/.
+"""
+
+import json
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import media
+from .ml.cache import LocalBackend
+from .models import UserProfile
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SharedBackend:
+    """Profile bodies in a Django CACHES alias, shared by every worker."""
+
+    def __init__(self, alias: str, ttl: float = 300):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.evictions = 0
+
+    @staticmethod
+    def _key(login_id) -> str:
+        return f"profile-json:v1:{login_id}"
+
+    def get(self, login_id):
+        return self.cache.get(self._key(login_id))
+
+    def add(self, login_id, body: bytes) -> bool:
+        return self.cache.add(self._key(login_id), body, timeout=self.ttl)
+
+    def set(self, login_id, body: bytes):
+        self.cache.set(self._key(login_id), body, timeout=self.ttl)
+
+    def delete(self, login_id):
+        self.cache.delete(self._key(login_id))
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class ProfileJSONCache:
+    """Response bodies keyed by login id, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, login_id):
+        body = self.backend.get(login_id)
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def fill(self, login_id, body: bytes):
+        self.backend.add(login_id, body)
+
+    def refresh(self, login_id, body: bytes):
+        self.backend.set(login_id, body)
+
+    def invalidate(self, login_id):
+        self.backend.delete(login_id)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions,
+        }
+
+
+def render(profile) -> bytes:
+    """The user_viewprofile response body for ``profile``."""
+    return json.dumps({
+        'status': 'ok',
+        'name': profile.name,
+        'gender': profile.gender,
+        'dob': profile.dob.isoformat() if profile.dob else '',
+        'email': profile.email,
+        'photo': default_storage.url(profile.photo.name) if profile.photo else '',
+        **media.variant_urls(profile.photo.name),
+        'phone': profile.phone,
+        'place': profile.place,
+        'post': profile.post,
+        'pin': profile.pin,
+        'state': profile.state,
+        'district': profile.district,
+    }).encode()
+
+
+def get_json_cache():
+    """Process-wide cache built from settings, or None when disabled."""
+    global _cache
+    if not getattr(settings, 'PROFILE_JSON_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = getattr(settings, 'PROFILE_JSON_CACHE_TTL_SECONDS', 300)
+                alias = getattr(settings, 'PROFILE_JSON_CACHE_ALIAS', None)
+                if alias:
+                    backend = SharedBackend(alias, ttl=ttl)
+                else:
+                    backend = LocalBackend(getattr(settings, 'PROFILE_JSON_CACHE_MAX_ENTRIES', 20000), ttl=ttl)
+                _cache = ProfileJSONCache(backend)
+    return _cache
+
+
+def on_profile_changed(sender, instance, **kwargs):
+    cache = get_json_cache()
+    if cache is not None:
+        cache.invalidate(instance.login_id)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+    post_save.connect(on_profile_changed, sender=UserProfile, dispatch_uid='profile_json_saved')
+    post_delete.connect(on_profile_changed, sender=UserProfile, dispatch_uid='profile_json_deleted')
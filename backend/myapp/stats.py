@@ -0,0 +1,228 @@
+"""
+Moderation counters for the admin dashboard.
+
+Comment and Complaint changes are folded into ModerationCounter rows for the
+whole site, the comment's author or complaint's sender, the post and the day,
+so a dashboard reads a handful of rows instead of counting history.
+
+- Single-row saves and deletes (add_comment, the admin site, complaint
+  replies) are counted by model signals, from the state the instance was
+  loaded with.
+- Bulk writes bypass signals, so the moderation workers and
+  ``rescore_comments`` record their transitions with a Delta inside the same
+  transaction as the update.
+
+Counts only drift if rows are changed behind the ORM (raw SQL, queryset
+``update`` elsewhere); ``python manage.py reconcile_moderation_stats``
+rebuilds every counter from the Comment and Complaint tables.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Q
+
+from . import moderation
+from .ml.labels import BULLYING
+from .models import Comment, Complaint, ModerationCounter
+
+COMPLAINT_OPEN = "pending"
+FIELDS = ('bullying', 'clean', 'pending', 'open_complaints')
+
+
+def comment_field(status: str) -> str:
+    """Counter a Comment.status value is counted under."""
+    if status == BULLYING:
+        return 'bullying'
+    if status == moderation.PENDING:
+        return 'pending'
+    return 'clean'
+
+
+def _day(value) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class Delta:
+    """
+    Counter changes collected in memory and written with one INSERT (of
+    rows that do not exist yet, conflicts ignored) and one UPDATE per
+    distinct change, whatever the number of rows.
+    """
+
+    def __init__(self):
+        self.changes = defaultdict(Counter)
+
+    def _add(self, keys, field: str, n: int):
+        for key in keys:
+            self.changes[key][field] += n
+
+    def comment(self, user_id, post_id, day, old_status=None, new_status=None):
+        """A comment created (old None), deleted (new None) or relabelled."""
+        keys = [('total', ''), ('user', str(user_id)), ('post', str(post_id)), ('day', _day(day))]
+        if old_status is not None:
+            self._add(keys, comment_field(old_status), -1)
+        if new_status is not None:
+            self._add(keys, comment_field(new_status), 1)
+
+    def complaint(self, user_id, day, was_open: bool, is_open: bool):
+        if was_open != is_open:
+            keys = [('total', ''), ('user', str(user_id)), ('day', _day(day))]
+            self._add(keys, 'open_complaints', 1 if is_open else -1)
+
+    def apply(self):
+        groups = defaultdict(list)
+        for key, counter in self.changes.items():
+            change = tuple(sorted((field, n) for field, n in counter.items() if n))
+            if change:
+                groups[change].append(key)
+        for change, keys in groups.items():
+            _apply(dict(change), keys)
+        self.changes.clear()
+
+
+def _matching(keys) -> Q:
+    by_scope = defaultdict(list)
+    for scope, key in keys:
+        by_scope[scope].append(key)
+    q = Q()
+    for scope, scope_keys in by_scope.items():
+        q |= Q(scope=scope, key__in=scope_keys)
+    return q
+
+
+def _apply(change: dict, keys):
+    # make sure every row exists (racing writers may insert the same keys;
+    # conflicts are ignored), then change them all in one UPDATE, so no
+    # increment depends on which writer created a row
+    ModerationCounter.objects.bulk_create(
+        [ModerationCounter(scope=scope, key=key) for scope, key in keys], ignore_conflicts=True)
+    values = {field: F(field) + n for field, n in change.items()}
+    ModerationCounter.objects.filter(_matching(keys)).update(**values)
+
+
+def counts(scope: str, keys=None) -> dict:
+    """
+    Counters of ``scope`` as {key: {field: n}}; with ``keys``, only those
+    (keys with no activity yet are absent).
+    """
+    qs = ModerationCounter.objects.filter(scope=scope)
+    if keys is not None:
+        qs = qs.filter(key__in=[_day(k) if scope == 'day' else str(k) for k in keys])
+    return {row['key']: {f: row[f] for f in FIELDS} for row in qs.values('key', *FIELDS)}
+
+
+def dashboard(days: int = 7) -> dict:
+    """Site totals and the last ``days`` days with activity: two indexed reads."""
+    totals = counts('total').get('', dict.fromkeys(FIELDS, 0))
+    recent = (ModerationCounter.objects.filter(scope='day').order_by('-key')
+              .values('key', *FIELDS)[:days])
+    return {'totals': totals, 'days': [{'day': row.pop('key'), **row} for row in recent]}
+
+
+def rebuild() -> int:
+    """
+    Replace every counter with fresh aggregates of Comment and Complaint.
+    Call inside a transaction; returns the number of counter rows written.
+    """
+    ModerationCounter.objects.all().delete()
+    rows = defaultdict(Counter)
+    comment_counts = {
+        'bullying': Count('id', filter=Q(status=BULLYING)),
+        'pending': Count('id', filter=Q(status=moderation.PENDING)),
+        'all': Count('id'),
+    }
+    for scope, column in (('total', None), ('user', 'user_id'), ('post', 'post_id'), ('day', 'date')):
+        qs = Comment.objects.order_by()
+        qs = qs.values(column).annotate(**comment_counts) if column else [qs.aggregate(**comment_counts)]
+        for row in qs:
+            if not row['all']:
+                continue
+            key = _day(row[column]) if column else ''
+            rows[scope, key].update(bullying=row['bullying'], pending=row['pending'],
+                                    clean=row['all'] - row['bullying'] - row['pending'])
+    open_complaints = Complaint.objects.filter(status=COMPLAINT_OPEN).order_by()
+    for scope, column in (('total', None), ('user', 'user_id'), ('day', 'date')):
+        qs = (open_complaints.values(column).annotate(n=Count('id')) if column
+              else [open_complaints.aggregate(n=Count('id'))])
+        for row in qs:
+            if row['n']:
+                rows[scope, _day(row[column]) if column else ''].update(open_complaints=row['n'])
+    ModerationCounter.objects.bulk_create(
+        [ModerationCounter(scope=scope, key=key, **counter) for (scope, key), counter in rows.items()],
+        batch_size=1000)
+    return len(rows)
+
+
+# Model signals: each instance remembers the state it was loaded with, so a
+# save can be counted as a transition without reading the row again.
+
+def _comment_state(instance):
+    d = instance.__dict__
+    if d.get('id') is None or any(d.get(f) is None for f in ('user_id', 'post_id', 'date', 'status')):
+        return None     # new, or loaded with deferred fields: not counted on save
+    return d['user_id'], d['post_id'], d['date'], d['status']
+
+
+def _complaint_state(instance):
+    d = instance.__dict__
+    if d.get('id') is None or any(d.get(f) is None for f in ('user_id', 'date', 'status')):
+        return None
+    return d['user_id'], d['date'], d['status'] == COMPLAINT_OPEN
+
+
+def on_comment_loaded(sender, instance, **kwargs):
+    instance._stats_state = _comment_state(instance)
+
+
+def on_comment_saved(sender, instance, created, raw=False, **kwargs):
+    old, new = getattr(instance, '_stats_state', None), _comment_state(instance)
+    instance._stats_state = new
+    if raw or new is None or old == new or (old is None and not created):
+        return
+    delta = Delta()
+    if old is not None:
+        delta.comment(*old[:3], old_status=old[3])
+    delta.comment(*new[:3], new_status=new[3])
+    delta.apply()
+
+
+def on_comment_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_stats_state', None)
+    if old is not None:
+        delta = Delta()
+        delta.comment(*old[:3], old_status=old[3])
+        delta.apply()
+
+
+def on_complaint_loaded(sender, instance, **kwargs):
+    instance._stats_state = _complaint_state(instance)
+
+
+def on_complaint_saved(sender, instance, created, raw=False, **kwargs):
+    old, new = getattr(instance, '_stats_state', None), _complaint_state(instance)
+    instance._stats_state = new
+    if raw or new is None or old == new or (old is None and not created):
+        return
+    delta = Delta()
+    if old is not None:
+        delta.complaint(old[0], old[1], was_open=old[2], is_open=False)
+    delta.complaint(new[0], new[1], was_open=False, is_open=new[2])
+    delta.apply()
+
+
+def on_complaint_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_stats_state', None)
+    if old is not None:
+        delta = Delta()
+        delta.complaint(old[0], old[1], was_open=old[2], is_open=False)
+        delta.apply()
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_init, post_save
+    post_init.connect(on_comment_loaded, sender=Comment, dispatch_uid='stats_comment_loaded')
+    post_save.connect(on_comment_saved, sender=Comment, dispatch_uid='stats_comment_saved')
+    post_delete.connect(on_comment_deleted, sender=Comment, dispatch_uid='stats_comment_deleted')
+    post_init.connect(on_complaint_loaded, sender=Complaint, dispatch_uid='stats_complaint_loaded')
+    post_save.connect(on_complaint_saved, sender=Complaint, dispatch_uid='stats_complaint_saved')
+    post_delete.connect(on_complaint_deleted, sender=Complaint, dispatch_uid='stats_complaint_deleted')
@@ -0,0 +1,157 @@
+"""
+Signed access tokens and a bounded profile cache.
+
+``userlogin`` and ``signup_post`` hand out a token: the login id, profile id,
+login type and a fingerprint of the login's password hash, timestamped and
+HMAC-signed with SECRET_KEY (django.core.signing). Clients send it back as
+``Authorization: Bearer <token>``. TokenAuthMiddleware checks the signature and
+age (AUTH_TOKEN_MAX_AGE) and sets ``request.identity``.
+
+A token is also checked against the profile it names, read through
+``ProfileCache``: a per-process LRU of UserProfile rows (with their Login)
+keyed by login id (PROFILE_CACHE_MAX_ENTRIES, expiring after
+PROFILE_CACHE_TTL_SECONDS), so most requests need no query. Changing the
+password revokes every token issued before, and tokens of deleted profiles
+stop working. Saving a login or saving or deleting a profile evicts it in this
+process; other workers see the change after the TTL. Changing SECRET_KEY (or
+TOKEN_SALT) still invalidates all tokens at once.
+
+While older app builds still send a raw ``lid`` (AUTH_ALLOW_LEGACY_LID),
+``get_identity`` resolves it through the same cache.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Login, UserProfile
+
+TOKEN_SALT = 'myapp.tokens'
+
+Identity = namedtuple('Identity', 'login_id profile_id type')
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def _password_fingerprint(password_hash: str) -> str:
+    return salted_hmac(TOKEN_SALT, password_hash or '').hexdigest()[:16]
+
+
+def issue_token(login_id: int, profile_id: int, login_type: str, password_hash: str = None) -> str:
+    """A signed token for the login; ``password_hash`` is looked up when not given."""
+    if password_hash is None:
+        password_hash = Login.objects.filter(id=login_id).values_list('password', flat=True).first()
+    fingerprint = _password_fingerprint(password_hash)
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(f"{login_id}:{profile_id}:{login_type}:{fingerprint}")
+
+
+def verify_token(token: str, max_age=None):
+    """
+    The Identity a token was issued for, or None if it is forged, malformed,
+    expired, or revoked (password changed, profile deleted).
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'AUTH_TOKEN_MAX_AGE', 7 * 86400)
+    try:
+        login_id, profile_id, login_type, fingerprint = (
+            signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age).split(':'))
+        identity = Identity(int(login_id), int(profile_id), login_type)
+    except (signing.BadSignature, ValueError):
+        return None
+    profile = get_profile_cache().get(identity.login_id)
+    if (profile is None or profile.id != identity.profile_id
+            or not constant_time_compare(fingerprint, _password_fingerprint(profile.login.password))):
+        return None
+    return identity
+
+
+def bearer_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+class ProfileCache:
+    """Thread-safe LRU of UserProfile objects (with their Login) keyed by login id."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()     # login id -> (expires, profile)
+
+    def get(self, login_id):
+        """The profile of ``login_id`` (one query on a miss), or None if there is none."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(login_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(login_id)
+                return entry[1]
+        profile = UserProfile.objects.select_related('login').filter(login_id=login_id).first()
+        if profile is not None:
+            with self._lock:
+                self._entries[login_id] = (now + self.ttl, profile)
+                self._entries.move_to_end(login_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, login_id):
+        with self._lock:
+            self._entries.pop(login_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_profile_cache() -> ProfileCache:
+    """Process-wide profile cache built from settings."""
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = ProfileCache(getattr(settings, 'PROFILE_CACHE_MAX_ENTRIES', 10000),
+                                         getattr(settings, 'PROFILE_CACHE_TTL_SECONDS', 60))
+    return _profiles
+
+
+def get_identity(request):
+    """
+    Who is calling: from the bearer token (set by TokenAuthMiddleware, or
+    verified here when the middleware did not run), else from a legacy ``lid``
+    form field. None if neither identifies a user.
+    """
+    if getattr(request, 'identity', None) is not None:
+        return request.identity
+    token = bearer_token(request)
+    if token:
+        request.identity = verify_token(token)
+    elif getattr(settings, 'AUTH_ALLOW_LEGACY_LID', True) and request.POST.get('lid', '').isdigit():
+        profile = get_profile_cache().get(int(request.POST['lid']))
+        request.identity = Identity(profile.login_id, profile.id, 'user') if profile else None
+    else:
+        request.identity = None
+    return request.identity
+
+
+def on_profile_changed(sender, instance, **kwargs):
+    get_profile_cache().invalidate(instance.login_id)
+
+
+def on_login_changed(sender, instance, **kwargs):
+    # a new password hash revokes the login's tokens
+    get_profile_cache().invalidate(instance.id)
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+    post_save.connect(on_profile_changed, sender=UserProfile, dispatch_uid='profile_cache_saved')
+    post_delete.connect(on_profile_changed, sender=UserProfile, dispatch_uid='profile_cache_deleted')
+    post_save.connect(on_login_changed, sender=Login, dispatch_uid='profile_cache_login_saved')
+    post_delete.connect(on_login_changed, sender=Login, dispatch_uid='profile_cache_login_deleted')
@@ -1,56 +1,347 @@
 # train_model.py
-import pandas as pd
-import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from sklearn.model_selection import train_test_split
+"""
+Train the Bi-LSTM cyberbullying classifier and write the serving artifact.
+
+    python backend/myapp/train_model.py
+    python backend/myapp/train_model.py --data tweets.csv --workers 8 --epochs 5
+
+The pipeline has three stages:
+
+1. The CSV is read in chunks. Each chunk is cleaned with the same ``clean_text``
+   the server uses, then counted and tokenized in a process pool, one chunk
+   per worker.
+2. The padded int32 sequences and labels are written as ``.npy`` shards under
+   ``--cache-dir``. The directory is keyed by a hash of the data file, the
+   vocabulary and the preprocessing settings. A re-run on the same data skips
+   straight to training, and the shards are memory-mapped rather than loaded.
+3. Training reads a ``tf.data`` stream over the shards. Rows are trimmed to
+   their real length, grouped by ``bucket_by_sequence_length`` (the Embedding
+   masks padding), and prefetched. The result is a single ``.npz`` file that
+   holds the weights, the tokenizer and a version string, and the registry
+   loads it directly.
+"""
+
+import argparse
+import hashlib
 import json
 import os
+import shutil
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Make `myapp` importable when run as a script from the repository root.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from myapp.ml.bucketing import DEFAULT_BUCKETS, bucket_bounds  # noqa: E402
+from myapp.ml.numpy_engine import export_weights  # noqa: E402
+from myapp.ml.preprocessing import TextVectorizer  # noqa: E402
+
+CACHE_FORMAT = 1
+
+_worker_vectorizer = None
+
+
+# ---------------------------------------------------------------------------
+# 1. Chunked, parallel preprocessing
+# ---------------------------------------------------------------------------
+
+def file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_chunks(args):
+    """Yield (texts, labels) per CSV chunk; label 1 = bullying."""
+    import pandas as pd
+    for chunk in pd.read_csv(args.data, usecols=[args.text_column, args.label_column],
+                             chunksize=args.chunk_size):
+        texts = chunk[args.text_column].fillna('').astype(str).tolist()
+        labels = (chunk[args.label_column] != args.negative_label).to_numpy(dtype=np.int8)
+        yield texts, labels
+
+
+def ordered_map(pool, fn, items, window: int):
+    """Like ``pool.map`` but keeps at most ``window`` chunks in flight (bounded memory)."""
+    if pool is None:
+        yield from map(fn, items)
+        return
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _count_words(texts):
+    """Per-chunk word and document frequencies, in first-seen order."""
+    counter = TextVectorizer({})
+    word_counts, word_docs = Counter(), Counter()
+    for text in texts:
+        words = counter.words(text)
+        word_counts.update(words)
+        word_docs.update(set(words))
+    return word_counts, word_docs, len(texts)
+
+
+def _init_encoder(vectorizer):
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+
+
+def _encode(job):
+    texts, maxlen = job
+    return _worker_vectorizer.to_matrix(texts, maxlen)
+
+
+def fit_vocabulary(args, pool):
+    """Stream the dataset once to build a Tokenizer-identical vocabulary."""
+    word_counts, word_docs, documents = Counter(), Counter(), 0
+    texts = (texts for texts, _ in read_chunks(args))
+    for counts, docs, n in ordered_map(pool, _count_words, texts, args.window):
+        word_counts.update(counts)   # merged in chunk order, so first-seen order holds
+        word_docs.update(docs)
+        documents += n
+    vectorizer = TextVectorizer.from_counts(word_counts, num_words=args.vocab_size, oov_token=args.oov_token)
+    return vectorizer, vectorizer.to_json(word_counts, word_docs, documents)
+
+
+def cache_key(args, data_digest: str) -> str:
+    """Hash of everything the shards depend on: data, vocabulary and preprocessing."""
+    vocabulary = file_digest(args.tokenizer) if args.tokenizer else {
+        'vocab_size': args.vocab_size, 'oov_token': args.oov_token}
+    spec = {
+        'format': CACHE_FORMAT, 'data': data_digest, 'vocabulary': vocabulary, 'maxlen': args.maxlen,
+        'columns': [args.text_column, args.label_column], 'negative_label': args.negative_label,
+    }
+    return hashlib.blake2b(json.dumps(spec, sort_keys=True).encode(), digest_size=12).hexdigest()
+
+
+def build_shards(args) -> str:
+    """
+    Make sure the shard cache for this data/vocabulary exists and return its
+    directory. Shards are written to a temporary directory that is renamed
+    into place at the end, so an interrupted run never leaves a half cache.
+    """
+    data_digest = file_digest(args.data)
+    key = cache_key(args, data_digest)
+    final_dir = os.path.join(args.cache_dir, key)
+    if os.path.exists(os.path.join(final_dir, 'manifest.json')):
+        print(f"Using cached shards {final_dir}")
+        return final_dir
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    work_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    started = time.perf_counter()
+
+    pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        if args.tokenizer:
+            with open(args.tokenizer, 'r', encoding='utf-8') as f:
+                tokenizer_json = f.read()
+            vectorizer = TextVectorizer.from_json(tokenizer_json)
+        else:
+            vectorizer, tokenizer_json = fit_vocabulary(args, pool)
+        with open(os.path.join(work_dir, 'tokenizer.json'), 'w', encoding='utf-8') as f:
+            f.write(tokenizer_json)
+
+        if pool is not None:
+            pool.shutdown()
+            pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_encoder,
+                                       initargs=(vectorizer,))
+        else:
+            _init_encoder(vectorizer)
+
+        chunks = read_chunks(args)
+        labels_queue = deque()
+
+        def jobs():
+            for texts, labels in chunks:
+                labels_queue.append(labels)
+                yield texts, args.maxlen
+
+        shards = []
+        for i, matrix in enumerate(ordered_map(pool, _encode, jobs(), args.window)):
+            name = f"{i:05d}"
+            np.save(os.path.join(work_dir, f"X-{name}.npy"), matrix)
+            np.save(os.path.join(work_dir, f"y-{name}.npy"), labels_queue.popleft())
+            shards.append({'name': name, 'rows': len(matrix)})
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    manifest = {
+        'format': CACHE_FORMAT, 'key': key, 'data': data_digest, 'maxlen': args.maxlen,
+        'rows': sum(s['rows'] for s in shards), 'shards': shards,
+    }
+    with open(os.path.join(work_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(work_dir, final_dir)
+    print(f"Wrote {manifest['rows']} rows in {len(shards)} shards to {final_dir} "
+          f"({time.perf_counter() - started:.1f}s)")
+    return final_dir
+
+
+def load_shards(shard_dir: str):
+    """(manifest, [(X, y)]) with X memory-mapped."""
+    with open(os.path.join(shard_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    shards = [
+        (np.load(os.path.join(shard_dir, f"X-{s['name']}.npy"), mmap_mode='r'),
+         np.load(os.path.join(shard_dir, f"y-{s['name']}.npy")))
+        for s in manifest['shards']
+    ]
+    return manifest, shards
+
+
+# ---------------------------------------------------------------------------
+# 2. tf.data input pipeline
+# ---------------------------------------------------------------------------
+
+def split_masks(shards, val_split: float, seed: int):
+    """Per-shard boolean masks selecting the validation rows (fixed for a seed)."""
+    rng = np.random.default_rng(seed)
+    return [rng.random(len(y)) < val_split for _, y in shards]
+
+
+def iter_rows(shards, masks, validation: bool, shuffle_seed=None):
+    """Yield (ids trimmed to their length, label) for one side of the split."""
+    order = np.arange(len(shards))
+    if shuffle_seed is not None:
+        np.random.default_rng(shuffle_seed).shuffle(order)
+    for s in order:
+        X, y = shards[s]
+        rows = np.flatnonzero(masks[s] == validation)
+        lengths = np.count_nonzero(X[rows], axis=1) if len(rows) else rows
+        for row, length in zip(rows, lengths):
+            # keep at least one (masked) timestep so empty comments still form a batch
+            yield np.asarray(X[row, :max(int(length), 1)]), np.float32(y[row])
+
+
+def make_dataset(shards, masks, validation: bool, args, epoch_seed=None):
+    import tensorflow as tf
+
+    def generator():
+        return iter_rows(shards, masks, validation, shuffle_seed=epoch_seed)
+
+    ds = tf.data.Dataset.from_generator(generator, output_signature=(
+        tf.TensorSpec(shape=(None,), dtype=tf.int32), tf.TensorSpec(shape=(), dtype=tf.float32)))
+    if not validation:
+        ds = ds.shuffle(args.shuffle_buffer, seed=args.seed, reshuffle_each_iteration=True)
+    # bucket i holds lengths <= bounds[i]; padding inside a batch goes to its longest row
+    bounds = bucket_bounds(args.buckets, args.maxlen)
+    ds = ds.bucket_by_sequence_length(
+        lambda ids, label: tf.shape(ids)[0],
+        bucket_boundaries=[b + 1 for b in bounds[:-1]],
+        bucket_batch_sizes=[args.batch_size] * len(bounds),
+    )
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(vocab_size: int):
+    import tensorflow as tf
+    return tf.keras.Sequential([
+        tf.keras.Input(shape=(None,), dtype='int32'),
+        # mask_zero: padding does not affect the output, so inference can skip it
+        tf.keras.layers.Embedding(vocab_size, 64, mask_zero=True),
+        tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(64, dropout=0.2, recurrent_dropout=0.2)),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
 
-# 1. Load your dataset
-df = pd.read_csv('backend/static/cyberbullying_tweets.csv')
-texts = df['tweet_text'].values
-labels = (df['cyberbullying_type'] != 'not_cyberbullying').astype(int).values  # 1 = bullying
 
-# 2. Preprocess
-def clean_text(text):
-    import re
-    text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
-    return text
+# ---------------------------------------------------------------------------
+# 3. Train and export
+# ---------------------------------------------------------------------------
 
-texts = [clean_text(t) for t in texts]
+def train(args):
+    shard_dir = build_shards(args)
+    manifest, shards = load_shards(shard_dir)
+    with open(os.path.join(shard_dir, 'tokenizer.json'), 'r', encoding='utf-8') as f:
+        tokenizer_json = f.read()
+    vectorizer = TextVectorizer.from_json(tokenizer_json)
+    vocab_size = vectorizer.num_words or len(vectorizer.word_index) + 1
 
-# 3. Tokenize
-vocab_size = 2000
-tokenizer = Tokenizer(num_words=vocab_size, oov_token="<OOV>")
-tokenizer.fit_on_texts(texts)
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(args.seed)
+    masks = split_masks(shards, args.val_split, args.seed)
+    train_ds = make_dataset(shards, masks, validation=False, args=args)
+    val_ds = make_dataset(shards, masks, validation=True, args=args)
 
-# Save tokenizer
-with open('backend/myapp/tokenizer.json', 'w') as f:
-    json.dump(tokenizer.to_json(), f)
+    model = build_model(vocab_size)
+    model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    history = model.fit(train_ds, validation_data=val_ds, epochs=args.epochs)
+    metrics = {k: float(v[-1]) for k, v in history.history.items()}
 
-sequences = tokenizer.texts_to_sequences(texts)
-padded = pad_sequences(sequences, maxlen=100, padding='post', truncating='post')
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{manifest['key'][:8]}"
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    tmp = f"{args.out}.tmp-{os.getpid()}.npz"
+    export_weights(model, tmp, extra_meta={
+        'version': version,
+        'maxlen': args.maxlen,
+        'tokenizer': tokenizer_json,
+        'data': manifest['data'],
+        'rows': manifest['rows'],
+        # lets myapp.ml.quantize find the same held-out split
+        'cache_key': manifest['key'],
+        'val_split': args.val_split,
+        'seed': args.seed,
+        'metrics': metrics,
+    })
+    os.replace(tmp, args.out)
+    print(f"Model {version} saved to {args.out} ({metrics})")
+    return args.out
 
-# 4. Split data
-X_train, X_test, y_train, y_test = train_test_split(padded, labels, test_size=0.2, random_state=42)
 
-# 5. Build Bi-LSTM Model
-model = tf.keras.Sequential([
-    tf.keras.layers.Embedding(vocab_size, 64, input_length=100),
-    tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(64, dropout=0.2, recurrent_dropout=0.2)),
-    tf.keras.layers.Dense(64, activation='relu'),
-    tf.keras.layers.Dropout(0.2),
-    tf.keras.layers.Dense(1, activation='sigmoid')
-])
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=os.path.join(BACKEND_DIR, 'static', 'cyberbullying_tweets.csv'))
+    parser.add_argument('--text-column', default='tweet_text')
+    parser.add_argument('--label-column', default='cyberbullying_type')
+    parser.add_argument('--negative-label', default='not_cyberbullying',
+                        help="label value meaning 'not bullying'; every other value is bullying")
+    parser.add_argument('--tokenizer', help="reuse this tokenizer.json instead of fitting a vocabulary")
+    parser.add_argument('--vocab-size', type=int, default=2000)
+    parser.add_argument('--oov-token', default='<OOV>')
+    parser.add_argument('--maxlen', type=int, default=100)
+    parser.add_argument('--chunk-size', type=int, default=20000, help="CSV rows per chunk / shard")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="preprocessing processes (1 = in-process)")
+    parser.add_argument('--cache-dir', default=os.path.join(BACKEND_DIR, '.train_cache'))
+    parser.add_argument('--buckets', default=','.join(map(str, DEFAULT_BUCKETS)),
+                        help="comma-separated sequence length buckets")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--shuffle-buffer', type=int, default=10000)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--val-split', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default=os.path.join(BACKEND_DIR, 'myapp', 'models', 'cyberbullying_model.npz'))
+    parser.add_argument('--prepare-only', action='store_true', help="build the shard cache and stop")
+    args = parser.parse_args(argv)
+    args.buckets = tuple(int(b) for b in args.buckets.split(',') if b)
+    args.window = max(2 * args.workers, 2)
+    return args
 
-model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
 
-# 6. Train
-model.fit(X_train, y_train, epochs=10, validation_data=(X_test, y_test), batch_size=32)
+def main(argv=None):
+    args = parse_args(argv)
+    if args.prepare_only:
+        build_shards(args)
+    else:
+        train(args)
 
-# 7. Save the trained model weights
-model.save_weights('backend/myapp/cyberbullying-bdlstm.h5')
 
-print("Model trained and saved as cyberbullying-bdlstm.h5")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,11 @@
 URL configuration for the 'myapp' application.
 
 All routes under /myapp/ are defined here:
-- Admin Web Interface (HTML)
 - Flutter Mobile API (JSON)
-- AI Model Endpoints
-- File Uploads (media)
+- AI Model, moderation and monitoring endpoints
+
+The admin site is Django's own (/admin/); /metrics and, in DEBUG, /media/
+are routed in cyber/urls.py.
 """
 
 from django.urls import path
@@ -15,47 +16,30 @@ app_name = 'myapp'
 
 urlpatterns = [
     # ===================================================================
-    # 1. ADMIN WEB INTERFACE (HTML Templates)
-    # ===================================================================
-    path('login/', views.login, name='login'),
-    path('login_post/', views.login_post, name='login_post'),
-    path('logout/', views.logout, name='logout'),
-    path('index/', views.index, name='index'),
-    path('viewuser/', views.viewuser, name='viewuser'),
-    path('viewcomp/', views.viewcomp, name='viewcomp'),
-    path('view_post/', views.view_post, name='view_post'),
-    path('changepass/', views.changepass, name='changepass'),
-    path('changepass_post/', views.changepass_post, name='changepass_post'),
-    path('reply/<int:id>/', views.reply, name='reply'),
-    path('block_user/<int:id>/', views.block_user, name='block_user'),
-    path('unblock_user/<int:id>/', views.unblock_user, name='unblock_user'),
-
-    # ===================================================================
-    # 2. FLUTTER MOBILE APP API (JSON Responses)
+    # 1. FLUTTER MOBILE APP API (JSON Responses)
     # ===================================================================
-    path('register/', views.register, name='register'),
+    path('register/', views.signup_post, name='register'),
     path('userlogin/', views.userlogin, name='userlogin'),
-    path('viewprofile/', views.viewprofile, name='viewprofile'),
-    path('editprofile/', views.editprofile, name='editprofile'),
-    path('add_post/', views.add_post, name='add_post'),
-    path('view_post_user/', views.view_post_user, name='view_post_user'),
-    path('view_comments/<int:id>/', views.view_comments, name='view_comments'),
+    path('viewprofile/', views.user_viewprofile, name='viewprofile'),
+    path('editprofile/', views.user_editprofile, name='editprofile'),
+    path('change_password/', views.userchangepass, name='change_password'),
+    path('add_post/', views.useraddpost, name='add_post'),
+    path('view_post_user/', views.view_ownpost, name='view_post_user'),
+    path('viewpostothers/', views.viewpostothers, name='viewpostothers'),
+    path('home_feed/', views.home_feed, name='home_feed'),
     path('add_comment/', views.add_comment, name='add_comment'),
-    path('send_complaint/', views.send_complaint, name='send_complaint'),
-    path('view_reply/', views.view_reply, name='view_reply'),
-    path('change_password/', views.change_password, name='change_password'),
-    path('view_friends/', views.view_friends, name='view_friends'),
-    path('view_friend_requests/', views.view_friend_requests, name='view_friend_requests'),
-    path('send_friend_request/', views.send_friend_request, name='send_friend_request'),
-    path('accept_friend_request/<int:id>/', views.accept_friend_request, name='accept_friend_request'),
-    path('reject_friend_request/<int:id>/', views.reject_friend_request, name='reject_friend_request'),
-    path('chat_view/<int:id>/', views.chat_view, name='chat_view'),
+    path('comment_status/', views.comment_status, name='comment_status'),
     path('chat_send/', views.chat_send, name='chat_send'),
+    path('chat_view_and/', views.chat_view_and, name='chat_view_and'),
+    path('chat_poll/', views.chat_poll, name='chat_poll'),
 
     # ===================================================================
-    # 3. AI & UTILITY ENDPOINTS
+    # 2. AI, MODERATION & UTILITY ENDPOINTS
     # ===================================================================
     path('predict_cyberbullying/', views.predict_cyberbullying, name='predict_cyberbullying'),
-    path('face_login/', views.face_login, name='face_login'),
-    path('imei_login/', views.imei_login, name='imei_login'),
-]
\ No newline at end of file
+    path('ready/', views.model_ready, name='ready'),
+    path('model_status/', views.model_status, name='model_status'),
+    path('cache_stats/', views.cache_stats, name='cache_stats'),
+    path('moderation_stats/', views.moderation_stats, name='moderation_stats'),
+    path('offender_events/', views.offender_events, name='offender_events'),
+]
@@ -1,103 +1,206 @@
-import os
-import base64
 import json
+import hashlib
 import logging
+import math
+import time
 
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
+from django.views.static import serve
 
 from django.contrib.auth.hashers import make_password, check_password
 
 from .models import Login, UserProfile, Post, Comment, Complaint, FriendRequest, Chat
+from .ml.registry import Decision, get_registry
+from . import feed, media, metrics, moderation, offenders, profiles, stats, tokens
+from .chat_hub import get_hub, poll_slot
 
-# ML imports (optional) -- load only if available
-ML_MODEL = None
-TOKENIZER = None
-MAX_SEQ_LEN = 100
+# The classifier is loaded lazily by the model registry (see myapp/ml/registry.py):
+# in a background warm-up thread under wsgi.py, or on first use elsewhere.
 
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import load_model
-    from tensorflow.keras.preprocessing.sequence import pad_sequences
-    from tensorflow.keras.preprocessing.text import tokenizer_from_json
 
-    # model/tokenizer paths (place your artifacts here)
-    MODEL_DIR = os.path.join(settings.BASE_DIR, 'myapp', 'models')
-    MODEL_PATH = os.path.join(MODEL_DIR, 'cyberbullying_model')  # saved model directory or file
-    TOKENIZER_PATH = os.path.join(MODEL_DIR, 'tokenizer.json')
+def _moderate(text: str) -> Decision:
+    """
+    Classify one comment and record which stage (lexicon, cache, model or
+    fallback) decided it.
+    While the model is still loading (or if its artifacts are missing) this
+    waits at most ML_LOAD_WAIT_SECONDS and then returns ML_FALLBACK_STATUS.
+    """
+    registry = get_registry()
+    if not registry.wait_ready(getattr(settings, 'ML_LOAD_WAIT_SECONDS', 0)):
+        return Decision(getattr(settings, 'ML_FALLBACK_STATUS', "Not Bullying"), None, 'fallback')
+    return registry.classify(text)
 
-    if os.path.exists(MODEL_PATH):
-        try:
-            ML_MODEL = load_model(MODEL_PATH)
-            logging.info("ML model loaded from %s", MODEL_PATH)
-        except Exception as e:
-            logging.warning("Could not load full model from %s: %s", MODEL_PATH, e)
-            ML_MODEL = None
 
-    if os.path.exists(TOKENIZER_PATH):
-        with open(TOKENIZER_PATH, 'r', encoding='utf-8') as f:
-            tok_json = f.read()
-            TOKENIZER = tokenizer_from_json(tok_json)
-            logging.info("Tokenizer loaded from %s", TOKENIZER_PATH)
-except Exception as e:
-    logging.warning("TensorFlow or tokenizer not available: %s", e)
-    ML_MODEL = None
-    TOKENIZER = None
+def _predict_bullying(text: str) -> str:
+    """
+    Returns "Bullying Words" or "Not Bullying".
+    """
+    return _moderate(text).label
+
 
+def _require_identity(request):
+    """(Identity, None) for the calling user, or (None, error response)."""
+    identity = tokens.get_identity(request)
+    if identity is not None:
+        return identity, None
+    if tokens.bearer_token(request):
+        return None, JsonResponse({'status': 'error', 'message': 'invalid or expired token'}, status=401)
+    return None, JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
 
-def _save_base64_image(base64_str: str, subdir: str = '') -> str:
+
+def _token_fields(login: Login, profile_id: int) -> dict:
+    return {'token': tokens.issue_token(login.id, profile_id, login.type, login.password),
+            'expires_in': getattr(settings, 'AUTH_TOKEN_MAX_AGE', 7 * 86400)}
+
+
+def _monitoring_forbidden(request):
     """
-    Save a base64-encoded image to MEDIA_ROOT and return the relative URL path (e.g., /media/xxx.jpg).
+    None if the caller may read the monitoring endpoints (a METRICS_ALLOWED_IPS
+    address, as for /metrics, or a staff session), else a 403 response.
     """
-    if not base64_str:
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
         return None
-    try:
-        # normalize: if data:<mime>;base64,xxxxx
-        if ',' in base64_str:
-            base64_str = base64_str.split(',', 1)[1]
-
-        data = base64.b64decode(base64_str)
-    except Exception as e:
-        logging.exception("Invalid base64 image data")
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
         return None
+    return JsonResponse({'status': 'error', 'message': 'forbidden'}, status=403)
 
-    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
-    filename = f"{int(__import__('time').time() * 1000)}.jpg"
-    if subdir:
-        dirpath = os.path.join(settings.MEDIA_ROOT, subdir)
-        os.makedirs(dirpath, exist_ok=True)
-        filepath = os.path.join(dirpath, filename)
-        media_url = f"{settings.MEDIA_URL}{subdir}/{filename}"
-    else:
-        filepath = os.path.join(settings.MEDIA_ROOT, filename)
-        media_url = f"{settings.MEDIA_URL}{filename}"
 
-    with open(filepath, "wb") as fh:
-        fh.write(data)
+def model_ready(request):
+    """
+    Readiness probe for the load balancer: 200 once the model is loaded and
+    warmed, 503 while it is loading or unavailable.
+    """
+    registry = get_registry()
+    registry.start_warmup()
+    ready = registry.ready
+    return JsonResponse({'status': 'ready' if ready else 'not ready', 'ready': ready, 'version': registry.version},
+                        status=200 if ready else 503)
 
-    return media_url
 
+def model_status(request):
+    """Model registry details (load errors, reloads, cache, shadow scoring); monitoring clients only."""
+    forbidden = _monitoring_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    return JsonResponse({'status': 'ok', **get_registry().status()})
 
-def _predict_bullying(text: str) -> str:
+
+NDJSON = 'application/x-ndjson'
+
+
+def _parse_texts(request):
     """
-    Returns "Bullying Words" or "Not Bullying".
-    If ML_MODEL or TOKENIZER are missing, default to "Not Bullying".
+    Texts to score from a JSON array (of strings or {"text": ...} objects),
+    {"texts": [...]}, {"text": "..."}, an NDJSON body (one string or object
+    per line) or a form ``text`` field. ValueError with a message otherwise.
     """
-    if not ML_MODEL or not TOKENIZER:
-        return "Not Bullying"
+    content_type = request.content_type or ''
+    if content_type == NDJSON:
+        items = [json.loads(line) for line in request.body.decode('utf-8').splitlines() if line.strip()]
+    elif content_type == 'application/json':
+        items = json.loads(request.body.decode('utf-8') or 'null')
+        if isinstance(items, dict):
+            items = items['texts'] if 'texts' in items else [items]
+    elif 'text' in request.POST:
+        items = [request.POST['text']]
+    else:
+        raise ValueError("send a JSON array, NDJSON or a text field")
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array of texts")
+    texts = []
+    for i, item in enumerate(items):
+        text = item.get('text') if isinstance(item, dict) else item
+        if not isinstance(text, str):
+            raise ValueError(f"item {i} is not a text")
+        texts.append(text)
+    return texts
+
+
+def _decision_dict(index: int, decision: Decision) -> dict:
+    return {'index': index, 'label': decision.label, 'score': decision.score, 'stage': decision.stage}
+
 
-    seq = TOKENIZER.texts_to_sequences([text])
-    padded = pad_sequences(seq, maxlen=MAX_SEQ_LEN, padding='post', truncating='post')
-    pred = ML_MODEL.predict(padded)
-    # pred shape depends on model; assume sigmoid single output
-    score = float(pred[0][0]) if hasattr(pred[0], '__len__') else float(pred[0])
-    return "Bullying Words" if score >= 0.5 else "Not Bullying"
+@csrf_exempt
+def predict_cyberbullying(request):
+    """
+    Score many texts in one call. The body is a JSON array or NDJSON (see
+    _parse_texts); results come back in input order with label, score and the
+    deciding stage. An NDJSON body or ``Accept: application/x-ndjson`` gets a
+    streamed NDJSON response, PREDICT_CHUNK_SIZE texts per model call, ending
+    with a summary line; otherwise one JSON object. Both report timings.
+    """
+    started = time.perf_counter()
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    max_bytes = getattr(settings, 'PREDICT_MAX_BYTES', 2 * 1024 * 1024)
+    max_texts = getattr(settings, 'PREDICT_MAX_TEXTS', 5000)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > max_bytes:
+        return JsonResponse({'status': 'error', 'message': f'body larger than {max_bytes} bytes'}, status=413)
+    try:
+        texts = _parse_texts(request)
+    except (ValueError, KeyError, UnicodeDecodeError) as exc:
+        return JsonResponse({'status': 'error', 'message': f'invalid body: {exc}'}, status=400)
+    if len(texts) > max_texts:
+        return JsonResponse({'status': 'error', 'message': f'at most {max_texts} texts per request'}, status=413)
+
+    registry = get_registry()
+    if not registry.wait_ready(getattr(settings, 'ML_LOAD_WAIT_SECONDS', 0)):
+        return JsonResponse({'status': 'error', 'message': 'model not ready'}, status=503)
+    parsed = time.perf_counter()
+    parse_ms = round((parsed - started) * 1000, 3)
+
+    stream = request.content_type == NDJSON or NDJSON in request.headers.get('Accept', '')
+    if not stream:
+        decisions = registry.classify_texts(texts) if texts else []
+        score_ms = round((time.perf_counter() - parsed) * 1000, 3)
+        total_ms = round((time.perf_counter() - started) * 1000, 3)
+        response = JsonResponse({
+            'status': 'ok',
+            'count': len(texts),
+            'results': [_decision_dict(i, d) for i, d in enumerate(decisions)],
+            'timing_ms': {'parse': parse_ms, 'score': score_ms, 'total': total_ms},
+        })
+        response['Server-Timing'] = f'parse;dur={parse_ms}, score;dur={score_ms}, total;dur={total_ms}'
+        return response
+
+    chunk_size = max(getattr(settings, 'PREDICT_CHUNK_SIZE', 256), 1)
+
+    def lines():
+        score_seconds = 0.0
+        for offset in range(0, len(texts), chunk_size):
+            chunk_started = time.perf_counter()
+            decisions = registry.classify_texts(texts[offset:offset + chunk_size])
+            score_seconds += time.perf_counter() - chunk_started
+            yield ''.join(json.dumps(_decision_dict(offset + i, d)) + '\n' for i, d in enumerate(decisions))
+        yield json.dumps({'status': 'ok', 'done': True, 'count': len(texts), 'timing_ms': {
+            'parse': parse_ms, 'score': round(score_seconds * 1000, 3),
+            'total': round((time.perf_counter() - started) * 1000, 3)}}) + '\n'
+
+    response = StreamingHttpResponse(lines(), content_type=NDJSON)
+    response['Server-Timing'] = f'parse;dur={parse_ms}'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @csrf_exempt
 def userlogin(request):
+    """
+    Checks the password and returns ``lid`` plus a signed ``token``. Send the
+    token as ``Authorization: Bearer <token>`` on later calls, and log in again
+    only after ``expires_in`` seconds.
+    """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
     username = request.POST.get('username') or request.POST.get('user') or ''
@@ -107,8 +210,9 @@ def userlogin(request):
     except Login.DoesNotExist:
         return JsonResponse({'status': 'not ok'})
     if check_password(password, log.password):
-        if log.type == 'user':
-            return JsonResponse({'status': 'ok', 'lid': str(log.id)})
+        profile_id = UserProfile.objects.filter(login=log).values_list('id', flat=True).first()
+        if log.type == 'user' and profile_id is not None:
+            return JsonResponse({'status': 'ok', 'lid': str(log.id), **_token_fields(log, profile_id)})
         else:
             return JsonResponse({'status': 'not ok'})
     else:
@@ -119,7 +223,8 @@ def userlogin(request):
 def signup_post(request):
     """
     Expected form-data:
-     - name, email, gender, phone, dob, place, district, state, pincode, photo (base64), password
+     - name, email, gender, phone, dob, place, district, state, pincode, password
+     - photo: multipart image file, or base64 string (older clients)
     """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
@@ -133,13 +238,14 @@ def signup_post(request):
     if Login.objects.filter(username=email).exists():
         return JsonResponse({'status': 'error', 'message': 'email already registered'}, status=400)
 
+    try:
+        photo = media.save_upload(request, 'photo', 'profile_photos')
+    except media.InvalidImage as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
     hashed = make_password(password)
     login = Login.objects.create(username=email, password=hashed, type='user')
 
-    # Save profile
-    image_base64 = request.POST.get('photo', '')
-    photo_url = _save_base64_image(image_base64, subdir='profile_photos') if image_base64 else None
-
     profile = UserProfile.objects.create(
         login=login,
         name=name,
@@ -151,50 +257,85 @@ def signup_post(request):
         district=request.POST.get('district', ''),
         state=request.POST.get('state', ''),
         pin=request.POST.get('pincode', ''),
-        photo=photo_url.replace(settings.MEDIA_URL, '') if photo_url else None
+        photo=photo
     )
 
-    return JsonResponse({'status': 'ok', 'lid': str(login.id)})
+    return JsonResponse({'status': 'ok', 'lid': str(login.id), **_token_fields(login, profile.id)})
 
 
 @csrf_exempt
 def user_viewprofile(request):
+    """The caller's profile; the serialized body is cached per login (myapp/profiles.py)."""
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
+    cache = profiles.get_json_cache()
+    body = cache.get(identity.login_id) if cache is not None else None
+    if body is None:
+        profile = UserProfile.objects.filter(login_id=identity.login_id).first()
+        if profile is None:
+            return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
+        body = profiles.render(profile)
+        if cache is not None:
+            cache.fill(identity.login_id, body)
+    return HttpResponse(body, content_type='application/json')
+
+
+def cache_stats(request):
+    """Hit/miss counters of the in-process caches."""
+    forbidden = _monitoring_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    cache = profiles.get_json_cache()
+    return JsonResponse({'status': 'ok', 'profile_json': cache.stats() if cache is not None else None,
+                         'predictions': get_registry().status().get('cache')})
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (myapp/metrics.py); local clients only."""
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return HttpResponse("metrics disabled\n", status=404, content_type='text/plain')
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponse("forbidden\n", status=403, content_type='text/plain')
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def moderation_stats(request):
+    """Moderation counters for the admin dashboard (myapp/stats.py)."""
+    forbidden = _monitoring_forbidden(request)
+    if forbidden is not None:
+        return forbidden
     try:
-        login = Login.objects.get(id=lid)
-        profile = login.profile
-    except Exception:
-        return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
+        days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        days = 7
+    return JsonResponse({'status': 'ok', **stats.dashboard(days)})
 
-    data = {
-        'status': 'ok',
-        'name': profile.name,
-        'gender': profile.gender,
-        'dob': profile.dob.isoformat() if profile.dob else '',
-        'email': profile.email,
-        'photo': profile.photo.url if getattr(profile.photo, 'url', None) else profile.photo or '',
-        'phone': profile.phone,
-        'place': profile.place,
-        'post': profile.post,
-        'pin': profile.pin,
-        'state': profile.state,
-        'district': profile.district,
-    }
-    return JsonResponse(data)
+
+def offender_events(request):
+    """Repeat-offender events for the admin block flow (myapp/offenders.py); ?since=<last id>."""
+    forbidden = _monitoring_forbidden(request)
+    if forbidden is not None:
+        return forbidden
+    since = request.GET.get('since', '0')
+    events = offenders.stored_events(int(since) if since.isdigit() else 0)
+    return JsonResponse({'status': 'ok', 'events': [event._asdict() for event in events]})
 
 
 @csrf_exempt
 def user_editprofile(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
     try:
-        login = Login.objects.get(id=lid)
-        profile = login.profile
-    except Exception:
+        profile = UserProfile.objects.select_related('login').get(id=identity.profile_id)
+    except UserProfile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
+    login = profile.login
 
     # Update fields
     profile.name = request.POST.get('name', profile.name)
@@ -213,14 +354,18 @@ def user_editprofile(request):
         except Exception:
             pass
 
-    image_b64 = request.POST.get('photo', '')
-    if image_b64 and len(image_b64) > 10:
-        photo_url = _save_base64_image(image_b64, subdir='profile_photos')
-        if photo_url:
-            # store path relative to MEDIA_ROOT; Django ImageField expects path relative to MEDIA_ROOT when assigned as string
-            profile.photo = photo_url.replace(settings.MEDIA_URL, '')
+    try:
+        photo = media.save_upload(request, 'photo', 'profile_photos')
+    except media.InvalidImage as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    if photo:
+        # ImageField takes a name relative to MEDIA_ROOT
+        profile.photo = photo
 
     profile.save()
+    cache = profiles.get_json_cache()
+    if cache is not None:
+        cache.refresh(login.id, profiles.render(profile))
     # update username on login if email changed
     if login.username != profile.email:
         login.username = profile.email
@@ -233,18 +378,20 @@ def user_editprofile(request):
 def userchangepass(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
     cpass = request.POST.get('cpass')
     confpass = request.POST.get('confpass')
-    try:
-        login = Login.objects.get(id=lid)
-    except Login.DoesNotExist:
-        return JsonResponse({'status': 'no'})
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
+    login = Login.objects.filter(id=identity.login_id).first()
+    if login is None:
+        return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
 
     if check_password(cpass, login.password):
         login.password = make_password(confpass)
         login.save()
-        return JsonResponse({'status': 'ok'})
+        # the new password revokes the caller's token too: hand out a fresh one
+        return JsonResponse({'status': 'ok', **_token_fields(login, identity.profile_id)})
     else:
         return JsonResponse({'status': 'no'})
 
@@ -253,22 +400,20 @@ def userchangepass(request):
 def useraddpost(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
     desc = request.POST.get('desc', '')
-    photo_b64 = request.POST.get('photo', '')
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
 
     try:
-        login = Login.objects.get(id=lid)
-        user = login.profile
-    except Exception:
-        return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
-
-    photo_url = _save_base64_image(photo_b64, subdir='post_photos') if photo_b64 else None
+        photo = media.save_upload(request, 'photo', 'post_photos')
+    except media.InvalidImage as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
     post = Post.objects.create(
         desc=desc,
-        photo=photo_url.replace(settings.MEDIA_URL, '') if photo_url else None,
-        user=user
+        photo=photo,
+        user_id=identity.profile_id
     )
 
     return JsonResponse({'status': 'ok', 'post_id': post.id})
@@ -277,101 +422,320 @@ def useraddpost(request):
 @csrf_exempt
 def add_comment(request):
     """
-    Expects: lid, postid, comment (text)
+    Expects: postid, comment (text), and a bearer token (or legacy lid)
     Uses ML model to mark comment as Bullying/Not Bullying when model exists.
+    With MODERATION_MODE = 'async' the comment is stored as "pending" instead
+    and the final verdict can be polled from comment_status.
     """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
     pid = request.POST.get('postid')
     comment_text = request.POST.get('comment', '')
 
-    if not (lid and pid and comment_text):
-        return JsonResponse({'status': 'error', 'message': 'lid, postid and comment required'}, status=400)
-    try:
-        login = Login.objects.get(id=lid)
-        user = login.profile
-        post = Post.objects.get(id=pid)
-    except Exception:
+    if not (pid and comment_text):
+        return JsonResponse({'status': 'error', 'message': 'postid and comment required'}, status=400)
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
+    if not str(pid).isdigit() or not Post.objects.filter(id=pid).exists():
         return JsonResponse({'status': 'error', 'message': 'invalid user or post'}, status=404)
-
-    status = _predict_bullying(comment_text)
+    retry_after = offenders.retry_after(identity.profile_id)
+    if retry_after:
+        return JsonResponse({'status': 'error', 'message': 'too many bullying comments, try again later',
+                             'retry_after': math.ceil(retry_after)}, status=429)
+
+    # async mode: save as pending now, the moderation workers classify it shortly
+    if moderation.is_async():
+        status, stage = moderation.PENDING, None
+    else:
+        status, _, stage = _moderate(comment_text)
     from datetime import date
-    comment_obj = Comment.objects.create(
-        user=user,
-        post=post,
-        comments=comment_text,
-        status=status,
-        date=date.today()
-    )
-    return JsonResponse({'status': 'ok', 'comment_id': comment_obj.id, 'bullying_status': status})
+    # the moderation counters are updated by a post_save signal; keep them in
+    # the same transaction as the comment
+    with transaction.atomic():
+        comment_obj = Comment.objects.create(
+            user_id=identity.profile_id,
+            post_id=int(pid),
+            comments=comment_text,
+            status=status,
+            date=date.today()
+        )
+    if status == moderation.PENDING:
+        moderation.notify_pending()
+    else:
+        offenders.record_verdicts([(identity.profile_id, status)])
+    return JsonResponse({'status': 'ok', 'comment_id': comment_obj.id, 'bullying_status': status,
+                         'moderation_stage': stage})
+
+
+@csrf_exempt
+def comment_status(request):
+    """
+    Expects: comment_id
+    Lets clients poll the moderation verdict of a comment posted in async mode.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    comment_id = request.POST.get('comment_id', '')
+    if not comment_id.isdigit():
+        return JsonResponse({'status': 'error', 'message': 'comment_id must be an integer'}, status=400)
+    status = Comment.objects.filter(id=comment_id).values_list('status', flat=True).first()
+    if status is None:
+        return JsonResponse({'status': 'error', 'message': 'comment not found'}, status=404)
+    return JsonResponse({
+        'status': 'ok',
+        'comment_id': int(comment_id),
+        'bullying_status': status,
+        'pending': status == moderation.PENDING,
+    })
 
 
 @csrf_exempt
 def view_ownpost(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
-    try:
-        login = Login.objects.get(id=lid)
-        user = login.profile
-    except Exception:
-        return JsonResponse({'status': 'error', 'message': 'user not found'}, status=404)
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
 
-    posts = user.posts.all().values('id', 'desc', 'date', 'photo')
+    posts = Post.objects.filter(user_id=identity.profile_id).values('id', 'desc', 'date', 'photo')
     data = []
     for p in posts:
         photo = p['photo']
         if photo:
             photo = settings.MEDIA_URL + photo
-        data.append({'id': p['id'], 'desc': p['desc'], 'date': str(p['date']), 'photo': photo})
+        data.append({'id': p['id'], 'desc': p['desc'], 'date': str(p['date']), 'photo': photo,
+                     **media.variant_urls(p['photo'])})
     return JsonResponse({'status': 'ok', 'data': data})
 
 
+def _feed_rows(profile_id, cursor: int, page_size: int):
+    """
+    Newest posts by everyone but ``profile_id``, older than ``cursor`` (a post id),
+    as value tuples. Keyset pagination: the query walks post_feed_idx and
+    stops after page_size rows, however deep the client has scrolled.
+    """
+    qs = Post.objects.exclude(user_id=profile_id) if profile_id else Post.objects.all()
+    if cursor:
+        qs = qs.filter(id__lt=cursor)
+    return list(qs.order_by('-id').values_list('id', 'photo', 'desc', 'date', 'user__name')[:page_size])
+
+
+def _post_dicts(rows):
+    """JSON-ready feed entries from (id, photo, desc, date, user__name) tuples."""
+    storage = Post._meta.get_field('photo').storage
+    return [{'id': pid, 'photo': storage.url(photo) if photo else '', **media.variant_urls(photo),
+             'desc': desc, 'date': str(date), 'name': name} for pid, photo, desc, date, name in rows]
+
+
+def _page_params(request):
+    """(cursor, page_size) from the POST body; ValueError if not integers."""
+    cursor = int(request.POST.get('cursor') or 0)
+    page_size = int(request.POST.get('page_size') or getattr(settings, 'FEED_PAGE_SIZE', 20))
+    return cursor, min(max(page_size, 1), getattr(settings, 'FEED_MAX_PAGE_SIZE', 100))
+
+
 @csrf_exempt
 def viewpostothers(request):
+    """
+    Feed of other users' posts, newest first, ``page_size`` at a time.
+
+    Pass the ``next_cursor`` of a response as ``cursor`` to get the next page.
+    The response carries an ETag computed from the page's rows; a client that
+    sends it back in If-None-Match gets 304 Not Modified, without the page
+    being serialized again, when nothing on it has changed.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    identity = tokens.get_identity(request)
+    try:
+        cursor, page_size = _page_params(request)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'cursor and page_size must be integers'}, status=400)
+
+    rows = _feed_rows(identity.profile_id if identity else None, cursor, page_size)
+    etag = '"%s"' % hashlib.blake2b(repr((page_size, rows)).encode(), digest_size=16).hexdigest()
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=304)
+    else:
+        out = _post_dicts(rows)
+        response = JsonResponse({'status': 'ok', 'data': out,
+                                 'next_cursor': out[-1]['id'] if len(out) == page_size else None})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@csrf_exempt
+def home_feed(request):
+    """
+    Home feed of the caller: their own and their friends' posts, newest first.
+
+    Same paging and response shape as viewpostothers. Post ids come from the
+    user's materialized feed (myapp/feed.py); one query hydrates the page.
+    """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    lid = request.POST.get('lid')
-    from django.db.models import Q
-    posts_qs = Post.objects.exclude(user__login__id=lid).select_related('user').order_by('-id')[:200]
-    out = []
-    for post in posts_qs:
-        photo = post.photo.url if getattr(post.photo, 'url', None) else (settings.MEDIA_URL + post.photo) if post.photo else ''
-        out.append({'id': post.id, 'photo': photo, 'desc': post.desc, 'date': str(post.date), 'name': post.user.name})
-    return JsonResponse({'status': 'ok', 'data': out})
+    try:
+        cursor, page_size = _page_params(request)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'cursor and page_size must be integers'}, status=400)
+    identity, failure = _require_identity(request)
+    if failure:
+        return failure
+
+    ids = feed.get_store().page(identity.profile_id, cursor, page_size)
+    rows = {row[0]: row for row in
+            Post.objects.filter(id__in=ids).values_list('id', 'photo', 'desc', 'date', 'user__name')}
+    out = _post_dicts(rows[i] for i in ids if i in rows)
+    return JsonResponse({'status': 'ok', 'data': out,
+                         'next_cursor': ids[-1] if len(ids) == page_size else None})
+
+
+def _chat_sender_failure(request, from_id: int):
+    """
+    None if the caller may act as login ``from_id`` in a chat, else the error
+    response. Token-authenticated callers only ever act as themselves; clients
+    without a token keep the old from_id behaviour.
+    """
+    identity = tokens.get_identity(request)
+    if identity is None:
+        if tokens.bearer_token(request):
+            return JsonResponse({'status': 'error', 'message': 'invalid or expired token'}, status=401)
+        return None
+    if identity.login_id != from_id:
+        return JsonResponse({'status': 'error', 'message': 'from_id is not the authenticated user'}, status=403)
+    return None
 
 
 @csrf_exempt
 def chat_send(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    from_id = request.POST.get('from_id')
-    to_id = request.POST.get('to_id')
+    try:
+        from_id = int(request.POST.get('from_id'))
+        to_id = int(request.POST.get('to_id'))
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'from_id and to_id must be integers'}, status=400)
+    failure = _chat_sender_failure(request, from_id)
+    if failure:
+        return failure
     msg = request.POST.get('message', '')
     try:
-        c = Chat.objects.create(FROMID_id=from_id, TOID_id=to_id, message=msg)
+        c = Chat.objects.create(from_login_id=from_id, to_login_id=to_id, message=msg)
+        # wake long-polling clients of both participants once the row is visible
+        hub = get_hub()
+        transaction.on_commit(lambda: (hub.notify(to_id), hub.notify(from_id)))
         return JsonResponse({'status': 'ok', 'chat_id': c.id})
     except Exception as e:
         logging.exception("Chat send error")
         return JsonResponse({'status': 'error', 'message': 'could not send'}, status=500)
 
 
+def _chat_params(request):
+    """(from_id, to_id, since_id, limit) from the POST body; ValueError if not integers."""
+    try:
+        return (int(request.POST.get('from_id')), int(request.POST.get('to_id')),
+                int(request.POST.get('since_id') or 0), int(request.POST.get('limit') or 0))
+    except (TypeError, ValueError):
+        raise ValueError('from_id, to_id, since_id and limit must be integers')
+
+
+def _chat_page(from_id: int, to_id: int, since_id: int, limit: int) -> dict:
+    """Messages of one conversation newer than since_id, as the chat endpoints return them."""
+    # one query: both directions of the conversation, each an index range on chat_conversation_idx
+    rows = (Chat.objects
+            .filter(Q(from_login_id=from_id, to_login_id=to_id) | Q(from_login_id=to_id, to_login_id=from_id),
+                    id__gt=since_id)
+            .order_by('id')
+            .values('id', 'from_login_id', 'to_login_id', 'message', 'date'))
+    if limit > 0:
+        rows = rows[:limit + 1]
+    data = [{'id': r['id'], 'from': r['from_login_id'], 'to': r['to_login_id'],
+             'msg': r['message'], 'date': str(r['date'])} for r in rows]
+    has_more = limit > 0 and len(data) > limit
+    if has_more:
+        data = data[:limit]
+    return {'status': 'ok', 'data': data, 'last_id': data[-1]['id'] if data else since_id, 'has_more': has_more}
+
+
 @csrf_exempt
 def chat_view_and(request):
+    """
+    Messages between from_id and to_id in id order. Polling clients pass the
+    last id they have as ``since_id`` (and optionally ``limit``) and get only
+    newer messages; ``last_id`` in the response is the next cursor.
+    """
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
-    from_id = request.POST.get('from_id')
-    to_id = request.POST.get('to_id')
-    data = []
     try:
-        data1 = Chat.objects.filter(from_login__id=from_id, to_login__id=to_id).order_by('id')
-        data2 = Chat.objects.filter(from_login__id=to_id, to_login__id=from_id).order_by('id')
-        # union
-        all_msgs = list(data1) + list(data2)
-        for res in sorted(all_msgs, key=lambda x: x.id):
-            data.append({'id': res.id, 'from': res.from_login.id, 'to': res.to_login.id, 'msg': res.message, 'date': str(res.date)})
-        return JsonResponse({'status': 'ok', 'data': data})
+        params = _chat_params(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    failure = _chat_sender_failure(request, params[0])
+    if failure:
+        return failure
+    try:
+        return JsonResponse(_chat_page(*params))
     except Exception:
         logging.exception("chat_view error")
         return JsonResponse({'status': 'error', 'message': 'error fetching chat'}, status=500)
+
+
+@csrf_exempt
+def chat_poll(request):
+    """
+    Long-poll form of chat_view_and: same parameters and response, but when
+    there is nothing newer than since_id the request waits (up to ``timeout``
+    seconds, capped by CHAT_LONG_POLL_TIMEOUT) for chat_send to store a
+    message for from_id, instead of returning an empty list right away.
+
+    Each waiting request holds a server thread, so this needs a threaded or
+    async server. Beyond CHAT_LONG_POLL_MAX_WAITERS concurrent waiters the
+    current page (usually empty) is returned without waiting.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=400)
+    try:
+        params = _chat_params(request)
+        max_timeout = getattr(settings, 'CHAT_LONG_POLL_TIMEOUT', 25)
+        timeout = min(float(request.POST.get('timeout') or max_timeout), max_timeout)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    from_id = params[0]
+    failure = _chat_sender_failure(request, from_id)
+    if failure:
+        return failure
+    hub = get_hub()
+    recheck = getattr(settings, 'CHAT_LONG_POLL_RECHECK_SECONDS', 5)
+    deadline = time.monotonic() + max(timeout, 0)
+    try:
+        with poll_slot() as waiting_allowed:
+            while True:
+                seen = hub.version(from_id)     # taken before the query, so nothing slips in between
+                page = _chat_page(*params)
+                remaining = deadline - time.monotonic()
+                if page['data'] or remaining <= 0 or not waiting_allowed:
+                    return JsonResponse(page)
+                # the re-check interval also picks up messages sent through other worker processes
+                hub.wait(from_id, seen, min(remaining, recheck))
+    except Exception:
+        logging.exception("chat_poll error")
+        return JsonResponse({'status': 'error', 'message': 'error fetching chat'}, status=500)
+
+
+def serve_media(request, path):
+    """
+    MEDIA_URL files for development (production serves MEDIA_ROOT directly,
+    see README_DEV.md). Content-addressed files get a long-lived immutable
+    Cache-Control. A variant that has not been generated yet is answered with
+    its original, cached only briefly.
+    """
+    source = media.variant_source(path)
+    if source and not default_storage.exists(path):
+        response = serve(request, source, document_root=settings.MEDIA_ROOT)
+        response['Cache-Control'] = 'public, max-age=60'
+        return response
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = media.cache_control(path)
+    return response